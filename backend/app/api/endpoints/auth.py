@@ -1,6 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 from app.models.database import get_db, Operator
 from app.models.schemas import Token
@@ -12,10 +14,12 @@ router = APIRouter()
 @router.post("/token", response_model=Token)
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    operator = db.query(Operator).filter(Operator.email == form_data.username).first()
-    if not operator or not verify_password(form_data.password, operator.password_hash):
+    result = await db.execute(select(Operator).where(Operator.email == form_data.username))
+    operator = result.scalars().first()
+    # bcrypt doğrulaması CPU yoğun; event loop'u bloklamasın
+    if not operator or not await run_in_threadpool(verify_password, form_data.password, operator.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
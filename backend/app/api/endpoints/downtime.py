@@ -0,0 +1,59 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import List
+from app.models.database import get_db, DowntimeReason as DowntimeReasonModel
+from app.models.schemas import DowntimeReason, DowntimeReasonUpdate
+from app.services.downtime_service import AUTO_CATEGORY
+from app.services.cache_service import result_cache
+from app.core.security import get_current_user
+
+router = APIRouter()
+
+@router.get("/downtime/", response_model=List[DowntimeReason])
+async def get_downtime_records(
+    machine_id: int = None,
+    open_only: bool = False,
+    unclassified: bool = False,
+    skip: int = 0,
+    limit: int = 100,
+    db: AsyncSession = Depends(get_db),
+    current_user: str = Depends(get_current_user)
+):
+    query = select(DowntimeReasonModel)
+    
+    if machine_id:
+        query = query.where(DowntimeReasonModel.machine_id == machine_id)
+    
+    if open_only:
+        query = query.where(DowntimeReasonModel.end_time.is_(None))
+    
+    # Otomatik algılanıp henüz sebep girilmemiş duruşlar
+    if unclassified:
+        query = query.where(DowntimeReasonModel.category == AUTO_CATEGORY)
+    
+    result = await db.execute(query.order_by(DowntimeReasonModel.start_time.desc()).offset(skip).limit(limit))
+    return result.scalars().all()
+
+@router.put("/downtime/{downtime_id}", response_model=DowntimeReason)
+async def update_downtime_reason(
+    downtime_id: int,
+    downtime_data: DowntimeReasonUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user: str = Depends(get_current_user)
+):
+    downtime = await db.get(DowntimeReasonModel, downtime_id)
+    if not downtime:
+        raise HTTPException(status_code=404, detail="Downtime record not found")
+    
+    downtime.reason = downtime_data.reason
+    downtime.category = downtime_data.category
+    downtime.operator_id = int(current_user)
+    
+    await db.commit()
+    await db.refresh(downtime)
+    
+    # Duruş raporu kategoriye göre gruplanır
+    result_cache.invalidate(downtime.machine_id, downtime.start_time, downtime.end_time or datetime.max)
+    return downtime
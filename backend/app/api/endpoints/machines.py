@@ -1,31 +1,77 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from datetime import datetime, timedelta
-from app.models.database import get_db
-from app.models.schemas import Machine, MachineData, OEEData, MachineDataCreate
+from app.models.database import get_db, Machine as MachineModel
+from app.models.schemas import Machine, MachineData, OEEData, FleetOEEData, MachineDataCreate, MachineDataBatch, MachineDataBatchAck, Anomaly, FleetSnapshot, to_naive_utc
 from app.services.oee_service import OEEService
+from app.services.ingestion_service import ingestion_buffer, IngestionError
+from app.services.oee_state_service import oee_state, OEE_PERIODS
+from app.services.cache_service import result_cache, single_flight
+from app.services.data_service import DataService
+from app.services.state_interval_service import StateIntervalService
+from app.services.websocket_service import websocket_manager, FLEET_CHANNEL
+from app.services.fleet_service import fleet_snapshot
 from app.core.security import get_current_user
+from app.core.config import settings
 
 router = APIRouter()
 
+# lttb: gerçek satırlardan seçim, minmax: SQL'de kova başına min/max/ortalama
+DOWNSAMPLE_METHODS = ("lttb", "minmax")
+DOWNSAMPLE_METRICS = ("current_consumption", "temperature", "pressure", "cycle_count")
+
+def _check_downsampling(max_points: int, metric: str):
+    if not 3 <= max_points <= settings.DOWNSAMPLE_MAX_POINTS:
+        raise HTTPException(status_code=400, detail=f"max_points must be between 3 and {settings.DOWNSAMPLE_MAX_POINTS}")
+    if metric not in DOWNSAMPLE_METRICS:
+        raise HTTPException(status_code=400, detail=f"metric must be one of: {', '.join(DOWNSAMPLE_METRICS)}")
+
 @router.get("/machines/", response_model=List[Machine])
 async def get_machines(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
+    current_user: str = Depends(get_current_user)
+):
+    result = await db.execute(select(MachineModel).offset(skip).limit(limit))
+    return result.scalars().all()
+
+@router.get("/machines/oee", response_model=List[FleetOEEData])
+async def get_fleet_oee(
+    start_time: datetime,
+    end_time: datetime,
+    type: Optional[str] = None,
+    by_shift: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user: str = Depends(get_current_user)
+):
+    # /machines/{machine_id} rotasından önce tanımlanmalı
+    start_time, end_time = to_naive_utc(start_time), to_naive_utc(end_time)
+    if end_time <= start_time:
+        raise HTTPException(status_code=400, detail="end_time must be after start_time")
+    
+    return await result_cache.get_or_compute(
+        ("fleet_oee", start_time, end_time, type, by_shift),
+        lambda: OEEService.calculate_fleet_oee(db, start_time, end_time, machine_type=type, by_shift=by_shift),
+        None, start_time, end_time
+    )
+
+@router.get("/machines/snapshot", response_model=FleetSnapshot)
+async def get_fleet_snapshot(
     current_user: str = Depends(get_current_user)
 ):
-    machines = db.query(Machine).offset(skip).limit(limit).all()
-    return machines
+    # /ws/fleet ile aynı görüntü, yoklama yapan istemciler için (OEE en fazla FLEET_OEE_REFRESH_INTERVAL'da bir okunur)
+    return await fleet_snapshot.current()
 
 @router.get("/machines/{machine_id}", response_model=Machine)
 async def get_machine(
     machine_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: str = Depends(get_current_user)
 ):
-    machine = db.query(Machine).filter(Machine.id == machine_id).first()
+    machine = await db.get(MachineModel, machine_id)
     if not machine:
         raise HTTPException(status_code=404, detail="Machine not found")
     return machine
@@ -33,40 +79,174 @@ async def get_machine(
 @router.post("/machines/{machine_id}/data")
 async def receive_machine_data(
     machine_id: int,
-    data: MachineDataCreate,
-    db: Session = Depends(get_db)
+    data: MachineDataCreate
 ):
-    machine_data = MachineData(**data.dict())
-    db.add(machine_data)
-    db.commit()
-    db.refresh(machine_data)
+    try:
+        await ingestion_buffer.enqueue([data.dict()])
+    except IngestionError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     
-    return {"message": "Data received successfully", "id": machine_data.id}
+    return {"message": "Data received successfully", "durable": ingestion_buffer.durable_ack}
+
+@router.post("/machines/data/batch", response_model=MachineDataBatchAck)
+async def receive_machine_data_batch(
+    batch: MachineDataBatch
+):
+    records = [record.dict() for record in batch.records]
+    try:
+        accepted = await ingestion_buffer.enqueue(records)
+    except IngestionError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    return MachineDataBatchAck(
+        message="Batch received successfully",
+        accepted=accepted,
+        durable=ingestion_buffer.durable_ack,
+        machine_ids=sorted({record["machine_id"] for record in records})
+    )
 
 @router.get("/machines/{machine_id}/oee", response_model=OEEData)
 async def get_machine_oee(
     machine_id: int,
-    start_time: datetime,
-    end_time: datetime,
-    db: Session = Depends(get_db),
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    period: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
     current_user: str = Depends(get_current_user)
 ):
-    oee_data = OEEService.calculate_oee(db, machine_id, start_time, end_time)
+    if period is not None:
+        if period not in OEE_PERIODS:
+            raise HTTPException(status_code=400, detail=f"period must be one of: {', '.join(OEE_PERIODS)}")
+        # İçinde bulunulan vardiya/gün artımlı durumdan, machine_data okunmadan
+        oee_data = oee_state.snapshot(machine_id, period)
+        if oee_data is None and oee_state.loaded and not oee_state.knows(machine_id):
+            # Durum yüklendikten sonra eklenen makine
+            await oee_state.refresh_machines()
+            oee_data = oee_state.snapshot(machine_id, period)
+        if oee_data is None:
+            start_time, end_time = oee_state.current_window(period)
+            oee_data = await single_flight.do(
+                ("machine_oee_period", machine_id, period),
+                lambda: OEEService.calculate_oee(db, machine_id, start_time, end_time)
+            )
+        return OEEData(machine_id=machine_id, **oee_data)
+    
+    if start_time is None or end_time is None:
+        raise HTTPException(status_code=400, detail="start_time and end_time are required unless period is given")
+    
+    # '...Z' ile gelen zamanlar naive UTC kolonlarla karşılaştırılır
+    start_time, end_time = to_naive_utc(start_time), to_naive_utc(end_time)
+    oee_data = await result_cache.get_or_compute(
+        ("machine_oee", machine_id, start_time, end_time),
+        lambda: OEEService.calculate_oee(db, machine_id, start_time, end_time),
+        machine_id, start_time, end_time
+    )
     return OEEData(machine_id=machine_id, **oee_data)
 
-@router.get("/machines/{machine_id}/realtime")
+@router.get("/machines/{machine_id}/realtime", response_model=List[MachineData])
 async def get_realtime_data(
     machine_id: int,
     hours: int = 1,
-    db: Session = Depends(get_db),
+    max_points: int = 100,
+    metric: str = "current_consumption",
+    db: AsyncSession = Depends(get_db),
+    current_user: str = Depends(get_current_user)
+):
+    _check_downsampling(max_points, metric)
+    
+    async def load_realtime():
+        # Son N satır yerine tüm pencere, grafiğin şekli korunarak max_points satıra seyreltilir
+        end_time = datetime.utcnow()
+        start_time = end_time - timedelta(hours=hours)
+        rows = await DataService.get_machine_data_window(db, machine_id, start_time, end_time, max_points, metric)
+        return rows[::-1]
+    
+    # Aynı anda gelen özdeş istekler tek sorguyu paylaşır
+    return await single_flight.do(("realtime", machine_id, hours, max_points, metric), load_realtime)
+
+@router.get("/machines/{machine_id}/history")
+async def get_machine_history(
+    machine_id: int,
+    hours: int = 24,
+    max_points: int = settings.DOWNSAMPLE_DEFAULT_POINTS,
+    method: str = "lttb",
+    metric: str = "current_consumption",
+    db: AsyncSession = Depends(get_db),
     current_user: str = Depends(get_current_user)
 ):
-    end_time = datetime.utcnow()
-    start_time = end_time - timedelta(hours=hours)
+    _check_downsampling(max_points, metric)
+    if method not in DOWNSAMPLE_METHODS:
+        raise HTTPException(status_code=400, detail=f"method must be one of: {', '.join(DOWNSAMPLE_METHODS)}")
     
-    data = db.query(MachineData).filter(
-        MachineData.machine_id == machine_id,
-        MachineData.timestamp.between(start_time, end_time)
-    ).order_by(MachineData.timestamp.desc()).limit(100).all()
+    async def load_history():
+        if method == "lttb":
+            return await DataService.get_machine_data_history(db, machine_id, hours, max_points, metric)
+        # Uzun pencerelerde satırlar Python'a taşınmadan kova başına min/max/ortalama
+        end_time = datetime.utcnow()
+        return await DataService.get_machine_data_summary(db, machine_id, end_time - timedelta(hours=hours), end_time, max_points)
     
-    return data
+    return await single_flight.do(("history", machine_id, hours, max_points, method, metric), load_history)
+
+@router.get("/machines/{machine_id}/timeline")
+async def get_state_timeline(
+    machine_id: int,
+    start_time: datetime,
+    end_time: datetime,
+    db: AsyncSession = Depends(get_db),
+    current_user: str = Depends(get_current_user)
+):
+    # Ham örnekler yerine pencereyle kesişen birkaç durum aralığı
+    start_time, end_time = to_naive_utc(start_time), to_naive_utc(end_time)
+    intervals = await StateIntervalService.timeline(db, [machine_id], start_time, end_time)
+    durations = {}
+    for interval in intervals:
+        seconds = (interval["end_time"] - interval["start_time"]).total_seconds()
+        durations[interval["state"]] = durations.get(interval["state"], 0.0) + seconds
+    
+    return {"machine_id": machine_id, "intervals": intervals, "durations": durations}
+
+@router.get("/machines/{machine_id}/anomalies", response_model=List[Anomaly])
+async def get_machine_anomalies(
+    machine_id: int,
+    hours: int = 1,
+    metric: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: str = Depends(get_current_user)
+):
+    # Tespit ingestion sırasında yapılır; burada yalnızca kayıtlar okunur
+    return await DataService.get_anomalies(db, machine_id, hours, metric)
+
+async def _subscribe(websocket: WebSocket, channel, max_rate: float, delta: bool):
+    # max_rate: mesaj tipi başına saniyede en fazla güncelleme (arada gelenlerin yalnızca sonuncusu gider)
+    # delta: ilk mesajdan sonra yalnızca değişen alanlar ("delta": true ile)
+    if not 0 <= max_rate <= settings.WS_MAX_RATE_LIMIT:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket_manager.connect(websocket, channel, max_rate=max_rate, delta=delta)
+    try:
+        while True:
+            # İstemciden gelen mesajlar kullanılmaz; bağlantının kapanması beklenir
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Yavaş istemci olarak ayrılmışsa zaten kayıtlı değildir
+        websocket_manager.disconnect(websocket, channel)
+
+@router.websocket("/ws/machines/{machine_id}")
+async def machine_updates(
+    websocket: WebSocket,
+    machine_id: int,
+    max_rate: float = settings.WS_DEFAULT_MAX_RATE,
+    delta: bool = False
+):
+    await _subscribe(websocket, machine_id, max_rate, delta)
+
+@router.websocket("/ws/fleet")
+async def fleet_updates(
+    websocket: WebSocket,
+    max_rate: float = settings.WS_DEFAULT_MAX_RATE,
+    delta: bool = False
+):
+    # Tek bağlantıda tüm makineler: FLEET_SNAPSHOT_INTERVAL'da bir fleet_snapshot
+    await _subscribe(websocket, FLEET_CHANNEL, max_rate, delta)
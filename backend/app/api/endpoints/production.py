@@ -1,9 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 from typing import List
-from app.models.database import get_db
+from app.models.database import get_db, ProductionData as ProductionDataModel
 from app.models.schemas import ProductionData, ProductionDataCreate
+from app.services.oee_state_service import oee_state
+from app.services.cache_service import result_cache
 from app.core.security import get_current_user
 
 router = APIRouter()
@@ -11,13 +14,17 @@ router = APIRouter()
 @router.post("/production/", response_model=ProductionData)
 async def create_production_record(
     production_data: ProductionDataCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: str = Depends(get_current_user)
 ):
-    db_production = ProductionData(**production_data.dict())
+    db_production = ProductionDataModel(**production_data.dict())
     db.add(db_production)
-    db.commit()
-    db.refresh(db_production)
+    await db.commit()
+    await db.refresh(db_production)
+    
+    oee_state.record_production(db_production.machine_id, db_production.shift_date, db_production.shift_number,
+                                db_production.good_parts, db_production.defective_parts)
+    result_cache.invalidate_shift_date(db_production.machine_id, db_production.shift_date)
     return db_production
 
 @router.get("/production/", response_model=List[ProductionData])
@@ -26,27 +33,27 @@ async def get_production_records(
     shift_date: str = None,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: str = Depends(get_current_user)
 ):
-    query = db.query(ProductionData)
+    query = select(ProductionDataModel)
     
     if machine_id:
-        query = query.filter(ProductionData.machine_id == machine_id)
+        query = query.where(ProductionDataModel.machine_id == machine_id)
     
     if shift_date:
-        query = query.filter(ProductionData.shift_date == shift_date)
+        query = query.where(ProductionDataModel.shift_date == shift_date)
     
-    production_data = query.offset(skip).limit(limit).all()
-    return production_data
+    result = await db.execute(query.offset(skip).limit(limit))
+    return result.scalars().all()
 
 @router.get("/production/{production_id}", response_model=ProductionData)
 async def get_production_record(
     production_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: str = Depends(get_current_user)
 ):
-    production = db.query(ProductionData).filter(ProductionData.id == production_id).first()
+    production = await db.get(ProductionDataModel, production_id)
     if not production:
         raise HTTPException(status_code=404, detail="Production record not found")
     return production
@@ -55,30 +62,44 @@ async def get_production_record(
 async def update_production_record(
     production_id: int,
     production_data: ProductionDataCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: str = Depends(get_current_user)
 ):
-    db_production = db.query(ProductionData).filter(ProductionData.id == production_id).first()
+    db_production = await db.get(ProductionDataModel, production_id)
     if not db_production:
         raise HTTPException(status_code=404, detail="Production record not found")
     
+    previous = (db_production.machine_id, db_production.shift_date, db_production.shift_number,
+                -(db_production.good_parts or 0), -(db_production.defective_parts or 0))
+    
     for key, value in production_data.dict().items():
         setattr(db_production, key, value)
     
-    db.commit()
-    db.refresh(db_production)
+    await db.commit()
+    await db.refresh(db_production)
+    
+    # Artımlı OEE durumunda eski kaydı çıkar, yenisini ekle
+    oee_state.record_production(*previous)
+    result_cache.invalidate_shift_date(previous[0], previous[1])
+    oee_state.record_production(db_production.machine_id, db_production.shift_date, db_production.shift_number,
+                                db_production.good_parts, db_production.defective_parts)
+    result_cache.invalidate_shift_date(db_production.machine_id, db_production.shift_date)
     return db_production
 
 @router.delete("/production/{production_id}")
 async def delete_production_record(
     production_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: str = Depends(get_current_user)
 ):
-    production = db.query(ProductionData).filter(ProductionData.id == production_id).first()
+    production = await db.get(ProductionDataModel, production_id)
     if not production:
         raise HTTPException(status_code=404, detail="Production record not found")
     
-    db.delete(production)
-    db.commit()
+    await db.delete(production)
+    await db.commit()
+    
+    oee_state.record_production(production.machine_id, production.shift_date, production.shift_number,
+                                -(production.good_parts or 0), -(production.defective_parts or 0))
+    result_cache.invalidate_shift_date(production.machine_id, production.shift_date)
     return {"message": "Production record deleted successfully"}
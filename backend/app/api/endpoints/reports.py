@@ -1,57 +1,117 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 from typing import List
-from app.models.database import get_db
-from app.services.oee_service import OEEService
+from app.models.database import get_db, Machine
+from app.services.oee_service import OEEService, OEE_BUCKETS
+from app.services.energy_service import EnergyService, ENERGY_BUCKETS
+from app.services.cache_service import result_cache
 from app.core.security import get_current_user
+from app.core.config import settings
 
 router = APIRouter()
 
+def _parse_date_range(start_date: str, end_date: str):
+    """YYYY-MM-DD aralığını [start, end + 1 gün) pencereye çevir"""
+    try:
+        start_dt = datetime.fromisoformat(start_date)
+        end_dt = datetime.fromisoformat(end_date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use ISO format: YYYY-MM-DD")
+    
+    if end_dt < start_dt:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+    
+    if (end_dt - start_dt).days > settings.MAX_REPORT_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range cannot exceed {settings.MAX_REPORT_DAYS} days")
+    
+    start_dt = datetime(start_dt.year, start_dt.month, start_dt.day)
+    end_dt = datetime(end_dt.year, end_dt.month, end_dt.day) + timedelta(days=1)
+    return start_dt, end_dt
+
 @router.get("/reports/oee/daily")
 async def get_daily_oee_report(
     machine_id: int,
     start_date: str,
     end_date: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: str = Depends(get_current_user)
 ):
-    try:
-        start_dt = datetime.fromisoformat(start_date)
-        end_dt = datetime.fromisoformat(end_date)
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format. Use ISO format: YYYY-MM-DD")
+    start_dt, end_dt = _parse_date_range(start_date, end_date)
+    buckets = await result_cache.get_or_compute(
+        ("bucketed_oee", machine_id, start_dt, end_dt, "day"),
+        lambda: OEEService.calculate_bucketed_oee(db, machine_id, start_dt, end_dt, bucket="day"),
+        machine_id, start_dt, end_dt
+    )
     
-    if (end_dt - start_dt).days > 31:
-        raise HTTPException(status_code=400, detail="Date range cannot exceed 31 days")
-    
-    results = []
-    current_date = start_dt
-    
-    while current_date <= end_dt:
-        day_start = datetime(current_date.year, current_date.month, current_date.day, 0, 0, 0)
-        day_end = datetime(current_date.year, current_date.month, current_date.day, 23, 59, 59)
-        
-        oee_data = OEEService.calculate_oee(db, machine_id, day_start, day_end)
-        
-        results.append({
-            "date": current_date.date().isoformat(),
-            "availability": oee_data["availability"],
-            "performance": oee_data["performance"],
-            "quality": oee_data["quality"],
-            "oee": oee_data["oee"]
-        })
-        
-        current_date += timedelta(days=1)
-    
-    return results
+    return [
+        {
+            "date": row["bucket_start"].date().isoformat(),
+            "availability": row["availability"],
+            "performance": row["performance"],
+            "quality": row["quality"],
+            "oee": row["oee"]
+        }
+        for row in buckets
+    ]
+
+@router.get("/reports/oee")
+async def get_bucketed_oee_report(
+    machine_id: int,
+    start_date: str,
+    end_date: str,
+    bucket: str = "day",
+    db: AsyncSession = Depends(get_db),
+    current_user: str = Depends(get_current_user)
+):
+    if bucket not in OEE_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of: {', '.join(OEE_BUCKETS)}")
+    
+    start_dt, end_dt = _parse_date_range(start_date, end_date)
+    return await result_cache.get_or_compute(
+        ("bucketed_oee", machine_id, start_dt, end_dt, bucket),
+        lambda: OEEService.calculate_bucketed_oee(db, machine_id, start_dt, end_dt, bucket=bucket),
+        machine_id, start_dt, end_dt
+    )
+
+@router.get("/reports/energy")
+async def get_energy_report(
+    start_date: str,
+    end_date: str,
+    machine_id: int = None,
+    type: str = None,
+    bucket: str = "hour",
+    db: AsyncSession = Depends(get_db),
+    current_user: str = Depends(get_current_user)
+):
+    if bucket not in ENERGY_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of: {', '.join(ENERGY_BUCKETS)}")
+    
+    start_dt, end_dt = _parse_date_range(start_date, end_date)
+    
+    async def build_report():
+        # machine_id verilmezse tüm filo (isteğe bağlı makine tipiyle) tek sorguda
+        if machine_id:
+            machine_ids = [machine_id]
+        else:
+            query = select(Machine.id)
+            if type:
+                query = query.where(Machine.type == type)
+            machine_ids = list((await db.execute(query)).scalars())
+        return await EnergyService.analyze(db, machine_ids, start_dt, end_dt, bucket=bucket)
+    
+    return await result_cache.get_or_compute(
+        ("energy_report", machine_id, type, start_dt, end_dt, bucket),
+        build_report, machine_id or None, start_dt, end_dt
+    )
 
 @router.get("/reports/downtime")
 async def get_downtime_report(
     machine_id: int = None,
     start_date: str = None,
     end_date: str = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: str = Depends(get_current_user)
 ):
     query = """
@@ -69,29 +129,37 @@ async def get_downtime_report(
         params["machine_id"] = machine_id
     
     if start_date and end_date:
+        try:
+            params["start_date"] = datetime.fromisoformat(start_date)
+            params["end_date"] = datetime.fromisoformat(end_date)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date format. Use ISO format: YYYY-MM-DD")
         query += " AND start_time BETWEEN :start_date AND :end_date"
-        params["start_date"] = start_date
-        params["end_date"] = end_date
     
     query += " GROUP BY category ORDER BY total_downtime_seconds DESC"
     
-    result = db.execute(query, params).fetchall()
-    
-    return [
-        {
-            "category": row[0],
-            "total_downtime_hours": round(row[1] / 3600, 2),
-            "incident_count": row[2]
-        }
-        for row in result
-    ]
+    async def build_report():
+        result = (await db.execute(text(query), params)).fetchall()
+        return [
+            {
+                "category": row[0],
+                "total_downtime_hours": round(row[1] / 3600, 2),
+                "incident_count": row[2]
+            }
+            for row in result
+        ]
+    
+    return await result_cache.get_or_compute(
+        ("downtime_report", machine_id, params.get("start_date"), params.get("end_date")),
+        build_report, machine_id or None, params.get("start_date"), params.get("end_date")
+    )
 
 @router.get("/reports/production")
 async def get_production_report(
     machine_id: int = None,
     start_date: str = None,
     end_date: str = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: str = Depends(get_current_user)
 ):
     query = """
@@ -110,22 +178,32 @@ async def get_production_report(
         query += " AND machine_id = :machine_id"
         params["machine_id"] = machine_id
     
+    window = (None, None)
     if start_date and end_date:
         query += " AND shift_date BETWEEN :start_date AND :end_date"
         params["start_date"] = start_date
         params["end_date"] = end_date
+        try:
+            window = (datetime.fromisoformat(start_date), datetime.fromisoformat(end_date) + timedelta(days=1))
+        except ValueError:
+            pass
     
     query += " GROUP BY shift_date ORDER BY shift_date"
     
-    result = db.execute(query, params).fetchall()
-    
-    return [
-        {
-            "date": row[0],
-            "good_parts": row[1],
-            "defective_parts": row[2],
-            "total_parts": row[3],
-            "quality_rate": row[4]
-        }
-        for row in result
-    ]
+    async def build_report():
+        result = (await db.execute(text(query), params)).fetchall()
+        return [
+            {
+                "date": row[0],
+                "good_parts": row[1],
+                "defective_parts": row[2],
+                "total_parts": row[3],
+                "quality_rate": row[4]
+            }
+            for row in result
+        ]
+    
+    return await result_cache.get_or_compute(
+        ("production_report", machine_id, start_date, end_date),
+        build_report, machine_id or None, *window
+    )
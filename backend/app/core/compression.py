@@ -0,0 +1,53 @@
+import zlib
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+from app.core.config import settings
+
+class GZipRequestMiddleware:
+    """Content-Encoding: gzip ile gelen istek gövdelerini açar (gateway toplu gönderimleri)"""
+    def __init__(self, app: ASGIApp, max_size: int = settings.REQUEST_MAX_DECOMPRESSED_BYTES):
+        self.app = app
+        self.max_size = max_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = [(name, value) for name, value in scope["headers"] if name not in (b"content-encoding", b"content-length")]
+        encoding = dict(scope["headers"]).get(b"content-encoding", b"").strip().lower()
+        if encoding != b"gzip":
+            await self.app(scope, receive, send)
+            return
+
+        # Açılmış boyut sınırlı: küçük bir sıkıştırılmış gövde belleği dolduramaz
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        body = bytearray()
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            try:
+                body += decompressor.decompress(message.get("body", b""), self.max_size + 1 - len(body))
+            except zlib.error:
+                await JSONResponse({"detail": "Invalid gzip body"}, status_code=400)(scope, receive, send)
+                return
+            if len(body) > self.max_size or decompressor.unconsumed_tail:
+                await JSONResponse({"detail": "Request body too large"}, status_code=413)(scope, receive, send)
+                return
+            more_body = message.get("more_body", False)
+        if not decompressor.eof:
+            await JSONResponse({"detail": "Invalid gzip body"}, status_code=400)(scope, receive, send)
+            return
+
+        scope = {**scope, "headers": headers + [(b"content-length", str(len(body)).encode())]}
+        delivered = False
+
+        async def receive_body():
+            nonlocal delivered
+            if delivered:
+                return await receive()
+            delivered = True
+            return {"type": "http.request", "body": bytes(body), "more_body": False}
+
+        await self.app(scope, receive_body, send)
@@ -18,7 +18,76 @@ class Settings(BaseSettings):
     API_PORT: int = int(os.getenv("API_PORT", 8000))
     DEBUG: bool = os.getenv("DEBUG", "False").lower() == "true"
     
+    # TimescaleDB
+    TIMESCALE_ENABLED: bool = os.getenv("TIMESCALE_ENABLED", "False").lower() == "true"
+    TIMESCALE_COMPRESS_AFTER_DAYS: int = int(os.getenv("TIMESCALE_COMPRESS_AFTER_DAYS", 7))
+    MACHINE_SAMPLE_INTERVAL: float = float(os.getenv("MACHINE_SAMPLE_INTERVAL", 1.0))  # seconds, gateway update_interval
+    MACHINE_REPORT_BY_EXCEPTION: bool = os.getenv("MACHINE_REPORT_BY_EXCEPTION", "False").lower() == "true"  # must match the gateways' report_by_exception.enabled
+    MACHINE_MAX_SILENCE_SECONDS: float = float(os.getenv("MACHINE_MAX_SILENCE_SECONDS", 60.0))  # gateway heartbeat, longest gap a sample stays valid
+    
+    # Shifts / reports
+    SHIFT_START_HOUR: int = int(os.getenv("SHIFT_START_HOUR", 0))  # UTC, first shift of the day
+    SHIFT_HOURS: int = int(os.getenv("SHIFT_HOURS", 8))
+    MAX_REPORT_DAYS: int = int(os.getenv("MAX_REPORT_DAYS", 366))
+    
+    # Energy
+    ENERGY_VOLTAGE: float = float(os.getenv("ENERGY_VOLTAGE", 380.0))  # volts, typical industrial supply
+    ENERGY_DEMAND_WINDOW: int = int(os.getenv("ENERGY_DEMAND_WINDOW", 900))  # seconds, peak demand interval
+    ENERGY_MAX_GAP_SECONDS: float = float(os.getenv(
+        "ENERGY_MAX_GAP_SECONDS", MACHINE_MAX_SILENCE_SECONDS + MACHINE_SAMPLE_INTERVAL
+    ))  # longer gaps count as missing data
+    
+    # In-memory hot tier for recent machine_data
+    # Per-process store filled by this process's ingestion: enable only when a single worker ingests and serves reads
+    HOT_STORE_ENABLED: bool = os.getenv("HOT_STORE_ENABLED", "False").lower() == "true"
+    HOT_STORE_RETENTION_HOURS: float = float(os.getenv("HOT_STORE_RETENTION_HOURS", 6.0))
+    HOT_STORE_MAX_MB: int = int(os.getenv("HOT_STORE_MAX_MB", 256))  # ~2.7 MB per machine at 6 h / 1 s samples; machines beyond the cap are served from the database
+    
+    # Chart downsampling (history / realtime)
+    DOWNSAMPLE_DEFAULT_POINTS: int = int(os.getenv("DOWNSAMPLE_DEFAULT_POINTS", 1000))
+    DOWNSAMPLE_MAX_POINTS: int = int(os.getenv("DOWNSAMPLE_MAX_POINTS", 10000))
+    
+    # WebSocket fan-out
+    WS_CLIENT_QUEUE_SIZE: int = int(os.getenv("WS_CLIENT_QUEUE_SIZE", 100))  # messages; a full queue drops the client
+    WS_SEND_TIMEOUT: float = float(os.getenv("WS_SEND_TIMEOUT", 5.0))  # seconds
+    WS_DEFAULT_MAX_RATE: float = float(os.getenv("WS_DEFAULT_MAX_RATE", 0))  # state messages/s per type; 0 = unlimited
+    WS_MAX_RATE_LIMIT: float = float(os.getenv("WS_MAX_RATE_LIMIT", 50))  # upper bound for ?max_rate
+    WS_BROADCAST_BACKEND: str = os.getenv("WS_BROADCAST_BACKEND", "memory")  # memory | postgres (LISTEN/NOTIFY across workers)
+    WS_NOTIFY_CHANNEL: str = os.getenv("WS_NOTIFY_CHANNEL", "machine_updates")
+    WS_NOTIFY_INTERVAL: float = float(os.getenv("WS_NOTIFY_INTERVAL", 0.05))  # seconds of messages batched per NOTIFY
+    WS_NOTIFY_MAX_PAYLOAD: int = int(os.getenv("WS_NOTIFY_MAX_PAYLOAD", 7900))  # bytes; PostgreSQL limit is 8000
+    FLEET_SNAPSHOT_INTERVAL: float = float(os.getenv("FLEET_SNAPSHOT_INTERVAL", 1.0))  # seconds between fleet snapshots
+    FLEET_OEE_REFRESH_INTERVAL: float = float(os.getenv("FLEET_OEE_REFRESH_INTERVAL", 15.0))  # seconds; shift OEE is read from the database so all workers agree
+    
+    # Ingestion
+    INGEST_ACK_MODE: str = os.getenv("INGEST_ACK_MODE", "flush")  # flush | enqueue
+    INGEST_MAX_ROWS: int = int(os.getenv("INGEST_MAX_ROWS", 50000))
+    INGEST_BATCH_SIZE: int = int(os.getenv("INGEST_BATCH_SIZE", 1000))
+    INGEST_FLUSH_INTERVAL: float = float(os.getenv("INGEST_FLUSH_INTERVAL", 0.5))  # seconds
+    INGEST_ENQUEUE_TIMEOUT: float = float(os.getenv("INGEST_ENQUEUE_TIMEOUT", 2.0))  # seconds
+    REQUEST_MAX_DECOMPRESSED_BYTES: int = int(os.getenv("REQUEST_MAX_DECOMPRESSED_BYTES", 16 * 1024 * 1024))  # gzip request bodies (gateway batches)
+    
+    # Downtime detection
+    DOWNTIME_DETECTION_ENABLED: bool = os.getenv("DOWNTIME_DETECTION_ENABLED", "True").lower() == "true"
+    DOWNTIME_GRACE_SECONDS: float = float(os.getenv("DOWNTIME_GRACE_SECONDS", 60.0))  # not running longer than this opens a record
+    
+    # Anomaly detection
+    ANOMALY_DETECTION_ENABLED: bool = os.getenv("ANOMALY_DETECTION_ENABLED", "True").lower() == "true"
+    ANOMALY_EWMA_ALPHA: float = float(os.getenv("ANOMALY_EWMA_ALPHA", 0.01))  # weight of the newest sample
+    ANOMALY_WARMUP_SAMPLES: int = int(os.getenv("ANOMALY_WARMUP_SAMPLES", 30))
+    ANOMALY_Z_THRESHOLD: float = float(os.getenv("ANOMALY_Z_THRESHOLD", 2.5))
+    ANOMALY_HIGH_Z: float = float(os.getenv("ANOMALY_HIGH_Z", 3.0))
+    ANOMALY_SEED_HOURS: int = int(os.getenv("ANOMALY_SEED_HOURS", 1))  # history used to seed the baseline on startup
+    
+    # Incremental OEE state
+    OEE_CHECKPOINT_INTERVAL: float = float(os.getenv("OEE_CHECKPOINT_INTERVAL", 60.0))  # seconds
+    
+    # Result cache (OEE / reports)
+    RESULT_CACHE_MAX_ENTRIES: int = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 1024))
+    RESULT_CACHE_TTL: float = float(os.getenv("RESULT_CACHE_TTL", 30.0))  # seconds, windows overlapping now
+    
     class Config:
         env_file = ".env"
+        extra = "ignore"
 
 settings = Settings()
@@ -1,9 +1,15 @@
 from app.models.database import Base, engine, SessionLocal
 from app.models.database import Machine, Operator
 from app.core.security import get_password_hash
+from app.core.config import settings
+from app.database.timescale import setup_timescale
+from app.database.upgrade import add_missing_columns
 
 def init_db():
     Base.metadata.create_all(bind=engine)
+    add_missing_columns(engine, Base.metadata)
+    if settings.TIMESCALE_ENABLED:
+        setup_timescale(engine)
     
     db = SessionLocal()
     
@@ -0,0 +1,51 @@
+from sqlalchemy import literal_column
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.types import DateTime, Float
+
+class seconds_between(FunctionElement):
+    """seconds_between(start, end): iki zaman damgası arasındaki saniye"""
+    type = Float()
+    name = "seconds_between"
+    inherit_cache = True
+
+@compiles(seconds_between)
+def _seconds_between_postgresql(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return "EXTRACT(EPOCH FROM (%s - %s))" % (compiler.process(end, **kw), compiler.process(start, **kw))
+
+@compiles(seconds_between, "sqlite")
+def _seconds_between_sqlite(element, compiler, **kw):
+    # Yerel geliştirme/test için (aiosqlite)
+    start, end = list(element.clauses)
+    return "((julianday(%s) - julianday(%s)) * 86400.0)" % (compiler.process(end, **kw), compiler.process(start, **kw))
+
+class bucket_floor(FunctionElement):
+    """bucket_floor(ts, width, offset): ts'yi içeren kovanın başlangıcı (saniye cinsinden genişlik/ofset)"""
+    type = DateTime()
+    name = "bucket_floor"
+    inherit_cache = True
+
+    def __init__(self, ts, width: int, offset: int = 0):
+        # Genişlik ve ofset sabit yazılır: GROUP BY ile SELECT'teki ifade birebir aynı
+        # kalmalı ve derlenmiş sorgu önbelleği kova genişliğine göre ayrışmalı
+        super().__init__(ts, literal_column(str(int(width))), literal_column(str(int(offset))))
+
+def _bucket_args(element, compiler, **kw):
+    return [compiler.process(clause, **kw) for clause in element.clauses]
+
+@compiles(bucket_floor)
+def _bucket_floor_postgresql(element, compiler, **kw):
+    ts, width, offset = _bucket_args(element, compiler, **kw)
+    return (
+        "(TIMESTAMP '1970-01-01' + make_interval(secs => "
+        "floor((EXTRACT(EPOCH FROM %s) - %s) / %s) * %s + %s))" % (ts, offset, width, width, offset)
+    )
+
+@compiles(bucket_floor, "sqlite")
+def _bucket_floor_sqlite(element, compiler, **kw):
+    ts, width, offset = _bucket_args(element, compiler, **kw)
+    return (
+        "datetime((CAST(strftime('%%s', %s) AS INTEGER) - %s) / %s * %s + %s, 'unixepoch')"
+        % (ts, offset, width, width, offset)
+    )
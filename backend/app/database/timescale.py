@@ -0,0 +1,150 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from app.core.config import settings
+from app.models.schemas import to_naive_utc
+
+logger = logging.getLogger(__name__)
+
+# Sürekli toplam (continuous aggregate) görünümleri, en geniş kovadan en dara
+AGGREGATE_VIEWS = [
+    ("machine_data_1h", timedelta(hours=1)),
+    ("machine_data_1m", timedelta(minutes=1)),
+]
+
+AGGREGATE_POLICIES = {
+    # görünüm: (start_offset, end_offset, schedule_interval)
+    "machine_data_1m": ("2 hours", "1 minute", "1 minute"),
+    "machine_data_1h": ("3 days", "1 hour", "30 minutes"),
+}
+
+# machine_data'yı hypertable'a çevir; TimescaleDB birincil anahtarda zaman kolonunu ister
+HYPERTABLE_SQL = """
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM timescaledb_information.hypertables
+        WHERE hypertable_name = 'machine_data'
+    ) THEN
+        ALTER TABLE machine_data ALTER COLUMN timestamp SET NOT NULL;
+        ALTER TABLE machine_data DROP CONSTRAINT IF EXISTS machine_data_pkey;
+        ALTER TABLE machine_data ADD PRIMARY KEY (id, timestamp);
+        PERFORM create_hypertable(
+            'machine_data', 'timestamp',
+            chunk_time_interval => INTERVAL '1 day',
+            migrate_data => true
+        );
+    END IF;
+END $$;
+"""
+
+COMPRESSION_SQL = """
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM timescaledb_information.compression_settings
+        WHERE hypertable_name = 'machine_data'
+    ) THEN
+        ALTER TABLE machine_data SET (
+            timescaledb.compress,
+            timescaledb.compress_segmentby = 'machine_id',
+            timescaledb.compress_orderby = 'timestamp DESC'
+        );
+    END IF;
+END $$;
+"""
+
+# Sürekli toplam kolonları: (ad, ifade). Yalnızca örnek aralığından bağımsız toplamlar; süreler
+# (ör. çalışma saniyesi) örnek sayısı x aralık ile hesaplanamaz, durum aralıklarından okunur
+AGGREGATE_COLUMNS = [
+    ("sample_count", "count(*)"),
+    ("running_samples", "sum(CASE WHEN status = 'running' THEN 1 ELSE 0 END)"),
+    ("cycle_min", "min(cycle_count)"),
+    ("cycle_max", "max(cycle_count)"),
+    ("cycle_delta", "max(cycle_count) - min(cycle_count)"),
+    ("current_samples", "count(current_consumption)"),
+    ("current_avg", "avg(current_consumption)"),
+    ("current_max", "max(current_consumption)"),
+    # Gateway'in integre ettiği yük (A·s); örnek aralığından bağımsız olarak toplanabilir
+    ("charge_samples", "count(current_charge)"),
+    ("charge_sum", "sum(current_charge)"),
+    ("temperature_avg", "avg(temperature)"),
+    ("temperature_max", "max(temperature)"),
+]
+
+AGGREGATE_SQL = """
+CREATE MATERIALIZED VIEW IF NOT EXISTS {view}
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT machine_id,
+       time_bucket(INTERVAL '{width} seconds', timestamp) AS bucket,
+       {columns}
+FROM machine_data
+GROUP BY machine_id, bucket
+WITH NO DATA
+"""
+
+def setup_timescale(engine: Engine) -> bool:
+    """machine_data için hypertable, sıkıştırma ve sürekli toplamları kur"""
+    if engine.dialect.name != "postgresql":
+        return False
+
+    # Sürekli toplamlar transaction bloğu içinde oluşturulamaz
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS timescaledb"))
+        conn.execute(text(HYPERTABLE_SQL))
+
+        conn.execute(text(COMPRESSION_SQL))
+        conn.execute(
+            text("SELECT add_compression_policy('machine_data', make_interval(days => :days), if_not_exists => true)"),
+            {"days": settings.TIMESCALE_COMPRESS_AFTER_DAYS}
+        )
+
+        expected = {"machine_id", "bucket"} | {name for name, _ in AGGREGATE_COLUMNS}
+        for view, width in AGGREGATE_VIEWS:
+            existing = set(conn.execute(
+                text("SELECT column_name FROM information_schema.columns WHERE table_name = :view"),
+                {"view": view}
+            ).scalars())
+            # Kolonları değişmiş görünüm yeniden kurulur ve bir kez baştan doldurulur
+            # (politika yalnızca son start_offset kadarını yeniler)
+            rebuild = bool(existing) and existing != expected
+            if rebuild:
+                logger.info("Recreating continuous aggregate %s (columns changed)", view)
+                conn.execute(text(f"DROP MATERIALIZED VIEW {view} CASCADE"))
+            conn.execute(text(AGGREGATE_SQL.format(
+                view=view,
+                width=int(width.total_seconds()),
+                columns=",\n       ".join(f"{expression} AS {name}" for name, expression in AGGREGATE_COLUMNS)
+            )))
+            if rebuild:
+                conn.execute(text(f"CALL refresh_continuous_aggregate('{view}', NULL, NULL)"))
+            start_offset, end_offset, schedule = AGGREGATE_POLICIES[view]
+            conn.execute(
+                text(
+                    "SELECT add_continuous_aggregate_policy(CAST(:view AS REGCLASS), "
+                    "start_offset => CAST(:start_offset AS INTERVAL), "
+                    "end_offset => CAST(:end_offset AS INTERVAL), "
+                    "schedule_interval => CAST(:schedule AS INTERVAL), "
+                    "if_not_exists => true)"
+                ),
+                {"view": view, "start_offset": start_offset, "end_offset": end_offset, "schedule": schedule}
+            )
+
+    return True
+
+def aggregate_for_window(start_time: datetime, end_time: datetime) -> Optional[str]:
+    """Pencere kova sınırlarına oturuyorsa kullanılabilecek en kaba görünümü döndür"""
+    if not settings.TIMESCALE_ENABLED or end_time <= start_time:
+        return None
+
+    # Kovalar naive UTC zaman damgaları üzerinde epoch'a göre hizalıdır
+    epoch = datetime(1970, 1, 1)
+    start_offset = to_naive_utc(start_time) - epoch
+    end_offset = to_naive_utc(end_time) - epoch
+
+    for view, width in AGGREGATE_VIEWS:
+        if start_offset % width == timedelta(0) and end_offset % width == timedelta(0):
+            return view
+    return None
@@ -0,0 +1,32 @@
+import logging
+from typing import List
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateColumn
+
+logger = logging.getLogger(__name__)
+
+def add_missing_columns(engine: Engine, metadata) -> List[str]:
+    """Mevcut tablolara modelde olup veritabanında olmayan boş bırakılabilir kolonları ekle"""
+    # create_all var olan tabloya dokunmaz; sonradan eklenen kolonlar burada tamamlanır
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    added = []
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable:
+                    # Dolu tabloya NOT NULL kolon varsayılan değer olmadan eklenemez
+                    logger.warning("Skipping non-nullable column %s.%s; add it manually", table.name, column.name)
+                    continue
+                ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+                added.append(f"{table.name}.{column.name}")
+    if added:
+        logger.info("Added columns: %s", ", ".join(added))
+    return added
@@ -1,11 +1,24 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
-from app.api.endpoints import machines, auth, production
+from app.core.compression import GZipRequestMiddleware
+from app.api.endpoints import machines, auth, production, reports, downtime
 from app.models.database import Base, engine
+from app.database.timescale import setup_timescale
+from app.database.upgrade import add_missing_columns
+from app.services.ingestion_service import ingestion_buffer
+from app.services.oee_state_service import oee_state
+from app.services.anomaly_service import anomaly_detector
+from app.services.hot_store_service import hot_store
+from app.services.websocket_service import websocket_manager
+from app.services.fleet_service import fleet_snapshot
+from app.services.cache_service import result_cache, single_flight
 
 # Create tables
 Base.metadata.create_all(bind=engine)
+add_missing_columns(engine, Base.metadata)
+if settings.TIMESCALE_ENABLED:
+    setup_timescale(engine)
 
 app = FastAPI(
     title="Factory Efficiency System API",
@@ -21,11 +34,35 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Gateway'ler toplu gönderimleri gzip ile sıkıştırabilir
+app.add_middleware(GZipRequestMiddleware)
 
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(machines.router, prefix="/api", tags=["machines"])
 app.include_router(production.router, prefix="/api", tags=["production"])
+app.include_router(reports.router, prefix="/api", tags=["reports"])
+app.include_router(downtime.router, prefix="/api", tags=["downtime"])
+
+@app.on_event("startup")
+async def start_background_tasks():
+    # OEE durumu yüklenmeden kayıt kabul edilmez (çift sayımı önler)
+    await oee_state.start()
+    if settings.HOT_STORE_ENABLED:
+        await hot_store.load()
+    if settings.ANOMALY_DETECTION_ENABLED:
+        await anomaly_detector.load()
+    await websocket_manager.start()
+    await fleet_snapshot.start()
+    await ingestion_buffer.start()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    # Tampondaki kayıtları kapanmadan önce yaz
+    await ingestion_buffer.stop()
+    await fleet_snapshot.stop()
+    await websocket_manager.stop()
+    await oee_state.stop()
 
 @app.get("/")
 async def root():
@@ -35,6 +72,21 @@ async def root():
 async def health_check():
     return {"status": "healthy", "timestamp": "2024-01-01T00:00:00Z"}
 
+@app.get("/stats")
+async def runtime_stats():
+    """Önbellek, istek birleştirme, ingestion ve artımlı OEE sayaçları"""
+    return {
+        "result_cache": {**result_cache.stats, "entries": len(result_cache)},
+        "single_flight": {**single_flight.stats, "in_flight": single_flight.in_flight},
+        "ingestion": {**ingestion_buffer.stats, "pending": ingestion_buffer.pending_rows},
+        "oee_state": oee_state.stats,
+        "anomalies": anomaly_detector.stats,
+        "websocket": {**websocket_manager.stats, "clients": websocket_manager.client_count,
+                      "broadcast": websocket_manager.backend.stats},
+        "fleet_snapshot": fleet_snapshot.stats,
+        "hot_store": {**hot_store.stats, "machines": len(hot_store.machine_ids), "bytes": hot_store.nbytes}
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -1,17 +1,20 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 from typing import Dict, List
-from .database import MachineData, ProductionData, DowntimeReason
+from .database import Machine, ProductionData, DowntimeReason
+from app.services.state_interval_service import StateIntervalService
 
 class CalculationService:
     @staticmethod
-    def calculate_shift_efficiency(db: Session, machine_id: int, shift_date: str, shift_number: int) -> Dict:
+    async def calculate_shift_efficiency(db: AsyncSession, machine_id: int, shift_date: str, shift_number: int) -> Dict:
         """Vardiya bazlı verimlilik hesapları"""
-        production_data = db.query(ProductionData).filter(
+        result = await db.execute(select(ProductionData).where(
             ProductionData.machine_id == machine_id,
             ProductionData.shift_date == shift_date,
             ProductionData.shift_number == shift_number
-        ).first()
+        ))
+        production_data = result.scalars().first()
         
         if not production_data:
             return None
@@ -35,31 +38,30 @@ class CalculationService:
         }
     
     @staticmethod
-    def calculate_machine_utilization(db: Session, machine_id: int, start_time: datetime, end_time: datetime) -> float:
+    async def calculate_machine_utilization(db: AsyncSession, machine_id: int, start_time: datetime, end_time: datetime) -> float:
         """Makine kullanım oranını hesapla"""
         total_time = (end_time - start_time).total_seconds()
         
-        running_time = db.query(MachineData).filter(
-            MachineData.machine_id == machine_id,
-            MachineData.timestamp.between(start_time, end_time),
-            MachineData.status == "running"
-        ).count()
+        # Örnek sayısı yerine durum aralıklarının pencereye düşen süresi
+        durations = await StateIntervalService.state_durations(db, [machine_id], start_time, end_time)
+        running_time = durations.get(machine_id, {}).get("running", 0.0)
         
         return running_time / total_time if total_time > 0 else 0
     
     @staticmethod
-    def predict_maintenance(db: Session, machine_id: int) -> Dict:
+    async def predict_maintenance(db: AsyncSession, machine_id: int) -> Dict:
         """Tahmini bakım zamanını hesapla"""
         # Son bakım tarihini al
-        machine = db.query(Machine).filter(Machine.id == machine_id).first()
+        machine = await db.get(Machine, machine_id)
         if not machine or not machine.last_maintenance:
             return None
         
         # Ortalama arıza sıklığını hesapla
-        downtime_count = db.query(DowntimeReason).filter(
+        result = await db.execute(select(func.count()).select_from(DowntimeReason).where(
             DowntimeReason.machine_id == machine_id,
             DowntimeReason.category == "mechanical"
-        ).count()
+        ))
+        downtime_count = result.scalar()
         
         # Basit tahmin modeli
         days_since_maintenance = (datetime.now().date() - machine.last_maintenance.date()).days
@@ -68,7 +70,7 @@ class CalculationService:
             avg_downtime_interval = days_since_maintenance / downtime_count
             predicted_maintenance = machine.last_maintenance + timedelta(days=avg_downtime_interval * 0.8)
         else:
-            predicted_maintenance = machine.last_maintenance + timedelta(days=30)  Default 30 gün
+            predicted_maintenance = machine.last_maintenance + timedelta(days=30)  # Default 30 gün
         
         return {
             "last_maintenance": machine.last_maintenance,
@@ -1,15 +1,36 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Interval
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Interval, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from datetime import datetime
 import os
 from app.core.config import settings
 
+# Senkron sürücü URL'si -> async sürücü karşılığı
+ASYNC_DRIVERS = {
+    "postgresql://": "postgresql+asyncpg://",
+    "postgresql+psycopg2://": "postgresql+asyncpg://",
+    "sqlite://": "sqlite+aiosqlite://",
+}
+
+def make_async_url(url: str) -> str:
+    """Veritabanı URL'sini async sürücüye çevir"""
+    for prefix, async_prefix in ASYNC_DRIVERS.items():
+        if url.startswith(prefix):
+            return async_prefix + url[len(prefix):]
+    return url
+
 SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
+ASYNC_DATABASE_URL = make_async_url(SQLALCHEMY_DATABASE_URL)
 
+# Senkron engine yalnızca şema kurulumu ve betikler için
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# API istekleri event loop'u bloklamamak için async engine kullanır
+async_engine = create_async_engine(ASYNC_DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 class Machine(Base):
@@ -31,6 +52,10 @@ class Machine(Base):
 
 class MachineData(Base):
     __tablename__ = "machine_data"
+    __table_args__ = (
+        # Makine + zaman aralığı sorguları için; TimescaleDB'de hypertable'a taşınır
+        Index("ix_machine_data_machine_id_timestamp", "machine_id", "timestamp"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     machine_id = Column(Integer, ForeignKey("machines.id"))
@@ -40,6 +65,12 @@ class MachineData(Base):
     temperature = Column(Float, nullable=True)
     pressure = Column(Float, nullable=True)
     cycle_count = Column(Integer, nullable=True)
+    # Gateway'in örnek aralığı (istisna ile raporlamada son gönderimden bu yana) özetleri
+    current_min = Column(Float, nullable=True)
+    current_max = Column(Float, nullable=True)
+    current_rms = Column(Float, nullable=True)
+    current_charge = Column(Float, nullable=True)  # A·s, aralık boyunca integre edilmiş akım
+    cycle_time = Column(Float, nullable=True)  # saniye, aralıktaki vuruşların ortalama çevrim süresi
     operator_id = Column(Integer, nullable=True)
     
     # Relationships
@@ -78,6 +109,40 @@ class DowntimeReason(Base):
     # Relationships
     machine = relationship("Machine", back_populates="downtime_reasons")
 
+class MachineStateInterval(Base):
+    """Aynı durumdaki ardışık örneklerin tek aralığa sıkıştırılmış hali"""
+    __tablename__ = "machine_state_intervals"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    machine_id = Column(Integer, ForeignKey("machines.id"), nullable=False)
+    state = Column(String, nullable=False)
+    start_time = Column(DateTime, nullable=False)  # aralığın ilk örneği
+    end_time = Column(DateTime, nullable=False)  # kapalıysa sonraki durumun ilk örneği, açıksa son örnek
+    is_open = Column(Boolean, default=True, nullable=False)  # makinenin en son aralığı
+    
+    __table_args__ = (
+        Index("ix_machine_state_intervals_machine_id_start_time", "machine_id", "start_time"),
+    )
+
+class MachineAnomaly(Base):
+    """Ingestion sırasında çevrimiçi dedektörün işaretlediği örnek"""
+    __tablename__ = "machine_anomalies"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    machine_id = Column(Integer, ForeignKey("machines.id"), nullable=False)
+    timestamp = Column(DateTime, nullable=False)  # örneğin zamanı
+    metric = Column(String, nullable=False)  # current, temperature, cycle_time
+    value = Column(Float, nullable=False)
+    expected = Column(Float, nullable=False)  # örnek gelmeden önceki EWMA ortalaması
+    std = Column(Float, nullable=False)
+    z_score = Column(Float, nullable=False)
+    severity = Column(String, nullable=False)  # medium, high
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_machine_anomalies_machine_id_timestamp", "machine_id", "timestamp"),
+    )
+
 class Operator(Base):
     __tablename__ = "operators"
     
@@ -89,10 +154,21 @@ class Operator(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class OEEStateCheckpoint(Base):
+    """Artımlı OEE durumunun (örneklerden türetilen kısmı) periyodik kaydı"""
+    __tablename__ = "oee_state_checkpoints"
+    
+    machine_id = Column(Integer, ForeignKey("machines.id"), primary_key=True)
+    period = Column(String, primary_key=True)  # shift, day
+    period_start = Column(DateTime, nullable=False)
+    running_seconds = Column(Float, default=0.0)
+    cycle_min = Column(Integer, nullable=True)
+    cycle_max = Column(Integer, nullable=True)
+    last_status = Column(String, nullable=True)
+    last_timestamp = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
@@ -1,6 +1,15 @@
-from pydantic import BaseModel, Field
-from datetime import datetime
-from typing import Optional, List
+from pydantic import BaseModel, Field, field_validator
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, List
+
+# Tek bir toplu gönderimde kabul edilen en fazla kayıt sayısı
+MAX_BATCH_SIZE = 10000
+
+def to_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Zaman damgasını veritabanı kolonları gibi naive UTC'ye çevir"""
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
 
 class MachineBase(BaseModel):
     name: str
@@ -27,12 +36,32 @@ class MachineDataBase(BaseModel):
     temperature: Optional[float] = None
     pressure: Optional[float] = None
     cycle_count: Optional[int] = None
+    current_min: Optional[float] = None
+    current_max: Optional[float] = None
+    current_rms: Optional[float] = None
+    current_charge: Optional[float] = None
+    cycle_time: Optional[float] = None
+    timestamp: Optional[datetime] = None
+
+    @field_validator("timestamp")
+    @classmethod
+    def normalize_timestamp(cls, value: Optional[datetime]) -> Optional[datetime]:
+        return to_naive_utc(value)
 
 class MachineDataCreate(MachineDataBase):
     pass
 
+class MachineDataBatch(BaseModel):
+    records: List[MachineDataCreate] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+class MachineDataBatchAck(BaseModel):
+    message: str
+    accepted: int
+    durable: bool  # True: kayıtlar yanıt verilmeden önce veritabanına yazıldı
+    machine_ids: List[int]
+
 class MachineData(MachineDataBase):
-    id: int
+    id: Optional[int] = None  # bellek içi katmandan dönen örneklerin id'si yok
     timestamp: datetime
     
     class Config:
@@ -57,6 +86,47 @@ class ProductionData(ProductionDataBase):
     class Config:
         from_attributes = True
 
+class DowntimeReasonUpdate(BaseModel):
+    reason: str
+    category: str
+
+class DowntimeReason(DowntimeReasonUpdate):
+    id: int
+    machine_id: int
+    start_time: datetime
+    end_time: Optional[datetime] = None
+    duration: Optional[timedelta] = None
+    operator_id: Optional[int] = None
+    resolved: bool = False
+    
+    class Config:
+        from_attributes = True
+
+class Anomaly(BaseModel):
+    id: int
+    machine_id: int
+    timestamp: datetime
+    metric: str
+    value: float
+    expected: float
+    std: float
+    z_score: float
+    severity: str
+    
+    class Config:
+        from_attributes = True
+
+class FleetMachineState(BaseModel):
+    status: Optional[str] = None
+    current: Optional[float] = None
+    temperature: Optional[float] = None
+    oee: Optional[float] = None  # içinde bulunulan vardiya
+    updated: Optional[datetime] = None
+
+class FleetSnapshot(BaseModel):
+    timestamp: datetime
+    machines: Dict[int, FleetMachineState]
+
 class OEEData(BaseModel):
     machine_id: int
     availability: float = Field(..., ge=0, le=1)
@@ -65,6 +135,29 @@ class OEEData(BaseModel):
     oee: float = Field(..., ge=0, le=1)
     timestamp: datetime
 
+class ShiftOEE(BaseModel):
+    bucket_start: datetime
+    shift_date: str
+    shift_number: int
+    availability: float = Field(..., ge=0, le=1)
+    performance: float = Field(..., ge=0, le=1)
+    quality: float = Field(..., ge=0, le=1)
+    oee: float = Field(..., ge=0, le=1)
+    running_seconds: float
+    downtime_seconds: float
+
+class FleetOEEData(BaseModel):
+    machine_id: int
+    name: str
+    type: str
+    availability: float = Field(..., ge=0, le=1)
+    performance: float = Field(..., ge=0, le=1)
+    quality: float = Field(..., ge=0, le=1)
+    oee: float = Field(..., ge=0, le=1)
+    running_seconds: float
+    downtime_seconds: float
+    shifts: Optional[List[ShiftOEE]] = None
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import math
+import numpy as np
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import func, insert, select
+from app.core.config import settings
+from app.models.database import AsyncSessionLocal, MachineData, MachineAnomaly
+from app.services.websocket_service import websocket_manager
+from app.services.hot_store_service import hot_store
+
+logger = logging.getLogger(__name__)
+
+# İzlenen metrik -> machine_data kolonu (cycle_time sayaç artışlarından türetilir)
+ANOMALY_COLUMNS = {"current": "current_consumption", "temperature": "temperature"}
+ANOMALY_METRICS = tuple(ANOMALY_COLUMNS) + ("cycle_time",)
+
+class _EWMA:
+    """Üstel ağırlıklı ortalama/varyans; ilk 1/alpha örnekte Welford ile aynı"""
+    __slots__ = ("count", "mean", "var")
+
+    def __init__(self, count: int = 0, mean: float = 0.0, var: float = 0.0):
+        self.count = count
+        self.mean = mean
+        self.var = var
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.var)
+
+    def update(self, value: float, alpha: float):
+        self.count += 1
+        # Isınma süresince eşit ağırlık, sonra sabit alpha (yavaş kaymaya uyum sağlar)
+        weight = max(alpha, 1.0 / self.count)
+        diff = value - self.mean
+        increment = weight * diff
+        self.mean += increment
+        self.var = (1 - weight) * (self.var + diff * increment)
+
+class AnomalyDetector:
+    """Ingestion akışında makine başına sabit bellekli çevrimiçi anomali tespiti"""
+    def __init__(
+        self,
+        alpha: float = settings.ANOMALY_EWMA_ALPHA,
+        warmup: int = settings.ANOMALY_WARMUP_SAMPLES,
+        threshold: float = settings.ANOMALY_Z_THRESHOLD,
+        high_threshold: float = settings.ANOMALY_HIGH_Z
+    ):
+        self.alpha = alpha
+        self.warmup = warmup
+        self.threshold = threshold
+        self.high_threshold = high_threshold
+
+        self._baselines: Dict[Tuple[int, str], _EWMA] = {}
+        self._last_seen: Dict[int, datetime] = {}
+        # machine_id -> (zaman, sayaç, çevrim başına hizalı mı)
+        self._cycle_anchors: Dict[int, Tuple[datetime, int, bool]] = {}
+        self._broadcasts: Set[asyncio.Task] = set()
+
+        self.stats = {"observed": 0, "anomalies": 0, "recorded": 0}
+
+    def observe(self, rows: Iterable[Dict]) -> List[Dict]:
+        """Yazılmış satırları taban çizgilerine işle, anomali kayıtlarını döndür"""
+        anomalies = []
+        for row in sorted(rows, key=lambda row: (row["machine_id"], row["timestamp"])):
+            machine_id, timestamp = row["machine_id"], row["timestamp"]
+            # Geç gelen örnekler taban çizgisini geriye doğru bozmasın
+            last_seen = self._last_seen.get(machine_id)
+            if last_seen is not None and timestamp < last_seen:
+                continue
+            self._last_seen[machine_id] = timestamp
+            self.stats["observed"] += 1
+
+            for metric, column in ANOMALY_COLUMNS.items():
+                if row.get(column) is not None:
+                    self._check(anomalies, machine_id, timestamp, metric, float(row[column]))
+
+            cycle_time = self._cycle_time(machine_id, timestamp, row["status"], row.get("cycle_count"))
+            if cycle_time is not None:
+                self._check(anomalies, machine_id, timestamp, "cycle_time", cycle_time)
+
+        self.stats["anomalies"] += len(anomalies)
+        return anomalies
+
+    def _check(self, anomalies: List[Dict], machine_id: int, timestamp: datetime, metric: str, value: float):
+        baseline = self._baselines.get((machine_id, metric))
+        if baseline is None:
+            baseline = self._baselines[(machine_id, metric)] = _EWMA()
+
+        std = baseline.std
+        update_value = value
+        if baseline.count >= self.warmup and std > 0:
+            z_score = (value - baseline.mean) / std
+            if abs(z_score) > self.threshold:
+                anomalies.append({
+                    "machine_id": machine_id,
+                    "timestamp": timestamp,
+                    "metric": metric,
+                    "value": value,
+                    "expected": baseline.mean,
+                    "std": std,
+                    "z_score": round(z_score, 2),
+                    "severity": "high" if abs(z_score) > self.high_threshold else "medium"
+                })
+                # Tek bir sıçrama varyansı şişirmesin; kalıcı seviye değişimine yine yavaşça uyulur
+                update_value = baseline.mean + math.copysign(self.threshold * std, z_score)
+        baseline.update(update_value, self.alpha)
+
+    def _cycle_time(self, machine_id: int, timestamp: datetime, status: str, cycle_count: Optional[int]) -> Optional[float]:
+        """Çalışırken iki sayaç artışı arasındaki süre / artış miktarı"""
+        if status != "running" or cycle_count is None:
+            self._cycle_anchors.pop(machine_id, None)
+            return None
+
+        anchor = self._cycle_anchors.get(machine_id)
+        if anchor is None or cycle_count < anchor[1]:
+            # Çalışmaya yeni geçti ya da sayaç sıfırlandı: ilk artışa kadar süre yarım çevrimdir
+            self._cycle_anchors[machine_id] = (timestamp, cycle_count, False)
+            return None
+        anchor_time, anchor_count, aligned = anchor
+        if cycle_count == anchor_count:
+            return None
+
+        self._cycle_anchors[machine_id] = (timestamp, cycle_count, True)
+        if not aligned:
+            return None
+        return (timestamp - anchor_time).total_seconds() / (cycle_count - anchor_count)
+
+    async def load(self):
+        """Akım ve sıcaklık taban çizgilerini son saatlerin ortalama/varyansıyla başlat"""
+        now = datetime.utcnow()
+        since = now - timedelta(hours=settings.ANOMALY_SEED_HOURS)
+
+        # Pencere bellek içi katmandaysa veritabanına gidilmez
+        seeded = []
+        for machine_id in hot_store.machine_ids:
+            window = hot_store.window(machine_id, since, now)
+            if window is None:
+                continue
+            seeded.append(machine_id)
+            for metric, column in ANOMALY_COLUMNS.items():
+                values = window[column][~np.isnan(window[column])]
+                if len(values):
+                    self._baselines[(machine_id, metric)] = _EWMA(len(values), float(values.mean()), float(values.var()))
+
+        # Katmanda olmayan ya da bellek sınırı yüzünden alınmayan makineler
+        if len(seeded) < len(hot_store.machine_ids) or not hot_store.loaded or hot_store.stats["rejected_machines"]:
+            await self._load_from_database(since, exclude=seeded)
+
+        logger.info("Anomaly baselines seeded for %d machine metrics", len(self._baselines))
+
+    async def _load_from_database(self, since: datetime, exclude: List[int]):
+        columns = [(metric, getattr(MachineData, column)) for metric, column in ANOMALY_COLUMNS.items()]
+        query = select(
+            MachineData.machine_id,
+            *[
+                aggregate
+                for _, column in columns
+                for aggregate in (func.count(column), func.avg(column), func.avg(column * column))
+            ]
+        ).where(
+            MachineData.timestamp >= since
+        ).group_by(MachineData.machine_id)
+        if exclude:
+            query = query.where(MachineData.machine_id.notin_(exclude))
+
+        async with AsyncSessionLocal() as db:
+            for row in await db.execute(query):
+                machine_id, values = row[0], row[1:]
+                for index, (metric, _) in enumerate(columns):
+                    count, mean, mean_square = values[3 * index:3 * index + 3]
+                    if count:
+                        mean = float(mean)
+                        var = max(float(mean_square) - mean * mean, 0.0)
+                        self._baselines[(machine_id, metric)] = _EWMA(count, mean, var)
+
+    async def record(self, anomalies: List[Dict]):
+        """Anomalileri kaydet ve makineyi izleyen istemcilere hemen gönder"""
+        if not anomalies:
+            return
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(insert(MachineAnomaly), anomalies)
+                await db.commit()
+            self.stats["recorded"] += len(anomalies)
+        except Exception:
+            logger.exception("Failed to record %d anomalies", len(anomalies))
+
+        # Yavaş istemciler ingestion'ı bekletmesin
+        task = asyncio.ensure_future(websocket_manager.broadcast_anomalies(anomalies))
+        self._broadcasts.add(task)
+        task.add_done_callback(self._broadcasts.discard)
+
+# Global anomaly detector instance
+anomaly_detector = AnomalyDetector()
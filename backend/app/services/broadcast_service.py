@@ -0,0 +1,167 @@
+import asyncio
+import json
+import logging
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy.engine import make_url
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_BACKENDS = ("memory", "postgres")
+
+# Bağlantı koparsa yeniden deneme aralığı (saniye)
+RECONNECT_DELAY = 1.0
+
+# Yerel teslim: (mesaj, kodlanmış metin ya da None, başka worker'dan mı geldi)
+Deliver = Callable[[Dict, Optional[str], bool], None]
+
+class InProcessBroadcast:
+    """Varsayılan: mesajlar yalnızca bu worker'ın istemcilerine gider"""
+    def __init__(self, deliver: Deliver):
+        self.deliver = deliver
+        self.stats = {"backend": "memory"}
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def publish(self, message: Dict, text: str):
+        self.deliver(message, text, False)
+
+class PostgresBroadcast:
+    """Worker'lar arası yayın: mevcut PostgreSQL üzerinde LISTEN/NOTIFY, ek servis gerekmez"""
+    def __init__(
+        self,
+        deliver: Deliver,
+        database_url: str,
+        channel: str = settings.WS_NOTIFY_CHANNEL,
+        interval: float = settings.WS_NOTIFY_INTERVAL,
+        max_payload: int = settings.WS_NOTIFY_MAX_PAYLOAD
+    ):
+        self.deliver = deliver
+        # asyncpg doğrudan kullanılır; SQLAlchemy sürücü öneki atılır
+        self.dsn = make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+        self.channel = channel
+        self.interval = interval
+        self.max_payload = max_payload
+        # Kendi bildirimlerini tanımak için; yerel istemcilere publish anında teslim edilir
+        self.worker_id = uuid.uuid4().hex[:12]
+
+        # Aralık içinde durum mesajlarının yalnızca sonuncusu gider, olaylar sırayla
+        self._pending_state: Dict[Tuple[int, str], str] = {}
+        self._pending_events: List[str] = []
+        self._wakeup = asyncio.Event()
+        self._connection = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.stats = {"backend": "postgres", "notifies": 0, "messages_out": 0, "messages_in": 0,
+                      "conflated": 0, "oversized": 0, "lost": 0, "reconnects": 0}
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self._stopping = False
+        await self._connect()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Bekleyen mesajları gönder ve bağlantıyı kapat"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        if self._connection is not None and not self._connection.is_closed():
+            await self._connection.close()
+        self._connection = None
+
+    def publish(self, message: Dict, text: str):
+        # Yerel istemciler NOTIFY turunu beklemez
+        self.deliver(message, text, False)
+
+        if message["type"] in ("machine_update", "oee_update"):
+            key = (message["machine_id"], message["type"])
+            if key in self._pending_state:
+                self.stats["conflated"] += 1
+            self._pending_state[key] = text
+        else:
+            self._pending_events.append(text)
+        self._wakeup.set()
+
+    async def _connect(self):
+        # Yalnızca bu backend seçildiğinde gerekir (SQLite ile geliştirmede yüklü olmayabilir)
+        import asyncpg
+
+        self._connection = await asyncpg.connect(self.dsn)
+        await self._connection.add_listener(self.channel, self._on_notify)
+        # Dinleyen bağlantı koparsa yayın olmasa da yeniden bağlan
+        self._connection.add_termination_listener(lambda connection: self._wakeup.set())
+
+    def _on_notify(self, connection, pid: int, channel: str, payload: str):
+        try:
+            envelope = json.loads(payload)
+        except ValueError:
+            logger.warning("Ignoring malformed notification on %s", channel)
+            return
+        if envelope.get("origin") == self.worker_id:
+            return
+        for message in envelope.get("messages", []):
+            self.stats["messages_in"] += 1
+            self.deliver(message, None, True)
+
+    def _payloads(self, texts: List[str]) -> List[str]:
+        """Mesajları NOTIFY sınırına (varsayılan 8000 bayt) sığan zarflara böl"""
+        prefix = '{"origin":"%s","messages":[' % self.worker_id
+        suffix = "]}"
+        overhead = len(prefix) + len(suffix)
+
+        payloads, chunk, size = [], [], overhead
+        for text in texts:
+            # +1: liste ayracı
+            length = len(text.encode("utf-8")) + 1
+            if overhead + length > self.max_payload:
+                self.stats["oversized"] += 1
+                logger.warning("Dropping %d byte websocket message: exceeds NOTIFY payload limit", length)
+                continue
+            if chunk and size + length > self.max_payload:
+                payloads.append(prefix + ",".join(chunk) + suffix)
+                chunk, size = [], overhead
+            chunk.append(text)
+            size += length
+        if chunk:
+            payloads.append(prefix + ",".join(chunk) + suffix)
+        return payloads
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            if not self._stopping:
+                # Aralık boyunca gelenler birkaç NOTIFY'da toplanır
+                await asyncio.sleep(self.interval)
+            self._wakeup.clear()
+
+            texts = self._pending_events + list(self._pending_state.values())
+            self._pending_events, self._pending_state = [], {}
+            try:
+                if self._connection is None or self._connection.is_closed():
+                    self.stats["reconnects"] += 1
+                    await self._connect()
+                for payload in self._payloads(texts):
+                    await self._connection.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+                    self.stats["notifies"] += 1
+                self.stats["messages_out"] += len(texts)
+            except Exception:
+                # Canlı güncellemeler yeniden gönderilmez; makinenin sonraki durumu eksiği kapatır
+                self.stats["lost"] += len(texts)
+                logger.exception("Websocket broadcast over NOTIFY failed, %d messages lost", len(texts))
+                if not self._stopping:
+                    await asyncio.sleep(RECONNECT_DELAY)
+                    self._wakeup.set()
+
+            if self._stopping:
+                return
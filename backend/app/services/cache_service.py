@@ -0,0 +1,158 @@
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set
+from app.core.config import settings
+
+class _Entry:
+    """Önbellekteki sonuç ve kapsadığı makine/zaman penceresi"""
+    __slots__ = ("value", "expires_at", "machine_id", "start_time", "end_time", "stale")
+
+    def __init__(self, value: Any, expires_at: Optional[float], machine_id: Optional[int],
+                 start_time: Optional[datetime], end_time: Optional[datetime]):
+        self.value = value
+        self.expires_at = expires_at
+        self.machine_id = machine_id
+        self.start_time = start_time
+        self.end_time = end_time
+        self.stale = False
+
+    def overlaps(self, start_time: datetime, end_time: datetime) -> bool:
+        return (self.start_time is None or self.start_time <= end_time) and \
+            (self.end_time is None or self.end_time >= start_time)
+
+class SingleFlight:
+    """Aynı anahtarlı eşzamanlı hesapları tek bir çalışmada birleştir"""
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.stats = {"executed": 0, "coalesced": 0}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Aynı anahtar için süren hesap varsa onun sonucunu bekle, yoksa başlat"""
+        task = self._calls.get(key)
+        if task is None:
+            # Ayrı görev: ilk isteğin iptali bekleyen diğer istekleri etkilemez
+            task = asyncio.ensure_future(compute())
+            self._calls[key] = task
+            task.add_done_callback(lambda _, key=key: self._calls.pop(key, None))
+            self.stats["executed"] += 1
+        else:
+            self.stats["coalesced"] += 1
+        return await asyncio.shield(task)
+
+class ResultCache:
+    """Endpoint sonuçları için LRU + TTL önbellek, pencereye düşen yeni veriyle geçersizlenir"""
+    def __init__(self, max_entries: int = settings.RESULT_CACHE_MAX_ENTRIES, ttl: float = settings.RESULT_CACHE_TTL,
+                 flights: Optional[SingleFlight] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Önbellekte olmayan aynı sonuç için eşzamanlı istekler tek hesapta birleşir
+        self.flights = flights or SingleFlight()
+
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        # machine_id -> anahtarlar; None tüm makineleri kapsayan (filo) sonuçlar
+        self._by_machine: Dict[Optional[int], Set[Hashable]] = {}
+        # Sürmekte olan hesaplar; bu sırada gelen geçersizleme eski sonucun yazılmasını engeller
+        self._inflight: Set[_Entry] = set()
+
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at is not None and entry.expires_at <= time.monotonic():
+            self._remove(key)
+            self.stats["expirations"] += 1
+            entry = None
+
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry.value
+
+    def set(self, key: Hashable, value: Any, machine_id: Optional[int],
+            start_time: Optional[datetime] = None, end_time: Optional[datetime] = None):
+        """Sonucu sakla; kapanmış pencereler süresiz, "şimdi"yi kapsayanlar TTL ile"""
+        closed = end_time is not None and end_time < datetime.utcnow()
+        expires_at = None if closed else time.monotonic() + self.ttl
+
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = _Entry(value, expires_at, machine_id, start_time, end_time)
+        self._by_machine.setdefault(machine_id, set()).add(key)
+
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.stats["evictions"] += 1
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]], machine_id: Optional[int],
+                             start_time: Optional[datetime] = None, end_time: Optional[datetime] = None) -> Any:
+        value = self.get(key)
+        if value is None:
+            value = await self.flights.do(key, lambda: self._compute(key, compute, machine_id, start_time, end_time))
+        return value
+
+    async def _compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]], machine_id: Optional[int],
+                       start_time: Optional[datetime], end_time: Optional[datetime]) -> Any:
+        pending = _Entry(None, None, machine_id, start_time, end_time)
+        self._inflight.add(pending)
+        try:
+            value = await compute()
+        finally:
+            self._inflight.discard(pending)
+        if not pending.stale:
+            self.set(key, value, machine_id, start_time, end_time)
+        return value
+
+    def invalidate(self, machine_id: int, start_time: datetime, end_time: datetime) -> int:
+        """Makinenin (ve filo sonuçlarının) [start_time, end_time] ile kesişen kayıtlarını sil"""
+        stale = [
+            key
+            for owner in (machine_id, None)
+            for key in self._by_machine.get(owner, ())
+            if self._entries[key].overlaps(start_time, end_time)
+        ]
+        for key in stale:
+            self._remove(key)
+        for pending in self._inflight:
+            if pending.machine_id in (machine_id, None) and pending.overlaps(start_time, end_time):
+                pending.stale = True
+        self.stats["invalidations"] += len(stale)
+        return len(stale)
+
+    def invalidate_shift_date(self, machine_id: int, shift_date: str) -> int:
+        """Üretim kaydı değişince o günü kapsayan kayıtları sil"""
+        try:
+            day = datetime.fromisoformat(shift_date)
+        except ValueError:
+            return self.invalidate(machine_id, datetime.min, datetime.max)
+        return self.invalidate(machine_id, day, day + timedelta(days=1))
+
+    def clear(self):
+        self._entries.clear()
+        self._by_machine.clear()
+        for pending in self._inflight:
+            pending.stale = True
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key)
+        keys = self._by_machine.get(entry.machine_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_machine[entry.machine_id]
+
+# Global instances
+single_flight = SingleFlight()
+result_cache = ResultCache(flights=single_flight)
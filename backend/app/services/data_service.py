@@ -1,93 +1,388 @@
+import bisect
+import math
+import numpy as np
 import pandas as pd
-from sqlalchemy.orm import Session
+from sqlalchemy import case, func, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
-from typing import List, Dict
-from app.models.database import MachineData
+from typing import List, Dict, Optional
+from app.models.database import MachineData, MachineAnomaly
+from app.services.state_interval_service import StateIntervalService
+from app.services.downsample_service import Downsampler
+from app.services.hot_store_service import hot_store, HOT_COLUMNS, HOT_INTEGER_COLUMNS, EPOCH, to_epoch
+from app.database.sql_functions import bucket_floor, seconds_between
+
+# Özet kovalarındaki ölçümler: kolon -> yanıttaki alan öneki
+SUMMARY_METRICS = {"current_consumption": "current", "temperature": "temperature"}
+# Kova özetinin sorgu sırasıyla ortak alanları (ölçüm istatistikleri hariç)
+SUMMARY_FIELDS = ("samples", "rows", "seconds", "running_seconds", "running_rows", "cycle_count",
+                  "spill", "last_running", "last_cycle_count")
 
 class DataService:
     @staticmethod
-    def get_machine_data_history(db: Session, machine_id: int, hours: int = 24) -> List[Dict]:
-        """Makine veri geçmişini getir"""
-        end_time = datetime.now()
+    async def bulk_insert_machine_data(db: AsyncSession, records: List[Dict]) -> int:
+        """Sensör kayıtlarını tek bir çok satırlı INSERT ile yaz"""
+        if not records:
+            return 0
+        
+        # Zaman damgası gelmeyen kayıtlar sunucunun alış zamanını alır
+        received_at = datetime.utcnow()
+        rows = [
+            {**record, "timestamp": record.get("timestamp") or received_at}
+            for record in records
+        ]
+        
+        await db.execute(insert(MachineData), rows)
+        # Durum aralıkları örneklerle aynı transaction'da güncellenir
+        await StateIntervalService.apply(db, rows)
+        await db.commit()
+        return len(rows)
+
+    @staticmethod
+    async def get_machine_data_history(db: AsyncSession, machine_id: int, hours: int = 24,
+                                       max_points: Optional[int] = None,
+                                       metric: str = "current_consumption") -> List[Dict]:
+        """Makine veri geçmişini getir; max_points verilirse metriğin şekli korunarak seyreltilir"""
+        end_time = datetime.utcnow()
         start_time = end_time - timedelta(hours=hours)
+        return await DataService.get_machine_data_window(db, machine_id, start_time, end_time, max_points, metric)
+
+    @staticmethod
+    async def get_machine_data_window(db: AsyncSession, machine_id: int, start_time: datetime, end_time: datetime,
+                                      max_points: Optional[int] = None, metric: str = "current_consumption") -> List[Dict]:
+        """Penceredeki örnekler (ORM nesnesi yerine kolonlar), isteğe bağlı LTTB ile en fazla max_points satır"""
+        # Son saatler bellek içi katmandan; daha eski pencereler veritabanından.
+        # Pencere başından önceki son örnek (en fazla hold_limit geride) başlangıca taşınır:
+        # gateway değişmeyen değerleri göndermez, değer bir sonraki örneğe kadar geçerlidir
+        hold_start = start_time - DataService.hold_limit()
+        window = hot_store.window(machine_id, hold_start, end_time)
+        if window is not None:
+            first = DataService._carry_in_index(window["timestamp"], to_epoch(start_time))
+            window = {name: values[first:] for name, values in window.items()}
+            if len(window["timestamp"]):
+                window["timestamp"][0] = max(window["timestamp"][0], to_epoch(start_time))
+            indices = DataService._downsample_indices(window["timestamp"], window[metric], max_points)
+            statuses = hot_store.status_names
+            # Tamsayı kolonlar veritabanı yoluyla aynı tipte döner (123.0 değil 123)
+            columns = {
+                name: [
+                    None if math.isnan(value) else int(value) if name in HOT_INTEGER_COLUMNS else value
+                    for value in window[name][indices].tolist()
+                ]
+                for name in HOT_COLUMNS
+            }
+            return [
+                {
+                    "machine_id": machine_id,
+                    "timestamp": EPOCH + timedelta(seconds=timestamp),
+                    "status": statuses[status],
+                    **{name: columns[name][position] for name in HOT_COLUMNS}
+                }
+                for position, (timestamp, status) in enumerate(zip(
+                    window["timestamp"][indices].tolist(), window["status"][indices].tolist()
+                ))
+            ]
         
-        data = db.query(MachineData).filter(
+        result = await db.execute(select(
+            MachineData.machine_id,
+            MachineData.timestamp,
+            MachineData.status,
+            *[getattr(MachineData, name) for name in HOT_COLUMNS]
+        ).where(
             MachineData.machine_id == machine_id,
-            MachineData.timestamp.between(start_time, end_time)
-        ).order_by(MachineData.timestamp.asc()).all()
+            MachineData.timestamp.between(hold_start, end_time)
+        ).order_by(MachineData.timestamp.asc()))
+        rows = result.all()
+        rows = rows[DataService._carry_in_index([row.timestamp for row in rows], start_time):]
         
-        return [
-            {
-                "timestamp": record.timestamp,
-                "status": record.status,
-                "current_consumption": record.current_consumption,
-                "temperature": record.temperature,
-                "cycle_count": record.cycle_count
-            }
-            for record in data
-        ]
-    
+        if max_points is not None and len(rows) > max_points:
+            x = np.fromiter((to_epoch(row.timestamp) for row in rows), dtype=np.float64, count=len(rows))
+            y = np.fromiter((np.nan if getattr(row, metric) is None else getattr(row, metric) for row in rows),
+                            dtype=np.float64, count=len(rows))
+            rows = [rows[index] for index in DataService._downsample_indices(x, y, max_points)]
+        
+        rows = [row._asdict() for row in rows]
+        if rows and rows[0]["timestamp"] < start_time:
+            rows[0]["timestamp"] = start_time
+        return rows
+
+    @staticmethod
+    def hold_limit() -> timedelta:
+        """Bir örneğin değerinin geçerli sayıldığı en uzun süre (durum aralıklarıyla aynı sınır)"""
+        return StateIntervalService.hold_limit()
+
     @staticmethod
-    def analyze_energy_consumption(db: Session, machine_id: int, start_time: datetime, end_time: datetime) -> Dict:
-        """Enerji tüketim analizi"""
-        data = db.query(MachineData).filter(
+    def _carry_in_index(timestamps, start) -> int:
+        """Sıralı zamanlarda pencerenin ilk örneği; başlangıçta örnek yoksa ondan önceki son örnek"""
+        first = bisect.bisect_left(timestamps, start)
+        if first == 0 or (first < len(timestamps) and timestamps[first] == start):
+            return first
+        return first - 1
+
+    @staticmethod
+    def _downsample_indices(timestamps: np.ndarray, values: np.ndarray, max_points: Optional[int]) -> np.ndarray:
+        if max_points is None or len(timestamps) <= max_points:
+            return np.arange(len(timestamps))
+        return Downsampler.lttb_indices(timestamps, Downsampler.fill_gaps(values), max_points)
+
+    @staticmethod
+    async def get_machine_data_summary(db: AsyncSession, machine_id: int, start_time: datetime, end_time: datetime,
+                                       max_points: int) -> List[Dict]:
+        """Pencereyi en fazla max_points eşit kovaya bölüp kova başına min/max/zaman ağırlıklı ortalama (bellekte ya da SQL'de)"""
+        width = max(math.ceil((end_time - start_time).total_seconds() / max_points), 1)
+        # Kovalar pencere başına hizalanır: kova sayısı max_points'i aşmaz
+        offset = int(to_epoch(start_time)) % width
+        
+        # Örnek bir sonrakine kadar (en fazla hold_limit) geçerlidir; pencere başından önceki son örnek
+        # başlangıçtan itibaren, son örnek pencere sonuna (ya da şimdiye) kadar sayılır
+        hold = DataService.hold_limit()
+        hold_until = min(end_time, datetime.utcnow())
+        
+        window = hot_store.window(machine_id, start_time - hold, end_time)
+        if window is not None:
+            return DataService._hold_buckets(DataService._summarize_columns(
+                window, width, offset, to_epoch(start_time), to_epoch(hold_until), hold.total_seconds()
+            ), width)
+        
+        samples = select(
+            MachineData.timestamp,
+            MachineData.status,
+            MachineData.current_consumption,
+            MachineData.temperature,
+            MachineData.cycle_count,
+            func.lead(MachineData.timestamp).over(order_by=MachineData.timestamp).label("next_timestamp")
+        ).where(
             MachineData.machine_id == machine_id,
-            MachineData.timestamp.between(start_time, end_time),
-            MachineData.current_consumption.isnot(None)
-        ).all()
+            MachineData.timestamp.between(start_time - hold, end_time)
+        ).subquery()
+        
+        gap = seconds_between(samples.c.timestamp, func.coalesce(samples.c.next_timestamp, hold_until))
+        carried = samples.c.timestamp < start_time
+        held = case(
+            (gap > hold.total_seconds(), hold.total_seconds()),
+            (gap < 0, 0),
+            else_=gap
+        ) - case((carried, seconds_between(samples.c.timestamp, start_time)), else_=0)
+        begin = case((carried, start_time), else_=samples.c.timestamp)
+        # Kova ifadesi bağlı parametre içerdiğinden GROUP BY'da birebir aynı kalsın diye alt sorguda hesaplanır
+        held_samples = select(
+            bucket_floor(begin, width, offset).label("bucket"),
+            begin.label("begin"),
+            held.label("held"),
+            case((carried, 0), else_=1).label("in_window"),
+            samples.c.status,
+            samples.c.current_consumption,
+            samples.c.temperature,
+            samples.c.cycle_count
+        ).where(or_(~carried, held > 0)).subquery()
         
-        if not data:
-            return None
+        # Kovaya sığmayan tutma süresi (taşma) sonraki kovalara kovanın son örneğiyle yazılır
+        room = width - seconds_between(held_samples.c.bucket, held_samples.c.begin)
+        piece = case((held_samples.c.held > room, room), else_=held_samples.c.held)
+        pieces = select(
+            held_samples,
+            piece.label("piece"),
+            (held_samples.c.held - piece).label("spill"),
+            func.row_number().over(
+                partition_by=held_samples.c.bucket,
+                order_by=held_samples.c.begin.desc()
+            ).label("from_end")
+        ).subquery()
+        
+        running = pieces.c.status == "running"
+        last = pieces.c.from_end == 1
+        metric_columns = []
+        for name in SUMMARY_METRICS:
+            value = pieces.c[name]
+            metric_columns += [
+                func.sum(value * pieces.c.piece),
+                func.sum(case((value.isnot(None), pieces.c.piece), else_=0)),
+                func.sum(value),
+                func.count(value),
+                func.min(value),
+                func.max(value),
+                func.max(case((last, value)))
+            ]
+        result = await db.execute(select(
+            pieces.c.bucket,
+            func.sum(pieces.c.in_window),
+            func.count(),
+            func.sum(pieces.c.piece),
+            func.sum(case((running, pieces.c.piece), else_=0)),
+            func.sum(case((running, 1), else_=0)),
+            func.max(pieces.c.cycle_count),
+            func.max(case((last, pieces.c.spill))),
+            func.max(case((last & running, 1), else_=0)),
+            func.max(case((last, pieces.c.cycle_count))),
+            *metric_columns
+        ).group_by(pieces.c.bucket).order_by(pieces.c.bucket))
+        
+        partials = []
+        for row in result:
+            partial = dict(zip(SUMMARY_FIELDS, row[1:10]))
+            partial["bucket"] = to_epoch(row[0])
+            for index, name in enumerate(SUMMARY_METRICS):
+                partial[name] = row[10 + index * 7:17 + index * 7]
+            partials.append(partial)
+        return DataService._hold_buckets(partials, width)
+
+    @staticmethod
+    def _summarize_columns(window: Dict[str, np.ndarray], width: int, offset: int, start: float, until: float,
+                           hold: float) -> List[Dict]:
+        """Bellek içi kolonlardan get_machine_data_summary'deki SQL ile aynı kova özetleri"""
+        first = DataService._carry_in_index(window["timestamp"], start)
+        timestamps = window["timestamp"][first:]
+        if not len(timestamps):
+            return []
+        following = np.append(timestamps[1:], until)
+        held = np.clip(following - timestamps, 0, hold) - np.maximum(start - timestamps, 0)
+        # Eski (hold_limit'i aşmış) taşınan örnek sayılmaz
+        keep = (timestamps >= start) | (held > 0)
+        columns = {name: window[name][first:][keep] for name in ("status", "cycle_count", *SUMMARY_METRICS)}
+        in_window = (timestamps >= start)[keep]
+        held = held[keep]
+        if not len(held):
+            return []
+        begins = np.maximum(timestamps[keep], start)
         
-        # Voltaj değeri (380V tipik endüstriyel voltaj)
-        voltage = 380
+        buckets = np.floor((begins - offset) / width).astype(np.int64)
+        pieces = np.minimum(held, (buckets + 1) * width + offset - begins)
+        spills = held - pieces
+        # Satırlar zaman sıralı: her kova ardışık bir dilim
+        starts = np.flatnonzero(np.diff(buckets, prepend=buckets[0] - 1))
+        lasts = np.append(starts[1:], len(buckets)) - 1
         
-        current_values = [record.current_consumption for record in data]
-        power_values = [current * voltage for current in current_values]
+        def total(values: np.ndarray) -> list:
+            return np.add.reduceat(values, starts).tolist()
         
-        total_energy = sum(power_values) / 1000  # kWh
-        avg_power = sum(power_values) / len(power_values) if power_values else 0
-        max_power = max(power_values) if power_values else 0
+        def clean(values: np.ndarray) -> list:
+            return [None if math.isnan(value) else value for value in values.tolist()]
         
-        return {
-            "total_energy_kwh": round(total_energy, 2),
-            "average_power_kw": round(avg_power / 1000, 2),
-            "max_power_kw": round(max_power / 1000, 2),
-            "data_points": len(data)
+        running = columns["status"] == hot_store.status_code("running")
+        fields = {
+            "samples": total(in_window.astype(np.int64)),
+            "rows": np.diff(np.append(starts, len(buckets))).tolist(),
+            "seconds": total(pieces),
+            "running_seconds": total(np.where(running, pieces, 0.0)),
+            "running_rows": total(running.astype(np.int64)),
+            "cycle_count": clean(np.fmax.reduceat(columns["cycle_count"], starts)),
+            "spill": spills[lasts].tolist(),
+            "last_running": running[lasts].tolist(),
+            "last_cycle_count": clean(columns["cycle_count"][lasts])
         }
-    
+        metrics = {}
+        for name in SUMMARY_METRICS:
+            values = columns[name]
+            valid = ~np.isnan(values)
+            # SQL sorgusundaki sırayla: ağırlıklı toplam, ağırlık, toplam, sayı, min, max, son değer
+            metrics[name] = list(zip(
+                total(np.where(valid, values * pieces, 0.0)),
+                total(np.where(valid, pieces, 0.0)),
+                total(np.where(valid, values, 0.0)),
+                total(valid.astype(np.int64)),
+                clean(np.fmin.reduceat(values, starts)),
+                clean(np.fmax.reduceat(values, starts)),
+                clean(values[lasts])
+            ))
+        
+        return [
+            {
+                "bucket": int(bucket) * width + offset,
+                **{name: values[index] for name, values in fields.items()},
+                **{name: stats[index] for name, stats in metrics.items()}
+            }
+            for index, bucket in enumerate(buckets[starts].tolist())
+        ]
+
     @staticmethod
-    def detect_anomalies(db: Session, machine_id: int, window_hours: int = 1) -> List[Dict]:
-        """Anomali tespiti"""
-        end_time = datetime.now()
-        start_time = end_time - timedelta(hours=window_hours)
+    def _hold_buckets(partials: List[Dict], width: int) -> List[Dict]:
+        """Kova özetlerine önceki kovalardan taşan tutma sürelerini ekle; yalnızca taşan değerle dolan kovalar da döner"""
+        buckets = {partial["bucket"]: partial for partial in partials}
+        held = {}
+        for partial in partials:
+            spill, at = partial["spill"] or 0.0, partial["bucket"] + width
+            # Zaman damgası çözünürlüğünün (ms) altındaki taşma yuvarlama artığıdır
+            while spill > 1e-3:
+                seconds = min(spill, width)
+                target = held.setdefault(at, {"seconds": 0.0, "running_seconds": 0.0, "values": partial})
+                target["seconds"] += seconds
+                target["running_seconds"] += seconds if partial["last_running"] else 0.0
+                spill -= seconds
+                at += width
         
-        data = db.query(MachineData).filter(
-            MachineData.machine_id == machine_id,
-            MachineData.timestamp.between(start_time, end_time),
-            MachineData.current_consumption.isnot(None)
-        ).order_by(MachineData.timestamp.asc()).all()
+        rows = []
+        for at in sorted(buckets.keys() | held.keys()):
+            partial = buckets.get(at)
+            carry = held.get(at)
+            seconds = (partial["seconds"] if partial else 0.0) + (carry["seconds"] if carry else 0.0)
+            running_seconds = (partial["running_seconds"] if partial else 0.0) + (carry["running_seconds"] if carry else 0.0)
+            if seconds > 0:
+                running_ratio = running_seconds / seconds
+            else:
+                running_ratio = partial["running_rows"] / partial["rows"]
+            
+            row = {"timestamp": EPOCH + timedelta(seconds=at), "samples": int(partial["samples"]) if partial else 0,
+                   "running_ratio": running_ratio}
+            cycle_counts = [partial["cycle_count"]] if partial else []
+            if carry:
+                cycle_counts.append(carry["values"]["last_cycle_count"])
+            cycle_counts = [value for value in cycle_counts if value is not None]
+            row["cycle_count"] = int(max(cycle_counts)) if cycle_counts else None
+            
+            for name, prefix in SUMMARY_METRICS.items():
+                weighted, weighted_seconds, total, count, minimum, maximum = (
+                    partial[name][:6] if partial else (None, None, None, 0, None, None)
+                )
+                weighted, weighted_seconds = weighted or 0.0, weighted_seconds or 0.0
+                extremes = [value for value in (minimum, maximum) if value is not None]
+                if carry and carry["values"][name][6] is not None:
+                    value = carry["values"][name][6]
+                    weighted += value * carry["seconds"]
+                    weighted_seconds += carry["seconds"]
+                    extremes.append(value)
+                if weighted_seconds > 0:
+                    average = weighted / weighted_seconds
+                else:
+                    average = total / count if count else None
+                row[f"{prefix}_min"] = min(extremes) if extremes else None
+                row[f"{prefix}_max"] = max(extremes) if extremes else None
+                row[f"{prefix}_avg"] = average
+            rows.append(row)
+        return rows
+
+    @staticmethod
+    async def get_latest_machine_data(db: AsyncSession) -> List[Dict]:
+        """Her makinenin en son örneği (filo anlık görüntüsünün başlangıç değerleri)"""
+        latest = select(
+            MachineData.machine_id,
+            func.max(MachineData.timestamp).label("timestamp")
+        ).where(
+            MachineData.timestamp >= datetime.utcnow() - timedelta(days=1)
+        ).group_by(MachineData.machine_id).subquery()
         
-        if len(data) < 10:  # Yeterli veri yoksa
-            return []
+        result = await db.execute(select(
+            MachineData.machine_id,
+            MachineData.timestamp,
+            MachineData.status,
+            *[getattr(MachineData, name) for name in HOT_COLUMNS]
+        ).join(
+            latest,
+            (MachineData.machine_id == latest.c.machine_id) & (MachineData.timestamp == latest.c.timestamp)
+        ))
+        return [dict(row._mapping) for row in result]
+    
+    @staticmethod
+    async def get_anomalies(db: AsyncSession, machine_id: int, window_hours: int = 1,
+                            metric: Optional[str] = None) -> List[MachineAnomaly]:
+        """Ingestion sırasında kaydedilmiş anomaliler, yeniden eskiye"""
+        start_time = datetime.utcnow() - timedelta(hours=window_hours)
+        
+        query = select(MachineAnomaly).where(
+            MachineAnomaly.machine_id == machine_id,
+            MachineAnomaly.timestamp >= start_time
+        ).order_by(MachineAnomaly.timestamp.desc())
+        if metric is not None:
+            query = query.where(MachineAnomaly.metric == metric)
         
-        currents = [record.current_consumption for record in data]
-        
-        # Basit anomali tespiti (z-score based)
-        import numpy as np
-        mean_current = np.mean(currents)
-        std_current = np.std(currents)
-        
-        anomalies = []
-        for i, record in enumerate(data):
-            if std_current > 0:  # Avoid division by zero
-                z_score = abs((record.current_consumption - mean_current) / std_current)
-                if z_score > 2.5:  # 2.5 standart sapma dışı
-                    anomalies.append({
-                        "timestamp": record.timestamp,
-                        "current": record.current_consumption,
-                        "z_score": round(z_score, 2),
-                        "severity": "high" if z_score > 3 else "medium"
-                    })
-        
-        return anomalies
+        result = await db.execute(query)
+        return result.scalars().all()
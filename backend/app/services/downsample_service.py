@@ -0,0 +1,46 @@
+import numpy as np
+
+class Downsampler:
+    @staticmethod
+    def lttb_indices(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+        """Largest-Triangle-Three-Buckets: grafiğin şeklini koruyan en fazla max_points satırın indeksi"""
+        count = len(x)
+        if max_points >= count or max_points < 3:
+            return np.arange(count)
+
+        # İlk ve son nokta sabit; aradaki satırlar max_points - 2 kovaya bölünür
+        edges = np.floor(np.arange(max_points - 1) * (count - 2) / (max_points - 2)).astype(np.int64) + 1
+        edges[-1] = count - 1
+        sizes = np.diff(edges)
+        x_means = np.add.reduceat(x[:-1], edges[:-1]) / sizes
+        y_means = np.add.reduceat(y[:-1], edges[:-1]) / sizes
+
+        selected = np.empty(max_points, dtype=np.int64)
+        selected[0], selected[-1] = 0, count - 1
+        previous = 0
+        for bucket in range(max_points - 2):
+            start, end = edges[bucket], edges[bucket + 1]
+            # Üçgenin üçüncü köşesi: sonraki kovanın ortalaması (son kova için son nokta)
+            if bucket + 1 < max_points - 2:
+                next_x, next_y = x_means[bucket + 1], y_means[bucket + 1]
+            else:
+                next_x, next_y = x[-1], y[-1]
+            areas = np.abs(
+                (x[previous] - next_x) * (y[start:end] - y[previous]) -
+                (x[previous] - x[start:end]) * (next_y - y[previous])
+            )
+            previous = start + int(np.argmax(areas))
+            selected[bucket + 1] = previous
+        return selected
+
+    @staticmethod
+    def fill_gaps(values: np.ndarray) -> np.ndarray:
+        """Boş (NaN) değerleri son bilinen değerle, baştakileri ilk değerle doldur"""
+        valid = ~np.isnan(values)
+        if not valid.any():
+            return np.zeros_like(values)
+        positions = np.where(valid, np.arange(len(values)), 0)
+        np.maximum.accumulate(positions, out=positions)
+        filled = values[positions]
+        filled[:np.argmax(valid)] = values[np.argmax(valid)]
+        return filled
@@ -0,0 +1,120 @@
+from sqlalchemy import func, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import timedelta
+from typing import Dict, List
+from app.core.config import settings
+from app.models.database import DowntimeReason, MachineStateInterval
+from app.services.state_interval_service import StateIntervalService
+
+# Otomatik açılan duruşlar; operatör sebep ve kategoriyi sonradan girer
+AUTO_REASON = "auto-detected"
+AUTO_CATEGORY = "unclassified"
+
+class DowntimeDetector:
+    @staticmethod
+    async def detect(db: AsyncSession, rows: List[Dict], grace_seconds: float = settings.DOWNTIME_GRACE_SECONDS) -> List[Dict]:
+        """Durum örneklerinden duruş kayıtlarını aç/kapat (commit çağıranın transaction'ında)"""
+        # Durum aralıkları güncellenmeden önce çağrılmalı: önceki durum açık aralıktan okunur
+        machine_ids = {row["machine_id"] for row in rows}
+        if not machine_ids:
+            return []
+        grace = timedelta(seconds=grace_seconds)
+        hold = StateIntervalService.hold_limit()
+        
+        # Makinenin son bilinen durumu ve son örnek zamanı
+        result = await db.execute(select(
+            MachineStateInterval.machine_id,
+            MachineStateInterval.state,
+            MachineStateInterval.end_time
+        ).where(
+            MachineStateInterval.machine_id.in_(machine_ids),
+            MachineStateInterval.is_open.is_(True)
+        ).order_by(MachineStateInterval.start_time))
+        last_seen = {}
+        left_running = {}
+        for machine_id, state, end_time in result:
+            last_seen[machine_id] = end_time
+            if state != "running":
+                left_running[machine_id] = None  # aşağıda doldurulur
+        
+        # Açık duruş kayıtları (operatörün girdikleri dahil) makine çalışınca kapanır
+        result = await db.execute(select(DowntimeReason.id, DowntimeReason.machine_id, DowntimeReason.start_time).where(
+            DowntimeReason.machine_id.in_(machine_ids),
+            DowntimeReason.end_time.is_(None)
+        ))
+        open_records: Dict[int, List[Dict]] = {}
+        for record_id, machine_id, start_time in result:
+            open_records.setdefault(machine_id, []).append({"id": record_id, "start_time": start_time})
+        
+        # Bekleme süresi dolmamış makineler için çalışmayı bıraktığı an: açık aralığa kesintisiz bağlanan
+        # çalışmayan aralıkların başı. Veri kesintisinde kapanmış aralığın gerisine gidilmez.
+        pending = [machine_id for machine_id in left_running if machine_id not in open_records]
+        if pending:
+            last_running = select(
+                MachineStateInterval.machine_id,
+                func.max(MachineStateInterval.end_time).label("end_time")
+            ).where(
+                MachineStateInterval.machine_id.in_(pending),
+                MachineStateInterval.state == "running"
+            ).group_by(MachineStateInterval.machine_id).subquery()
+            result = await db.execute(select(
+                MachineStateInterval.machine_id,
+                MachineStateInterval.state,
+                MachineStateInterval.start_time,
+                MachineStateInterval.end_time
+            ).outerjoin(
+                last_running, last_running.c.machine_id == MachineStateInterval.machine_id
+            ).where(
+                MachineStateInterval.machine_id.in_(pending),
+                or_(last_running.c.end_time.is_(None), MachineStateInterval.end_time >= last_running.c.end_time)
+            ).order_by(MachineStateInterval.machine_id, MachineStateInterval.start_time.desc()))
+            walked = set()
+            for machine_id, state, start_time, end_time in result:
+                run_start = left_running[machine_id]
+                if run_start is None:
+                    # En son başlayan aralık açık aralıktır
+                    left_running[machine_id] = start_time
+                elif machine_id not in walked and state != "running" and end_time == run_start:
+                    left_running[machine_id] = start_time
+                else:
+                    walked.add(machine_id)
+        
+        events = []
+        opened, closed = [], []
+        for row in sorted(rows, key=lambda row: (row["machine_id"], row["timestamp"])):
+            machine_id, timestamp = row["machine_id"], row["timestamp"]
+            # Geç gelen örnekler durum geçişi sayılmaz (durum aralıklarıyla aynı kural)
+            if machine_id in last_seen and timestamp < last_seen[machine_id]:
+                continue
+            if machine_id in last_seen and timestamp - last_seen[machine_id] > hold:
+                # Veri kesintisi: önceki durum boşluk boyunca sürmüş sayılmaz, bekleme yeniden başlar
+                left_running.pop(machine_id, None)
+            last_seen[machine_id] = timestamp
+            
+            if row["status"] == "running":
+                for record in open_records.pop(machine_id, []):
+                    # Bu partide açılan kayıt INSERT edilmeden önce kapatılır
+                    target = record if "id" not in record else {"id": record["id"]}
+                    target.update(end_time=timestamp, duration=timestamp - record["start_time"], resolved=True)
+                    if "id" in record:
+                        closed.append(target)
+                    events.append({"type": "closed", "machine_id": machine_id,
+                                   "start_time": record["start_time"], "end_time": timestamp})
+                left_running.pop(machine_id, None)
+                continue
+            
+            if left_running.get(machine_id) is None:
+                left_running[machine_id] = timestamp
+            start_time = left_running[machine_id]
+            if machine_id not in open_records and timestamp - start_time >= grace:
+                record = {"machine_id": machine_id, "reason": AUTO_REASON, "category": AUTO_CATEGORY,
+                          "start_time": start_time, "end_time": None, "duration": None, "resolved": False}
+                opened.append(record)
+                open_records[machine_id] = [record]
+                events.append({"type": "opened", "machine_id": machine_id, "start_time": start_time, "end_time": None})
+        
+        if opened:
+            await db.execute(insert(DowntimeReason), opened)
+        if closed:
+            await db.execute(update(DowntimeReason), closed)
+        return events
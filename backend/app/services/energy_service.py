@@ -0,0 +1,217 @@
+import numpy as np
+from sqlalchemy import DateTime, case, column, func, select, table
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta
+from typing import Dict, List
+from app.core.config import settings
+from app.models.database import MachineData
+from app.database.timescale import aggregate_for_window
+from app.database.sql_functions import bucket_floor, seconds_between
+from app.services.oee_service import OEEService, OEE_BUCKETS
+
+# Kova türleri OEE raporlarıyla aynı (saat, vardiya, gün)
+ENERGY_BUCKETS = OEE_BUCKETS
+
+class EnergyService:
+    @staticmethod
+    def demand_window_query(machine_ids: List[int], start_time: datetime, end_time: datetime):
+        """Makine ve talep penceresi (15 dk) başına amper-saniye, kapsanan süre, en yüksek akım ve örnek sayısı"""
+        window = settings.ENERGY_DEMAND_WINDOW
+
+        # İstisna ile raporlamada örnek sayısı süreyi vermez; görünümler yalnızca sabit hızlı örneklemede kullanılır
+        if not settings.MACHINE_REPORT_BY_EXCEPTION and aggregate_for_window(start_time, end_time):
+            # Görünümde örnek aralıkları yok: her örnek nominal aralık kadar sayılır.
+            # Dakikanın tüm örneklerinde gateway'in integre ettiği yük varsa ortalama yerine o kullanılır
+            aggregate = table("machine_data_1m", column("machine_id"), column("bucket", DateTime),
+                              column("current_avg"), column("current_max"), column("current_samples"),
+                              column("charge_samples"), column("charge_sum"))
+            window_col = bucket_floor(aggregate.c.bucket, window).label("window")
+            ampere_seconds = case(
+                (aggregate.c.charge_samples == aggregate.c.current_samples, aggregate.c.charge_sum),
+                else_=aggregate.c.current_avg * aggregate.c.current_samples * settings.MACHINE_SAMPLE_INTERVAL
+            )
+            return select(
+                aggregate.c.machine_id,
+                window_col,
+                func.sum(ampere_seconds),
+                func.sum(aggregate.c.current_samples) * settings.MACHINE_SAMPLE_INTERVAL,
+                func.max(aggregate.c.current_max),
+                func.sum(aggregate.c.current_samples)
+            ).where(
+                aggregate.c.machine_id.in_(machine_ids),
+                aggregate.c.bucket >= start_time,
+                aggregate.c.bucket < end_time,
+                aggregate.c.current_samples > 0
+            ).group_by(aggregate.c.machine_id, window_col).order_by(aggregate.c.machine_id, window_col)
+
+        # Yük (current_charge) gönderen örnekler: yük önceki örnekten bu yana geçen aralığı kapsar (geriye doğru),
+        # aralık pencere sınırını aşıyorsa yükün pencereye düşen payı alınır. Yük göndermeyen örnekler: değer
+        # bir sonraki örneğe kadar geçerli (ileriye doğru); sonraki örnek yük gönderiyorsa o aralık onundur.
+        # Veri boşluğunda (ENERGY_MAX_GAP_SECONDS) yalnızca nominal aralık sayılır. Pencere başından önceki son
+        # örnek başlangıçtan, son örnek pencere sonuna (ya da şimdiye) kadar; pencere sonrasındaki ilk örneğin
+        # yükü sonun öncesine düşen payı kadar sayılır
+        max_gap = timedelta(seconds=settings.ENERGY_MAX_GAP_SECONDS)
+        hold_until = min(end_time, datetime.utcnow())
+        ordered = dict(partition_by=MachineData.machine_id, order_by=MachineData.timestamp)
+        samples = select(
+            MachineData.machine_id,
+            MachineData.timestamp,
+            MachineData.current_consumption.label("current"),
+            MachineData.current_charge.label("charge"),
+            func.lag(MachineData.timestamp).over(**ordered).label("previous_timestamp"),
+            func.lead(MachineData.timestamp).over(**ordered).label("next_timestamp"),
+            func.lead(MachineData.current_charge).over(**ordered).label("next_charge")
+        ).where(
+            MachineData.machine_id.in_(machine_ids),
+            MachineData.timestamp >= start_time - max_gap,
+            MachineData.timestamp < end_time + max_gap,
+            MachineData.current_consumption.isnot(None)
+        ).subquery()
+
+        carried = samples.c.timestamp < start_time
+        after_end = samples.c.timestamp >= end_time
+
+        # İleriye tutma (yük göndermeyen aralıklar), hold_until ile sınırlı
+        gap = seconds_between(samples.c.timestamp, func.coalesce(samples.c.next_timestamp, hold_until))
+        until = seconds_between(samples.c.timestamp, hold_until)
+        hold = case(
+            (after_end | samples.c.next_charge.isnot(None), 0),
+            (gap > settings.ENERGY_MAX_GAP_SECONDS, settings.MACHINE_SAMPLE_INTERVAL),
+            (gap < 0, 0),
+            else_=gap
+        )
+        hold = case((hold > until, until), else_=hold) - case(
+            (carried, seconds_between(samples.c.timestamp, start_time)), else_=0
+        )
+        hold = case((hold < 0, 0), else_=hold)
+
+        # Geriye yük: [önceki örnek, örnek] aralığının [start_time, end_time] içindeki payı
+        since_previous = seconds_between(samples.c.previous_timestamp, samples.c.timestamp)
+        span = case(
+            (samples.c.previous_timestamp.is_(None), settings.MACHINE_SAMPLE_INTERVAL),
+            (since_previous > settings.ENERGY_MAX_GAP_SECONDS, settings.MACHINE_SAMPLE_INTERVAL),
+            else_=since_previous
+        )
+        since_start = seconds_between(start_time, samples.c.timestamp)
+        overlap = case((since_start < span, since_start), else_=span) - case(
+            (after_end, seconds_between(end_time, samples.c.timestamp)), else_=0
+        )
+        overlap = case((samples.c.charge.is_(None), 0), (overlap < 0, 0), else_=overlap)
+        charge = case((overlap > 0, samples.c.charge * overlap / span), else_=0)
+
+        # Pencere sonrasındaki örneğin payı önceki örneğin penceresine yazılır
+        at = case(
+            (carried, start_time),
+            (after_end, case(
+                (samples.c.previous_timestamp.is_(None) | (samples.c.previous_timestamp < start_time), start_time),
+                else_=samples.c.previous_timestamp
+            )),
+            else_=samples.c.timestamp
+        )
+        outside = carried | after_end
+        # Pencere sınırını aşan tutma süresi örneğin penceresine yazılır; kova ifadesi bağlı parametre
+        # içerdiğinden GROUP BY'da birebir aynı kalsın diye bir alt sorguda hesaplanır
+        held_samples = select(
+            samples.c.machine_id,
+            bucket_floor(at, window).label("window"),
+            (samples.c.current * hold + charge).label("ampere_seconds"),
+            (hold + overlap).label("held"),
+            case((after_end, None), else_=samples.c.current).label("current"),
+            case((outside, 0), else_=1).label("in_window")
+        ).subquery()
+        return select(
+            held_samples.c.machine_id,
+            held_samples.c.window,
+            func.sum(held_samples.c.ampere_seconds),
+            func.sum(held_samples.c.held),
+            func.max(held_samples.c.current),
+            func.sum(held_samples.c.in_window)
+        ).where(
+            held_samples.c.held > 0
+        ).group_by(held_samples.c.machine_id, held_samples.c.window).order_by(held_samples.c.machine_id, held_samples.c.window)
+
+    @staticmethod
+    async def analyze(db: AsyncSession, machine_ids: List[int], start_time: datetime, end_time: datetime,
+                      bucket: str = "hour") -> List[Dict]:
+        """Makine başına zaman ağırlıklı kWh, kova toplamları ve 15 dk en yüksek talep"""
+        result = await db.execute(EnergyService.demand_window_query(machine_ids, start_time, end_time))
+        rows = result.all()
+        if not rows:
+            return []
+
+        epoch = datetime(1970, 1, 1)
+        count = len(rows)
+        machines = np.fromiter((row[0] for row in rows), dtype=np.int64, count=count)
+        windows = np.fromiter(((row[1] - epoch) // timedelta(seconds=1) for row in rows), dtype=np.int64, count=count)
+        ampere_seconds = np.fromiter((row[2] or 0.0 for row in rows), dtype=np.float64, count=count)
+        covered_seconds = np.fromiter((row[3] or 0.0 for row in rows), dtype=np.float64, count=count)
+        current_max = np.fromiter((row[4] or 0.0 for row in rows), dtype=np.float64, count=count)
+        samples = np.fromiter((row[5] for row in rows), dtype=np.int64, count=count)
+
+        # P = I x V; kWh = A·s x V / 3.6e6; pencere talebi = pencere enerjisi / pencere süresi
+        voltage = settings.ENERGY_VOLTAGE
+        energy = ampere_seconds * voltage / 3.6e6
+        demand = energy * 3600 / settings.ENERGY_DEMAND_WINDOW
+
+        width, offset = ENERGY_BUCKETS[bucket]
+        buckets = (windows - offset) // width * width + offset
+
+        # Satırlar makine ve pencereye göre sıralı: gruplar ardışık dilimlerdir
+        machine_starts = EnergyService._group_starts(machines)
+        bucket_starts = EnergyService._group_starts(machines, buckets)
+        machine_peaks = EnergyService._argmax_per_group(demand, machine_starts)
+        bucket_peaks = EnergyService._argmax_per_group(demand, bucket_starts)
+
+        machine_energy = np.add.reduceat(energy, machine_starts)
+        machine_seconds = np.add.reduceat(covered_seconds, machine_starts)
+        machine_current_max = np.maximum.reduceat(current_max, machine_starts)
+        machine_samples = np.add.reduceat(samples, machine_starts)
+        bucket_energy = np.add.reduceat(energy, bucket_starts)
+
+        results = {}
+        for index, start in enumerate(machine_starts):
+            peak = machine_peaks[index]
+            results[int(machines[start])] = {
+                "machine_id": int(machines[start]),
+                "total_energy_kwh": round(float(machine_energy[index]), 3),
+                "average_power_kw": round(float(machine_energy[index] * 3600 / machine_seconds[index]), 3) if machine_seconds[index] else 0.0,
+                "max_power_kw": round(float(machine_current_max[index] * voltage / 1000), 3),
+                "data_points": int(machine_samples[index]),
+                "peak_demand": {
+                    "window_start": epoch + timedelta(seconds=int(windows[peak])),
+                    "demand_kw": round(float(demand[peak]), 3)
+                },
+                "buckets": []
+            }
+
+        for index, start in enumerate(bucket_starts):
+            bucket_start = epoch + timedelta(seconds=int(buckets[start]))
+            peak = bucket_peaks[index]
+            shift_date, shift_number = OEEService._shift_of(bucket_start)
+            results[int(machines[start])]["buckets"].append({
+                "bucket_start": bucket_start,
+                "shift_date": shift_date,
+                "shift_number": shift_number if bucket == "shift" else None,
+                "energy_kwh": round(float(bucket_energy[index]), 3),
+                "peak_demand_kw": round(float(demand[peak]), 3),
+                "peak_window_start": epoch + timedelta(seconds=int(windows[peak]))
+            })
+
+        return list(results.values())
+
+    @staticmethod
+    def _group_starts(*keys: np.ndarray) -> np.ndarray:
+        """Sıralı anahtar dizilerinde her grubun ilk satırının indeksi"""
+        changed = np.zeros(len(keys[0]), dtype=bool)
+        changed[0] = True
+        for key in keys:
+            changed[1:] |= key[1:] != key[:-1]
+        return np.flatnonzero(changed)
+
+    @staticmethod
+    def _argmax_per_group(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+        """Ardışık grupların her birinde en büyük değerin indeksi"""
+        groups = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(values))))
+        # Grup sırası korunur, grup içinde büyükten küçüğe: her grubun ilk satırı en büyüğü
+        order = np.lexsort((-values, groups))
+        return order[starts]
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Optional
+from app.core.config import settings
+from app.models.database import AsyncSessionLocal
+from app.services.cache_service import single_flight
+from app.services.data_service import DataService
+from app.services.oee_service import OEEService
+from app.services.oee_state_service import OEEStateStore
+from app.services.websocket_service import websocket_manager, FLEET_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+def _round(value: Optional[float], digits: int) -> Optional[float]:
+    return None if value is None else round(value, digits)
+
+class FleetSnapshotService:
+    """Kontrol odası ekranları için tüm makinelerin son durumu ve vardiya OEE'si, sabit aralıkla"""
+    def __init__(self, interval: float = settings.FLEET_SNAPSHOT_INTERVAL,
+                 oee_interval: float = settings.FLEET_OEE_REFRESH_INTERVAL):
+        self.interval = interval
+        self.oee_interval = oee_interval
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._latest: Optional[Dict] = None
+        self._built_at = 0.0
+        # Vardiya OEE'si veritabanından (her worker aynı değeri gösterir); dönem başı ve okunma anı
+        self._shift_oee: Dict[int, float] = {}
+        self._oee_period: Optional[datetime] = None
+        self._oee_at: Optional[float] = None
+
+        self.stats = {"ticks": 0, "built": 0, "sent_to": 0, "oee_refreshes": 0}
+
+    async def refresh_oee(self, now: Optional[datetime] = None):
+        """İçinde bulunulan vardiyanın filo OEE'sini tek gruplu sorguyla oku"""
+        start_time, end_time = OEEStateStore.current_window("shift", now)
+        async with AsyncSessionLocal() as db:
+            fleet = await OEEService.calculate_fleet_oee(db, start_time, end_time)
+        self._shift_oee = {entry["machine_id"]: entry["oee"] for entry in fleet}
+        self._oee_period = start_time
+        self._oee_at = time.monotonic()
+        self.stats["oee_refreshes"] += 1
+
+    async def _refresh_oee_if_stale(self):
+        if self._oee_at is not None and time.monotonic() - self._oee_at < self.oee_interval:
+            return
+        try:
+            # Aynı anda yoklayan istemciler tek sorguyu paylaşır
+            await single_flight.do(("fleet_shift_oee",), self.refresh_oee)
+        except Exception:
+            logger.exception("Failed to refresh fleet shift OEE")
+
+    def build(self, now: Optional[datetime] = None) -> Dict:
+        """machine_data_cache ve son okunan vardiya OEE'sinden tek bir kompakt görüntü"""
+        now = now or datetime.utcnow()
+        # Vardiya değiştiyse önceki vardiyanın değeri gösterilmez
+        period, _ = OEEStateStore.current_window("shift", now)
+        shift_oee = self._shift_oee if period == self._oee_period else {}
+        machines = {}
+        for machine_id, data in sorted(websocket_manager.machine_data_cache.items()):
+            oee = shift_oee.get(machine_id)
+            machines[machine_id] = {
+                "status": data.get("status"),
+                "current": _round(data.get("current_consumption"), 2),
+                "temperature": _round(data.get("temperature"), 1),
+                "oee": None if oee is None else round(oee, 3),
+                "updated": data.get("timestamp")
+            }
+        self._latest = {"timestamp": now, "machines": machines}
+        self._built_at = time.monotonic()
+        self.stats["built"] += 1
+        return self._latest
+
+    async def current(self) -> Dict:
+        """Yoklama yapan istemciler için: son tick'in görüntüsü, eskiyse yenisi"""
+        if self._latest is None or time.monotonic() - self._built_at >= self.interval:
+            await self._refresh_oee_if_stale()
+            return self.build()
+        return self._latest
+
+    async def start(self):
+        """Önbelleği son örneklerle doldur ve tick görevini başlat"""
+        if self._task is not None:
+            return
+        try:
+            async with AsyncSessionLocal() as db:
+                rows = await DataService.get_latest_machine_data(db)
+        except Exception:
+            logger.exception("Failed to seed fleet snapshot from machine_data")
+            rows = []
+        for row in rows:
+            # Ingestion'dan gelmiş daha yeni değer korunur
+            if row["machine_id"] not in websocket_manager.machine_data_cache:
+                websocket_manager.update_machine_cache(row["machine_id"], {
+                    key: value for key, value in row.items() if key != "machine_id"
+                })
+
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            self.stats["ticks"] += 1
+            # Abone yoksa görüntü üretilmez (REST isteği kendisi üretir)
+            if not websocket_manager.active_connections.get(FLEET_CHANNEL):
+                continue
+            await self._refresh_oee_if_stale()
+            try:
+                self.stats["sent_to"] += websocket_manager.publish_fleet_snapshot(self.build())
+            except Exception:
+                logger.exception("Failed to publish fleet snapshot")
+
+# Global fleet snapshot instance
+fleet_snapshot = FleetSnapshotService()
@@ -0,0 +1,179 @@
+import logging
+import numpy as np
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import select
+from app.core.config import settings
+from app.models.database import AsyncSessionLocal, Machine, MachineData
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+
+# Sayısal kolonlar; boş değerler NaN olarak tutulur (cycle_count float64'te 2^53'e kadar tam)
+HOT_COLUMNS = ("current_consumption", "temperature", "pressure", "cycle_count",
+               "current_min", "current_max", "current_rms", "current_charge", "cycle_time")
+# Veritabanında Integer olan kolonlar; okurken int'e çevrilir
+HOT_INTEGER_COLUMNS = ("cycle_count",)
+# Satır başına bayt: zaman (8) + durum kodu (1) + sayısal kolonlar (8'er)
+_ROW_BYTES = 8 + 1 + 8 * len(HOT_COLUMNS)
+
+def to_epoch(value: datetime) -> float:
+    return (value - EPOCH).total_seconds()
+
+def allocated_rows(capacity: int) -> int:
+    # Kapasitenin dörtte biri kadar boşluk: dizi sonuna gelince tutulan satırlar başa kopyalanır
+    # (kapasite / 4 eklemede bir kopya, ekleme başına ortalama dört satır)
+    return capacity + max(capacity // 4, 1)
+
+class _MachineBuffer:
+    """Tek makinenin son örnekleri; önceden ayrılmış dizilerde zaman sıralı, bitişik pencere"""
+    def __init__(self, capacity: int, covered_from: float):
+        self.capacity = capacity
+        # Kayan pencere: kapasitenin üstünde boşluk ayrılır, dizinin sonuna gelince tutulan satırlar başa
+        # kopyalanır. Böylece veri her zaman [start:end) dilimindedir ve searchsorted doğrudan çalışır.
+        size = allocated_rows(capacity)
+        self.timestamps = np.empty(size, dtype=np.float64)
+        self.status = np.empty(size, dtype=np.int8)
+        self.columns = {name: np.empty(size, dtype=np.float64) for name in HOT_COLUMNS}
+        self.start = 0
+        self.end = 0
+        # Bu zamandan sonraki örneklerin tamamı tampondadır
+        self.covered_from = covered_from
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.timestamps) * _ROW_BYTES
+
+    def append(self, timestamp: float, status: int, values: List[float]):
+        if self.end > self.start and timestamp < self.timestamps[self.end - 1]:
+            # Sıra dışı örnek eklenemez; o ana kadarki pencereler artık eksik kabul edilir
+            self.covered_from = max(self.covered_from, np.nextafter(timestamp, np.inf))
+            return
+
+        if self.end - self.start == self.capacity:
+            # En eski satır düşer: kapsam düşen örnekten sonrasına daralır
+            self.covered_from = max(self.covered_from, np.nextafter(self.timestamps[self.start], np.inf))
+            self.start += 1
+        if self.end == len(self.timestamps):
+            count = self.end - self.start
+            for array in (self.timestamps, self.status, *self.columns.values()):
+                array[:count] = array[self.start:self.end]
+            self.start, self.end = 0, count
+
+        self.timestamps[self.end] = timestamp
+        self.status[self.end] = status
+        for array, value in zip(self.columns.values(), values):
+            array[self.end] = value
+        self.end += 1
+
+    def slice(self, start_time: float, end_time: float) -> Dict[str, np.ndarray]:
+        """[start_time, end_time] içindeki satırlar (kopya, sonraki eklemelerden etkilenmez)"""
+        timestamps = self.timestamps[self.start:self.end]
+        lo = self.start + int(np.searchsorted(timestamps, start_time, side="left"))
+        hi = self.start + int(np.searchsorted(timestamps, end_time, side="right"))
+        window = {"timestamp": self.timestamps[lo:hi].copy(), "status": self.status[lo:hi].copy()}
+        for name, array in self.columns.items():
+            window[name] = array[lo:hi].copy()
+        return window
+
+class HotStore:
+    """Son saatlerin machine_data örnekleri için bellek içi kolon deposu (ingestion doldurur)"""
+    def __init__(self, retention_hours: float = settings.HOT_STORE_RETENTION_HOURS,
+                 max_bytes: int = settings.HOT_STORE_MAX_MB * 1024 * 1024):
+        self.retention = timedelta(hours=retention_hours)
+        self.max_bytes = max_bytes
+        # Örnek aralığı düzensiz olabilir; %25 pay bırakılır, taşarsa kapsam kendiliğinden daralır
+        self.capacity = max(int(self.retention.total_seconds() / settings.MACHINE_SAMPLE_INTERVAL * 1.25), 1)
+
+        self._buffers: Dict[int, _MachineBuffer] = {}
+        self._status_codes: Dict[str, int] = {}
+        self.status_names: List[str] = []
+        self.loaded = False
+
+        self.stats = {"observed": 0, "hits": 0, "misses": 0, "rejected_machines": 0}
+
+    @property
+    def nbytes(self) -> int:
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+    @property
+    def machine_ids(self) -> List[int]:
+        return list(self._buffers)
+
+    def status_code(self, status: str) -> int:
+        code = self._status_codes.get(status)
+        if code is None:
+            code = self._status_codes[status] = len(self.status_names)
+            self.status_names.append(status)
+        return code
+
+    def _buffer(self, machine_id: int, covered_from: float) -> Optional[_MachineBuffer]:
+        buffer = self._buffers.get(machine_id)
+        if buffer is None:
+            # Bellek sınırı aşılacaksa makine sıcak katmana alınmaz, sorguları veritabanına gider
+            if self.nbytes + allocated_rows(self.capacity) * _ROW_BYTES > self.max_bytes:
+                self.stats["rejected_machines"] += 1
+                return None
+            buffer = self._buffers[machine_id] = _MachineBuffer(self.capacity, covered_from)
+        return buffer
+
+    def observe(self, rows: Iterable[Dict]):
+        """Veritabanına yazılmış satırları ekle (ingestion flush'ından sonra)"""
+        if not self.loaded:
+            return
+        for row in sorted(rows, key=lambda row: (row["machine_id"], row["timestamp"])):
+            timestamp = to_epoch(row["timestamp"])
+            # Yüklemeden sonra ilk kez görülen makinenin önceki örneği yoktur
+            buffer = self._buffer(row["machine_id"], timestamp)
+            if buffer is None:
+                continue
+            buffer.append(timestamp, self.status_code(row["status"]), [
+                np.nan if row.get(name) is None else row[name] for name in HOT_COLUMNS
+            ])
+            self.stats["observed"] += 1
+
+    def window(self, machine_id: int, start_time: datetime, end_time: datetime) -> Optional[Dict[str, np.ndarray]]:
+        """Pencere tamamen bellekteyse kolon dizileri, değilse None (veritabanına düşülür)"""
+        buffer = self._buffers.get(machine_id) if self.loaded else None
+        start = to_epoch(start_time)
+        if buffer is None or start < buffer.covered_from:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return buffer.slice(start, to_epoch(end_time))
+
+    async def load(self):
+        """Saklama penceresini veritabanından doldur (ingestion başlamadan önce)"""
+        since = datetime.utcnow() - self.retention
+        self._buffers.clear()
+        self.loaded = False
+
+        async with AsyncSessionLocal() as db:
+            machine_ids = (await db.execute(select(Machine.id))).scalars().all()
+            for machine_id in machine_ids:
+                self._buffer(machine_id, to_epoch(since))
+
+            result = await db.stream(select(
+                MachineData.machine_id,
+                MachineData.timestamp,
+                MachineData.status,
+                *[getattr(MachineData, name) for name in HOT_COLUMNS]
+            ).where(
+                MachineData.timestamp >= since
+            ).order_by(MachineData.machine_id, MachineData.timestamp).execution_options(yield_per=10000))
+
+            loaded = 0
+            async for machine_id, timestamp, status, *values in result:
+                buffer = self._buffers.get(machine_id)
+                if buffer is not None:
+                    buffer.append(to_epoch(timestamp), self.status_code(status),
+                                  [np.nan if value is None else value for value in values])
+                    loaded += 1
+
+        self.loaded = True
+        logger.info("Hot store loaded %d samples for %d machines (%.1f MB)",
+                    loaded, len(self._buffers), self.nbytes / 1024 / 1024)
+
+# Global hot store instance
+hot_store = HotStore()
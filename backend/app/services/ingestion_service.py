@@ -0,0 +1,223 @@
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.models.database import AsyncSessionLocal
+from app.services.data_service import DataService
+from app.services.downtime_service import DowntimeDetector
+from app.services.oee_state_service import oee_state
+from app.services.anomaly_service import anomaly_detector
+from app.services.hot_store_service import hot_store
+from app.services.cache_service import result_cache
+
+logger = logging.getLogger(__name__)
+
+ACK_ON_FLUSH = "flush"
+ACK_ON_ENQUEUE = "enqueue"
+
+class IngestionError(Exception):
+    """Kayıtlar tampona alınamadı ya da veritabanına yazılamadı"""
+
+class _Ack:
+    """Bir isteğin satırları yazılınca çözülen bekleme nesnesi"""
+    def __init__(self, rows: int, future: asyncio.Future):
+        self.remaining = rows
+        self.future = future
+
+class IngestionBuffer:
+    """Sınırlı bellekli yazma tamponu ve arka plan flush görevi"""
+    def __init__(
+        self,
+        max_rows: int = settings.INGEST_MAX_ROWS,
+        batch_size: int = settings.INGEST_BATCH_SIZE,
+        flush_interval: float = settings.INGEST_FLUSH_INTERVAL,
+        ack_mode: str = settings.INGEST_ACK_MODE,
+        enqueue_timeout: float = settings.INGEST_ENQUEUE_TIMEOUT
+    ):
+        if ack_mode not in (ACK_ON_FLUSH, ACK_ON_ENQUEUE):
+            raise ValueError(f"Unknown ingestion ack mode: {ack_mode}")
+
+        self.max_rows = max_rows
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.ack_mode = ack_mode
+        self.enqueue_timeout = enqueue_timeout
+
+        self._pending: Deque[Tuple[Dict, Optional[_Ack]]] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._batch_ready: Optional[asyncio.Event] = None
+        self._space_freed: Optional[asyncio.Event] = None
+
+        self.stats = {"enqueued": 0, "flushed": 0, "failed": 0, "flushes": 0, "hook_errors": 0}
+
+    @property
+    def durable_ack(self) -> bool:
+        return self.ack_mode == ACK_ON_FLUSH
+
+    @property
+    def pending_rows(self) -> int:
+        return len(self._pending)
+
+    async def start(self):
+        """Flush görevini başlat (uygulama açılışında)"""
+        if self._task is not None:
+            return
+        self._closing = False
+        self._batch_ready = asyncio.Event()
+        self._space_freed = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Yeni kayıtları reddet, tampondakileri yaz ve görevi bitir"""
+        if self._task is None:
+            return
+        self._closing = True
+        self._batch_ready.set()
+        await self._task
+        self._task = None
+
+    async def enqueue(self, records: List[Dict]) -> int:
+        """Kayıtları tampona ekle; flush modunda yazılana kadar bekle"""
+        if self._task is None or self._closing:
+            raise IngestionError("Ingestion buffer is not running")
+        if len(records) > self.max_rows:
+            raise IngestionError("Batch is larger than the ingestion buffer")
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.enqueue_timeout
+
+        # Tampon doluysa flush'ın yer açmasını sınırlı süre bekle
+        while len(self._pending) + len(records) > self.max_rows:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise IngestionError("Ingestion buffer is full")
+            self._space_freed.clear()
+            try:
+                await asyncio.wait_for(self._space_freed.wait(), remaining)
+            except asyncio.TimeoutError:
+                raise IngestionError("Ingestion buffer is full")
+
+        ack = _Ack(len(records), loop.create_future()) if self.durable_ack else None
+
+        # Zaman damgası alış anında atanır, flush gecikmesi örnek zamanını kaydırmaz
+        received_at = datetime.utcnow()
+        for record in records:
+            self._pending.append(({**record, "timestamp": record.get("timestamp") or received_at}, ack))
+        self.stats["enqueued"] += len(records)
+
+        if len(self._pending) >= self.batch_size:
+            self._batch_ready.set()
+
+        if ack is not None:
+            await ack.future
+        return len(records)
+
+    async def _run(self):
+        while not (self._closing and not self._pending):
+            try:
+                # Boyut ya da süre tetiklemesinden hangisi önce gelirse
+                if len(self._pending) < self.batch_size and not self._closing:
+                    try:
+                        await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                self._batch_ready.clear()
+
+                while self._pending:
+                    count = min(self.batch_size, len(self._pending))
+                    batch = [self._pending.popleft() for _ in range(count)]
+                    try:
+                        await self._flush(batch)
+                    except Exception:
+                        # Bekleyen istekler askıda kalmaz; görev sonraki partilerle devam eder
+                        self._fail(batch, IngestionError("Data could not be stored"))
+                        raise
+                    if len(self._pending) < self.batch_size and not self._closing:
+                        break
+            except Exception:
+                logger.exception("Ingestion flush iteration failed")
+
+    async def _flush(self, batch: List[Tuple[Dict, Optional[_Ack]]]):
+        rows = [row for row, _ in batch]
+
+        try:
+            downtime_events = await self._write(rows)
+        except Exception:
+            logger.exception("Failed to flush %d machine_data rows", len(rows))
+            self.stats["failed"] += len(rows)
+            self._fail(batch, IngestionError("Data could not be stored"))
+            return
+        finally:
+            self._space_freed.set()
+
+        self.stats["flushed"] += len(rows)
+        self.stats["flushes"] += 1
+        # Satırlar kalıcı: istek, yazma sonrası işlemleri beklemeden yanıtlanır
+        for _, ack in batch:
+            if ack is not None:
+                ack.remaining -= 1
+                if ack.remaining == 0 and not ack.future.done():
+                    ack.future.set_result(True)
+
+        # Artımlı OEE durumu yalnızca kalıcı yazılmış satırlarla güncellenir; bir işlemin hatası
+        # diğerlerini ve flush görevini durdurmaz
+        self._after_write("oee_state", oee_state.observe, rows)
+        self._after_write("hot_store", hot_store.observe, rows)
+        self._after_write("downtime_events", self._apply_downtime_events, downtime_events)
+        self._after_write("result_cache", self._invalidate_cache, rows)
+        if settings.ANOMALY_DETECTION_ENABLED:
+            try:
+                await anomaly_detector.record(anomaly_detector.observe(rows))
+            except Exception:
+                logger.exception("Post-write step %s failed", "anomalies")
+                self.stats["hook_errors"] += 1
+
+    def _after_write(self, name: str, hook, *args):
+        try:
+            hook(*args)
+        except Exception:
+            logger.exception("Post-write step %s failed", name)
+            self.stats["hook_errors"] += 1
+
+    @staticmethod
+    def _fail(batch: List[Tuple[Dict, Optional[_Ack]]], error: Exception):
+        for _, ack in batch:
+            if ack is not None and not ack.future.done():
+                ack.future.set_exception(error)
+
+    @staticmethod
+    def _invalidate_cache(rows: List[Dict]):
+        """Yazılan satırların zaman aralığıyla kesişen önbellek kayıtlarını sil"""
+        ranges: Dict[int, Tuple[datetime, datetime]] = {}
+        for row in rows:
+            first, last = ranges.get(row["machine_id"], (row["timestamp"], row["timestamp"]))
+            ranges[row["machine_id"]] = (min(first, row["timestamp"]), max(last, row["timestamp"]))
+        for machine_id, (first, last) in ranges.items():
+            result_cache.invalidate(machine_id, first, last)
+
+    @staticmethod
+    def _apply_downtime_events(events: List[Dict]):
+        """Otomatik açılan/kapanan duruşları artımlı OEE'ye ve önbelleğe yansıt"""
+        for event in events:
+            if event["type"] == "opened":
+                oee_state.record_downtime(event["machine_id"], event["start_time"])
+                result_cache.invalidate(event["machine_id"], event["start_time"], datetime.max)
+            else:
+                oee_state.resolve_downtime(event["machine_id"], event["start_time"], event["end_time"])
+                result_cache.invalidate(event["machine_id"], event["start_time"], event["end_time"])
+
+    @staticmethod
+    async def _write(rows: List[Dict]) -> List[Dict]:
+        """Satırları yaz; aynı transaction'da algılanan duruş olaylarını döndür"""
+        async with AsyncSessionLocal() as db:
+            downtime_events = []
+            if settings.DOWNTIME_DETECTION_ENABLED:
+                downtime_events = await DowntimeDetector.detect(db, rows)
+            await DataService.bulk_insert_machine_data(db, rows)
+        return downtime_events
+
+# Global ingestion buffer instance
+ingestion_buffer = IngestionBuffer()
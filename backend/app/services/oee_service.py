@@ -1,51 +1,130 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import DateTime, and_, case, column, func, or_, select, table, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 from datetime import datetime, timedelta
-from app.models.database import MachineData, ProductionData, DowntimeReason
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.models.database import Machine, MachineData, MachineStateInterval, ProductionData, DowntimeReason
+from app.database.timescale import AGGREGATE_VIEWS, aggregate_for_window
+from app.database.sql_functions import bucket_floor, seconds_between
+from app.services.state_interval_service import StateIntervalService
+from app.services.data_service import DataService
+
+# Kova türü -> (genişlik, epoch'a göre ofset) saniye
+OEE_BUCKETS = {
+    "hour": (3600, 0),
+    "shift": (settings.SHIFT_HOURS * 3600, settings.SHIFT_START_HOUR * 3600),
+    "day": (86400, 0),
+}
 
 class OEEService:
     @staticmethod
-    def calculate_availability(db: Session, machine_id: int, start_time: datetime, end_time: datetime) -> float:
-        # Planlanan üretim süresi
-        planned_time = (end_time - start_time).total_seconds()
-        
-        # Çalışma süresi
-        running_data = db.query(MachineData).filter(
-            MachineData.machine_id == machine_id,
-            MachineData.timestamp.between(start_time, end_time),
-            MachineData.status == "running"
-        ).all()
-        
-        running_seconds = sum(
-            (min(record.timestamp, end_time) - max(record.timestamp, start_time)).total_seconds()
-            for record in running_data
-        )
+    def time_breakdown_query(machine_id: int, start_time: datetime, end_time: datetime):
+        """Çalışma ve duruş saniyelerini tek sorguda hesaplayan ifade"""
+        # Çalışma süresi durum aralıklarından: pencere başında süren durum da sayılır,
+        # açık (son) aralık pencere sonuna kadar geçerlidir
+        running_seconds = select(
+            func.coalesce(func.sum(StateIntervalService.clipped_seconds(start_time, end_time)), 0)
+        ).where(
+            MachineStateInterval.machine_id == machine_id,
+            MachineStateInterval.state == "running",
+            StateIntervalService.overlapping(start_time, end_time)
+        ).scalar_subquery()
         
-        # Duruş süresi
-        downtime_records = db.query(DowntimeReason).filter(
+        # Açık duruşlar pencere sonuna kadar sayılır
+        downtime_seconds = select(
+            func.coalesce(func.sum(seconds_between(
+                DowntimeReason.start_time,
+                func.coalesce(DowntimeReason.end_time, end_time)
+            )), 0)
+        ).where(
             DowntimeReason.machine_id == machine_id,
             DowntimeReason.start_time.between(start_time, end_time)
-        ).all()
+        ).scalar_subquery()
         
-        downtime_seconds = sum(
-            (record.end_time - record.start_time).total_seconds() if record.end_time
-            else (end_time - record.start_time).total_seconds()
-            for record in downtime_records
-        )
+        return select(running_seconds.label("running_seconds"), downtime_seconds.label("downtime_seconds"))
+
+    @staticmethod
+    def cycle_baseline(machine_id, start_time: datetime):
+        """Pencere başında geçerli çevrim sayacı: başlangıçtan önceki son örnek (en fazla hold_limit geride)"""
+        # Gateway sayacı değişmedikçe göndermez; pencerenin ilk örneği başlangıçtan sonra gelebilir
+        carried = aliased(MachineData)
+        return select(carried.cycle_count).where(
+            carried.machine_id == machine_id,
+            carried.timestamp < start_time,
+            carried.timestamp >= start_time - DataService.hold_limit(),
+            carried.cycle_count.isnot(None)
+        ).order_by(carried.timestamp.desc()).limit(1).scalar_subquery()
+
+    @staticmethod
+    def cycles_since(baseline, cycle_min, cycle_max):
+        """Sayaç farkı; taşınan değer yoksa (ya da sayaç sıfırlandıysa) penceredeki en küçük değerden"""
+        return cycle_max - case((baseline < cycle_min, baseline), else_=cycle_min)
+
+    @staticmethod
+    async def cycle_baselines(db: AsyncSession, machine_ids: List[int], start_time: datetime) -> Dict[int, int]:
+        """Makine başına start_time'da geçerli çevrim sayacı (taşınacak değeri olanlar)"""
+        result = await db.execute(select(
+            Machine.id, OEEService.cycle_baseline(Machine.id, start_time)
+        ).where(Machine.id.in_(machine_ids)))
+        return {machine_id: baseline for machine_id, baseline in result if baseline is not None}
+
+    @staticmethod
+    async def calculate_time_breakdown(db: AsyncSession, machine_id: int, start_time: datetime, end_time: datetime) -> dict:
+        result = await db.execute(OEEService.time_breakdown_query(machine_id, start_time, end_time))
+        row = result.one()
+        return {
+            "running_seconds": float(row.running_seconds),
+            "downtime_seconds": float(row.downtime_seconds)
+        }
+
+    @staticmethod
+    async def calculate_availability(db: AsyncSession, machine_id: int, start_time: datetime, end_time: datetime) -> float:
+        breakdown = await OEEService.calculate_time_breakdown(db, machine_id, start_time, end_time)
+        return OEEService.availability_from(breakdown, start_time, end_time)
+
+    @staticmethod
+    def availability_from(breakdown: dict, start_time: datetime, end_time: datetime) -> float:
+        # Planlanan üretim süresi
+        planned_time = (end_time - start_time).total_seconds()
         
-        availability = (planned_time - downtime_seconds) / planned_time
+        availability = (planned_time - breakdown["downtime_seconds"]) / planned_time
         return max(0, min(availability, 1.0))
 
     @staticmethod
-    def calculate_performance(db: Session, machine_id: int, start_time: datetime, end_time: datetime) -> float:
-        # Ideal çevrim süresi
-        machine = db.query(Machine).filter(Machine.id == machine_id).first()
-        ideal_cycle_time = machine.ideal_cycle_time if machine else 1.0
-        
-        # Toplam çevrim sayısı
-        total_cycles = db.query(MachineData.cycle_count).filter(
-            MachineData.machine_id == machine_id,
-            MachineData.timestamp.between(start_time, end_time)
-        ).scalar() or 0
+    async def calculate_performance(db: AsyncSession, machine_id: int, start_time: datetime, end_time: datetime) -> float:
+        # Ideal çevrim süresi ve toplam çevrim sayısı (sayaç farkı) tek sorguda
+        view = aggregate_for_window(start_time, end_time)
+        if view:
+            # LEAST NULL'ları atlar: taşınan sayaç yoksa penceredeki en küçük değer
+            result = await db.execute(text(f"""
+                SELECT COALESCE((SELECT ideal_cycle_time FROM machines WHERE id = :machine_id), 1.0),
+                       MAX(cycle_max) - LEAST(MIN(cycle_min), (
+                           SELECT cycle_count FROM machine_data
+                           WHERE machine_id = :machine_id AND cycle_count IS NOT NULL
+                           AND timestamp < :start_time AND timestamp >= :hold_start
+                           ORDER BY timestamp DESC LIMIT 1
+                       ))
+                FROM {view}
+                WHERE machine_id = :machine_id
+                AND bucket >= :start_time AND bucket < :end_time
+            """), {"machine_id": machine_id, "start_time": start_time, "end_time": end_time,
+                  "hold_start": start_time - DataService.hold_limit()})
+        else:
+            ideal_cycle_time = select(Machine.ideal_cycle_time).where(Machine.id == machine_id).scalar_subquery()
+            result = await db.execute(select(
+                func.coalesce(ideal_cycle_time, 1.0),
+                OEEService.cycles_since(
+                    OEEService.cycle_baseline(machine_id, start_time),
+                    func.min(MachineData.cycle_count),
+                    func.max(MachineData.cycle_count)
+                )
+            ).where(
+                MachineData.machine_id == machine_id,
+                MachineData.timestamp.between(start_time, end_time)
+            ))
+        ideal_cycle_time, total_cycles = result.one()
+        total_cycles = total_cycles or 0
         
         # Planlanan çevrim sayısı
         running_time = (end_time - start_time).total_seconds()
@@ -55,26 +134,27 @@ class OEEService:
         return max(0, min(performance, 1.0))
 
     @staticmethod
-    def calculate_quality(db: Session, machine_id: int, start_time: datetime, end_time: datetime) -> float:
-        # Üretim verileri
-        production_data = db.query(ProductionData).filter(
+    async def calculate_quality(db: AsyncSession, machine_id: int, start_time: datetime, end_time: datetime) -> float:
+        # Üretim toplamları pencereyle kesişen vardiyalardan (shift_date 'YYYY-MM-DD' metni olarak saklanır)
+        result = await db.execute(select(
+            func.coalesce(func.sum(ProductionData.good_parts), 0),
+            func.coalesce(func.sum(ProductionData.defective_parts), 0)
+        ).where(
             ProductionData.machine_id == machine_id,
-            ProductionData.shift_date >= start_time.date(),
-            ProductionData.shift_date <= end_time.date()
-        ).all()
-        
-        total_good = sum(data.good_parts for data in production_data)
-        total_defective = sum(data.defective_parts for data in production_data)
+            OEEService.production_window(start_time, end_time)
+        ))
+        total_good, total_defective = result.one()
         total_parts = total_good + total_defective
         
         quality = total_good / total_parts if total_parts > 0 else 1.0
         return max(0, min(quality, 1.0))
 
     @staticmethod
-    def calculate_oee(db: Session, machine_id: int, start_time: datetime, end_time: datetime) -> dict:
-        availability = OEEService.calculate_availability(db, machine_id, start_time, end_time)
-        performance = OEEService.calculate_performance(db, machine_id, start_time, end_time)
-        quality = OEEService.calculate_quality(db, machine_id, start_time, end_time)
+    async def calculate_oee(db: AsyncSession, machine_id: int, start_time: datetime, end_time: datetime) -> dict:
+        breakdown = await OEEService.calculate_time_breakdown(db, machine_id, start_time, end_time)
+        availability = OEEService.availability_from(breakdown, start_time, end_time)
+        performance = await OEEService.calculate_performance(db, machine_id, start_time, end_time)
+        quality = await OEEService.calculate_quality(db, machine_id, start_time, end_time)
         
         oee = availability * performance * quality
         
@@ -83,5 +163,377 @@ class OEEService:
             "performance": performance,
             "quality": quality,
             "oee": oee,
+            "running_seconds": breakdown["running_seconds"],
+            "downtime_seconds": breakdown["downtime_seconds"],
             "timestamp": datetime.utcnow()
         }
+
+    @staticmethod
+    def fleet_oee_query(start_time: datetime, end_time: datetime, machine_type: Optional[str] = None):
+        """Tüm makineler için OEE bileşenlerini tek gruplu sorguda hesaplayan ifade"""
+        machine_ids = select(Machine.id)
+        if machine_type:
+            machine_ids = machine_ids.where(Machine.type == machine_type)
+        
+        running_totals = select(
+            MachineStateInterval.machine_id,
+            func.sum(StateIntervalService.clipped_seconds(start_time, end_time)).label("running_seconds")
+        ).where(
+            MachineStateInterval.machine_id.in_(machine_ids),
+            MachineStateInterval.state == "running",
+            StateIntervalService.overlapping(start_time, end_time)
+        ).group_by(MachineStateInterval.machine_id).subquery()
+        
+        cycle_totals = select(
+            MachineData.machine_id,
+            OEEService.cycles_since(
+                OEEService.cycle_baseline(MachineData.machine_id, start_time),
+                func.min(MachineData.cycle_count),
+                func.max(MachineData.cycle_count)
+            ).label("total_cycles")
+        ).where(
+            MachineData.machine_id.in_(machine_ids),
+            MachineData.timestamp.between(start_time, end_time)
+        ).group_by(MachineData.machine_id).subquery()
+        
+        # Açık duruşlar pencere sonuna kadar sayılır
+        downtime_totals = select(
+            DowntimeReason.machine_id,
+            func.sum(seconds_between(
+                DowntimeReason.start_time,
+                func.coalesce(DowntimeReason.end_time, end_time)
+            )).label("downtime_seconds")
+        ).where(
+            DowntimeReason.machine_id.in_(machine_ids),
+            DowntimeReason.start_time.between(start_time, end_time)
+        ).group_by(DowntimeReason.machine_id).subquery()
+        
+        production_totals = select(
+            ProductionData.machine_id,
+            func.sum(ProductionData.good_parts).label("good_parts"),
+            func.sum(ProductionData.defective_parts).label("defective_parts")
+        ).where(
+            ProductionData.machine_id.in_(machine_ids),
+            OEEService.production_window(start_time, end_time)
+        ).group_by(ProductionData.machine_id).subquery()
+        
+        query = select(
+            Machine.id.label("machine_id"),
+            Machine.name,
+            Machine.type,
+            func.coalesce(Machine.ideal_cycle_time, 1.0).label("ideal_cycle_time"),
+            func.coalesce(running_totals.c.running_seconds, 0).label("running_seconds"),
+            func.coalesce(cycle_totals.c.total_cycles, 0).label("total_cycles"),
+            func.coalesce(downtime_totals.c.downtime_seconds, 0).label("downtime_seconds"),
+            func.coalesce(production_totals.c.good_parts, 0).label("good_parts"),
+            func.coalesce(production_totals.c.defective_parts, 0).label("defective_parts")
+        ).outerjoin(
+            running_totals, running_totals.c.machine_id == Machine.id
+        ).outerjoin(
+            cycle_totals, cycle_totals.c.machine_id == Machine.id
+        ).outerjoin(
+            downtime_totals, downtime_totals.c.machine_id == Machine.id
+        ).outerjoin(
+            production_totals, production_totals.c.machine_id == Machine.id
+        ).order_by(Machine.id)
+        
+        if machine_type:
+            query = query.where(Machine.type == machine_type)
+        return query
+
+    @staticmethod
+    async def calculate_fleet_oee(db: AsyncSession, start_time: datetime, end_time: datetime,
+                                  machine_type: Optional[str] = None, by_shift: bool = False) -> List[Dict]:
+        """Filodaki her makine için OEE; istenirse makine başına vardiya kırılımıyla"""
+        result = await db.execute(OEEService.fleet_oee_query(start_time, end_time, machine_type))
+        planned_time = (end_time - start_time).total_seconds()
+        
+        fleet = []
+        for row in result:
+            breakdown = {"running_seconds": float(row.running_seconds), "downtime_seconds": float(row.downtime_seconds)}
+            availability = OEEService.availability_from(breakdown, start_time, end_time)
+            
+            planned_cycles = planned_time / row.ideal_cycle_time
+            performance = max(0, min(row.total_cycles / planned_cycles if planned_cycles > 0 else 0, 1.0))
+            
+            total_parts = row.good_parts + row.defective_parts
+            quality = max(0, min(row.good_parts / total_parts if total_parts > 0 else 1.0, 1.0))
+            
+            fleet.append({
+                "machine_id": row.machine_id,
+                "name": row.name,
+                "type": row.type,
+                "availability": availability,
+                "performance": performance,
+                "quality": quality,
+                "oee": availability * performance * quality,
+                "running_seconds": breakdown["running_seconds"],
+                "downtime_seconds": breakdown["downtime_seconds"],
+                "ideal_cycle_time": row.ideal_cycle_time
+            })
+        
+        if by_shift and fleet:
+            # Vardiya kırılımı makine sayısından bağımsız olarak üç gruplu sorgu
+            machine_ids = [entry["machine_id"] for entry in fleet]
+            width, offset = OEE_BUCKETS["shift"]
+            samples = await OEEService._bucketed_samples(db, machine_ids, start_time, end_time, width, offset)
+            downtime = await OEEService._bucketed_downtime(db, machine_ids, start_time, end_time, width, offset)
+            production = await OEEService._shift_production(db, machine_ids, start_time, end_time)
+            for entry in fleet:
+                machine_id = entry["machine_id"]
+                entry["shifts"] = OEEService._bucket_rows(
+                    "shift", start_time, end_time, entry["ideal_cycle_time"],
+                    samples.get(machine_id, {}), downtime.get(machine_id, {}), production.get(machine_id, {})
+                )
+        
+        return fleet
+
+    @staticmethod
+    async def calculate_bucketed_oee(db: AsyncSession, machine_id: int, start_time: datetime, end_time: datetime,
+                                     bucket: str = "day") -> List[Dict]:
+        """[start_time, end_time) aralığındaki her kova için OEE; kaynak başına tek gruplu sorgu"""
+        width, offset = OEE_BUCKETS[bucket]
+        
+        machine = await db.get(Machine, machine_id)
+        ideal_cycle_time = machine.ideal_cycle_time if machine else 1.0
+        
+        samples = await OEEService._bucketed_samples(db, [machine_id], start_time, end_time, width, offset)
+        downtime = await OEEService._bucketed_downtime(db, [machine_id], start_time, end_time, width, offset)
+        production = await OEEService._shift_production(db, [machine_id], start_time, end_time)
+        
+        return OEEService._bucket_rows(
+            bucket, start_time, end_time, ideal_cycle_time,
+            samples.get(machine_id, {}), downtime.get(machine_id, {}), production.get(machine_id, {})
+        )
+
+    @staticmethod
+    def _bucket_rows(bucket: str, start_time: datetime, end_time: datetime, ideal_cycle_time: float,
+                     samples: Dict, downtime: Dict, production: Dict) -> List[Dict]:
+        """Tek makinenin kova toplamlarından kova başına OEE satırları üret"""
+        width, offset = OEE_BUCKETS[bucket]
+        daily_production = OEEService._daily_totals(production)
+        
+        results = []
+        bucket_start = OEEService._floor(start_time, width, offset)
+        while bucket_start < end_time:
+            bucket_end = bucket_start + timedelta(seconds=width)
+            window_start, window_end = max(bucket_start, start_time), min(bucket_end, end_time)
+            planned_time = (window_end - window_start).total_seconds()
+            
+            # Availability: kapalı duruşlar + açık duruşun kova sonuna kadarki kısmı
+            closed_seconds, open_since = downtime.get(bucket_start, (0, None))
+            downtime_seconds = closed_seconds + ((window_end - open_since).total_seconds() if open_since else 0)
+            availability = max(0, min((planned_time - downtime_seconds) / planned_time, 1.0))
+            
+            running_seconds, total_cycles = samples.get(bucket_start, (0, 0))
+            planned_cycles = planned_time / ideal_cycle_time
+            performance = max(0, min(total_cycles / planned_cycles if planned_cycles > 0 else 0, 1.0))
+            
+            shift_date, shift_number = OEEService._shift_of(bucket_start)
+            if bucket == "shift":
+                good, defective = production.get((shift_date, shift_number), (0, 0))
+            else:
+                good, defective = daily_production.get(bucket_start.date().isoformat(), (0, 0))
+            quality = max(0, min(good / (good + defective) if good + defective > 0 else 1.0, 1.0))
+            
+            results.append({
+                "bucket_start": bucket_start,
+                "shift_date": shift_date,
+                "shift_number": shift_number if bucket == "shift" else None,
+                "availability": availability,
+                "performance": performance,
+                "quality": quality,
+                "oee": availability * performance * quality,
+                "running_seconds": running_seconds,
+                "downtime_seconds": downtime_seconds
+            })
+            bucket_start = bucket_end
+        
+        return results
+
+    @staticmethod
+    async def _bucketed_samples(db: AsyncSession, machine_ids: List[int], start_time: datetime, end_time: datetime,
+                                width: int, offset: int) -> Dict[int, Dict[datetime, Tuple[float, int]]]:
+        """Makine ve kova başına çalışma saniyesi ve çevrim sayısı"""
+        view = aggregate_for_window(start_time, end_time)
+        view_width = int(dict(AGGREGATE_VIEWS)[view].total_seconds()) if view else None
+        
+        if view and width % view_width == 0 and offset % view_width == 0:
+            aggregate = table(view, column("machine_id"), column("bucket", DateTime), column("cycle_min"), column("cycle_max"))
+            bucket_col = bucket_floor(aggregate.c.bucket, width, offset).label("bucket")
+            query = select(
+                aggregate.c.machine_id,
+                bucket_col,
+                func.min(aggregate.c.cycle_min),
+                func.max(aggregate.c.cycle_max)
+            ).where(
+                aggregate.c.machine_id.in_(machine_ids),
+                aggregate.c.bucket >= start_time,
+                aggregate.c.bucket < end_time
+            ).group_by(aggregate.c.machine_id, bucket_col)
+        else:
+            bucket_col = bucket_floor(MachineData.timestamp, width, offset).label("bucket")
+            query = select(
+                MachineData.machine_id,
+                bucket_col,
+                func.min(MachineData.cycle_count),
+                func.max(MachineData.cycle_count)
+            ).where(
+                MachineData.machine_id.in_(machine_ids),
+                MachineData.timestamp >= start_time,
+                MachineData.timestamp < end_time
+            ).group_by(MachineData.machine_id, bucket_col)
+        
+        # Kovanın sayaç başlangıcı bir önceki kovanın son değeridir (kovalar arası vuruşlar kaybolmaz);
+        # ilk kova pencere başında geçerli değerden başlar
+        ranges = {}
+        for machine_id, bucket_start, cycle_min, cycle_max in await db.execute(query):
+            ranges.setdefault(machine_id, []).append((bucket_start, cycle_min, cycle_max))
+        baselines = await OEEService.cycle_baselines(db, list(ranges), start_time)
+        cycles = {}
+        for machine_id, machine_ranges in ranges.items():
+            machine_cycles = cycles[machine_id] = {}
+            previous_start, previous_max = None, None
+            for bucket_start, cycle_min, cycle_max in sorted(machine_ranges, key=lambda item: item[0]):
+                if cycle_max is None:
+                    continue
+                if previous_start is None:
+                    baseline = baselines.get(machine_id)
+                elif previous_start + timedelta(seconds=width) == bucket_start:
+                    baseline = previous_max
+                else:
+                    baseline = None
+                if baseline is not None and baseline < cycle_min:
+                    cycle_min = baseline
+                machine_cycles[bucket_start] = cycle_max - cycle_min
+                previous_start, previous_max = bucket_start, cycle_max
+        
+        # Çalışma aralıkları (pencere başına birkaç satır) kovalara Python'da bölünür
+        running = {}
+        for interval in await StateIntervalService.timeline(db, machine_ids, start_time, end_time, state="running"):
+            machine_running = running.setdefault(interval["machine_id"], {})
+            cursor = interval["start_time"]
+            while cursor < interval["end_time"]:
+                bucket_start = OEEService._floor(cursor, width, offset)
+                bucket_end = min(bucket_start + timedelta(seconds=width), interval["end_time"])
+                machine_running[bucket_start] = machine_running.get(bucket_start, 0.0) + (bucket_end - cursor).total_seconds()
+                cursor = bucket_end
+        
+        buckets = {}
+        for machine_id in set(cycles) | set(running):
+            machine_cycles, machine_running = cycles.get(machine_id, {}), running.get(machine_id, {})
+            buckets[machine_id] = {
+                bucket_start: (machine_running.get(bucket_start, 0.0), machine_cycles.get(bucket_start, 0))
+                for bucket_start in set(machine_cycles) | set(machine_running)
+            }
+        return buckets
+
+    @staticmethod
+    async def _bucketed_downtime(db: AsyncSession, machine_ids: List[int], start_time: datetime, end_time: datetime,
+                                 width: int, offset: int) -> Dict[int, Dict[datetime, Tuple[float, datetime]]]:
+        """Makine ve kova başına kapalı duruş saniyesi ve en erken açık duruşun başlangıcı"""
+        bucket_col = bucket_floor(DowntimeReason.start_time, width, offset).label("bucket")
+        result = await db.execute(select(
+            DowntimeReason.machine_id,
+            bucket_col,
+            func.coalesce(func.sum(case(
+                (DowntimeReason.end_time.isnot(None), seconds_between(DowntimeReason.start_time, DowntimeReason.end_time)),
+                else_=0
+            )), 0),
+            func.min(case((DowntimeReason.end_time.is_(None), DowntimeReason.start_time), else_=None))
+        ).where(
+            DowntimeReason.machine_id.in_(machine_ids),
+            DowntimeReason.start_time >= start_time,
+            DowntimeReason.start_time < end_time
+        ).group_by(DowntimeReason.machine_id, bucket_col))
+        
+        downtime = {}
+        for machine_id, bucket_start, closed_seconds, open_since in result:
+            # SQLite min() sonucu metin döner
+            if isinstance(open_since, str):
+                open_since = datetime.fromisoformat(open_since)
+            downtime.setdefault(machine_id, {})[bucket_start] = (float(closed_seconds), open_since)
+        return downtime
+
+    @staticmethod
+    async def _shift_production(db: AsyncSession, machine_ids: List[int], start_time: datetime,
+                                end_time: datetime) -> Dict[int, Dict[Tuple[str, int], Tuple[int, int]]]:
+        """Makine ve (shift_date, shift_number) başına iyi ve hatalı parça toplamları"""
+        result = await db.execute(select(
+            ProductionData.machine_id,
+            ProductionData.shift_date,
+            ProductionData.shift_number,
+            func.sum(ProductionData.good_parts),
+            func.sum(ProductionData.defective_parts)
+        ).where(
+            ProductionData.machine_id.in_(machine_ids),
+            ProductionData.shift_date >= start_time.date().isoformat(),
+            ProductionData.shift_date <= end_time.date().isoformat()
+        ).group_by(ProductionData.machine_id, ProductionData.shift_date, ProductionData.shift_number))
+        
+        production = {}
+        for machine_id, shift_date, shift_number, good, defective in result:
+            production.setdefault(machine_id, {})[(shift_date, shift_number)] = (good or 0, defective or 0)
+        return production
+
+    @staticmethod
+    def _daily_totals(production: Dict[Tuple[str, int], Tuple[int, int]]) -> Dict[str, Tuple[int, int]]:
+        daily = {}
+        for (shift_date, _), (good, defective) in production.items():
+            day_good, day_defective = daily.get(shift_date, (0, 0))
+            daily[shift_date] = (day_good + good, day_defective + defective)
+        return daily
+
+    @staticmethod
+    def _floor(value: datetime, width: int, offset: int) -> datetime:
+        epoch = datetime(1970, 1, 1)
+        seconds = (value - epoch).total_seconds()
+        return epoch + timedelta(seconds=(seconds - offset) // width * width + offset)
+
+    @staticmethod
+    def shifts_overlapping(start_time: datetime, end_time: datetime) -> List[Tuple[str, int]]:
+        """Pencereyle kesişen vardiyalar; boş pencerede başlangıcı içeren vardiya"""
+        width, offset = OEE_BUCKETS["shift"]
+        shift_start = OEEService._floor(start_time, width, offset)
+        shifts = [OEEService._shift_of(shift_start)]
+        shift_start += timedelta(seconds=width)
+        while shift_start < end_time:
+            shifts.append(OEEService._shift_of(shift_start))
+            shift_start += timedelta(seconds=width)
+        return shifts
+
+    @staticmethod
+    def production_window(start_time: datetime, end_time: datetime):
+        """Üretim kaydını pencereye atayan koşul: kaydın vardiyası pencereyle kesişir.
+        Anlık vardiya/gün durumu (oee_state) da aynı kuralı kullanır."""
+        width, _ = OEE_BUCKETS["shift"]
+        shifts_by_date = {}
+        for shift_date, shift_number in OEEService.shifts_overlapping(start_time, end_time):
+            shifts_by_date.setdefault(shift_date, []).append(shift_number)
+        # Tamamı kesişen günler aralık olarak, kenar günler vardiya numarasıyla
+        full_dates = [shift_date for shift_date, numbers in shifts_by_date.items() if len(numbers) == 86400 // width]
+        conditions = [
+            and_(ProductionData.shift_date == shift_date, ProductionData.shift_number.in_(numbers))
+            for shift_date, numbers in shifts_by_date.items() if shift_date not in full_dates
+        ]
+        if full_dates:
+            conditions.append(ProductionData.shift_date.between(min(full_dates), max(full_dates)))
+        return or_(*conditions)
+
+    @staticmethod
+    def _shift_bounds(shift_date: str, shift_number: int) -> Tuple[datetime, datetime]:
+        """Vardiyanın başlangıç ve bitiş zamanı (_shift_of'un tersi)"""
+        start = datetime.fromisoformat(shift_date) + timedelta(
+            hours=settings.SHIFT_START_HOUR + (shift_number - 1) * settings.SHIFT_HOURS
+        )
+        return start, start + timedelta(hours=settings.SHIFT_HOURS)
+
+    @staticmethod
+    def _shift_of(value: datetime) -> Tuple[str, int]:
+        """Zamanın ait olduğu vardiya: (vardiyanın başladığı gün, vardiya numarası)"""
+        shift_seconds = settings.SHIFT_HOURS * 3600
+        shift_start = OEEService._floor(value, shift_seconds, settings.SHIFT_START_HOUR * 3600)
+        # Gece vardiyası başladığı güne yazılır
+        shifted = shift_start - timedelta(hours=settings.SHIFT_START_HOUR)
+        shift_number = (shifted.hour * 3600 + shifted.minute * 60) // shift_seconds + 1
+        return shifted.date().isoformat(), shift_number
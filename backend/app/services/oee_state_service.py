@@ -0,0 +1,366 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy import and_, delete, func, insert, or_, select
+from app.core.config import settings
+from app.models.database import AsyncSessionLocal, Machine, MachineData, ProductionData, DowntimeReason, OEEStateCheckpoint
+from app.services.oee_service import OEEService, OEE_BUCKETS
+from app.services.data_service import DataService
+from app.services.state_interval_service import StateIntervalService
+from app.services.websocket_service import websocket_manager
+
+logger = logging.getLogger(__name__)
+
+# Artımlı izlenen dönem -> OEE_BUCKETS kova türü
+OEE_PERIODS = {"shift": "shift", "today": "day"}
+
+class _PeriodState:
+    """Tek makinenin içinde bulunulan vardiya ya da gün için OEE toplamları"""
+    def __init__(self, kind: str, start: datetime):
+        width, _ = OEE_BUCKETS[OEE_PERIODS[kind]]
+        self.kind = kind
+        self.start = start
+        self.end = start + timedelta(seconds=width)
+
+        # machine_data'dan türetilen kısım (checkpoint'e yazılır)
+        self.running_seconds = 0.0
+        self.cycle_min: Optional[int] = None
+        self.cycle_max: Optional[int] = None
+        self.last_status: Optional[str] = None
+        self.last_timestamp: Optional[datetime] = None
+        self.last_cycle_count: Optional[int] = None
+
+        # Duruş ve üretim tablolarından gelen kısım (açılışta yeniden okunur)
+        self.closed_downtime = 0.0
+        self.open_downtime: Dict[datetime, int] = {}
+        self.production: Dict[Tuple[str, int], Tuple[int, int]] = {}
+
+    def _held_seconds(self, until: datetime) -> float:
+        # Durum aralıklarıyla aynı: son örnek en fazla hold_limit boyunca geçerlidir, daha uzun
+        # boşlukta aralık son örnekte kapanmıştır. Önceki dönemden taşınan örnek dönem başından sayılır.
+        if self.last_status != "running" or until - self.last_timestamp > DataService.hold_limit():
+            return 0.0
+        return max((until - max(self.last_timestamp, self.start)).total_seconds(), 0)
+
+    def observe(self, timestamp: datetime, status: str, cycle_count: Optional[int]):
+        # OEEService ile aynı: her örnek bir sonraki örneğe kadar geçerlidir.
+        # Sıra dışı gelen eski örnekler yalnızca çevrim sayacına katkı verir.
+        if self.last_timestamp is None or timestamp >= self.last_timestamp:
+            if self.last_timestamp is not None:
+                self.running_seconds += self._held_seconds(timestamp)
+            self.last_status = status
+            self.last_timestamp = timestamp
+            if cycle_count is not None:
+                self.last_cycle_count = cycle_count
+
+        if cycle_count is not None:
+            self.cycle_min = cycle_count if self.cycle_min is None else min(self.cycle_min, cycle_count)
+            self.cycle_max = cycle_count if self.cycle_max is None else max(self.cycle_max, cycle_count)
+
+    def carry_in(self, status: Optional[str], cycle_count: Optional[int] = None, last_seen: Optional[datetime] = None):
+        """Dönem başında süren durum (durum aralıkları gibi) başlangıçtan itibaren sayılır, geçerli sayaç taban olur"""
+        if status is not None:
+            self.last_status = status
+            self.last_timestamp = min(last_seen or self.start, self.start)
+        if cycle_count is not None:
+            self.cycle_min = self.cycle_max = self.last_cycle_count = cycle_count
+
+    def covers(self, timestamp: datetime) -> bool:
+        return self.start <= timestamp < self.end
+
+    def covers_production(self, shift_date: str, shift_number: int) -> bool:
+        # OEEService.production_window ile aynı: dönemle kesişen vardiyanın üretimi
+        shift_start, shift_end = OEEService._shift_bounds(shift_date, shift_number)
+        return shift_start < self.end and shift_end > self.start
+
+    def add_production(self, shift_date: str, shift_number: int, good_parts: int, defective_parts: int):
+        good, defective = self.production.get((shift_date, shift_number), (0, 0))
+        self.production[(shift_date, shift_number)] = (good + (good_parts or 0), defective + (defective_parts or 0))
+
+    def snapshot(self, now: datetime, ideal_cycle_time: float) -> Optional[Dict]:
+        """Dönem başından şu ana kadar calculate_oee ile aynı sonuç"""
+        end_time = min(now, self.end)
+        planned_time = (end_time - self.start).total_seconds()
+        if planned_time <= 0:
+            return None
+
+        # Son örnek (kesintide değilse) ve açık duruşlar pencere sonuna kadar sayılır
+        running_seconds = self.running_seconds
+        if self.last_timestamp is not None:
+            running_seconds += self._held_seconds(end_time)
+        downtime_seconds = self.closed_downtime + sum(
+            (end_time - start_time).total_seconds() * count
+            for start_time, count in self.open_downtime.items()
+        )
+        availability = OEEService.availability_from({"downtime_seconds": downtime_seconds}, self.start, end_time)
+
+        total_cycles = self.cycle_max - self.cycle_min if self.cycle_min is not None else 0
+        planned_cycles = planned_time / ideal_cycle_time
+        performance = max(0, min(total_cycles / planned_cycles if planned_cycles > 0 else 0, 1.0))
+
+        # Yalnızca şu ana kadar başlamış vardiyalar pencereyle kesişir
+        shifts = set(OEEService.shifts_overlapping(self.start, end_time))
+        good_parts = sum(good for shift, (good, _) in self.production.items() if shift in shifts)
+        defective_parts = sum(defective for shift, (_, defective) in self.production.items() if shift in shifts)
+        total_parts = good_parts + defective_parts
+        quality = max(0, min(good_parts / total_parts if total_parts > 0 else 1.0, 1.0))
+
+        return {
+            "availability": availability,
+            "performance": performance,
+            "quality": quality,
+            "oee": availability * performance * quality,
+            "running_seconds": running_seconds,
+            "downtime_seconds": downtime_seconds,
+            "period_start": self.start,
+            "timestamp": now
+        }
+
+class OEEStateStore:
+    """Makine başına artımlı OEE durumu; ingestion ile güncellenir, periyodik olarak kaydedilir"""
+    def __init__(self, checkpoint_interval: float = settings.OEE_CHECKPOINT_INTERVAL):
+        self.checkpoint_interval = checkpoint_interval
+
+        self._machines: Dict[int, Dict[str, _PeriodState]] = {}
+        self._ideal_cycle_times: Dict[int, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self.loaded = False
+
+        self.stats = {"observed": 0, "checkpoints": 0, "replayed": 0}
+
+    @staticmethod
+    def current_window(period: str, now: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+        """Dönemin başlangıcı ve şimdiki zaman"""
+        now = now or datetime.utcnow()
+        width, offset = OEE_BUCKETS[OEE_PERIODS[period]]
+        return OEEService._floor(now, width, offset), now
+
+    def _period(self, machine_id: int, kind: str, at: datetime) -> _PeriodState:
+        """Makinenin dönem durumu; zaman dönemi aştıysa yeni döneme geç"""
+        periods = self._machines.setdefault(machine_id, {})
+        state = periods.get(kind)
+        if state is None or at >= state.end:
+            start, _ = self.current_window(kind, at)
+            previous = state
+            state = periods[kind] = _PeriodState(kind, start)
+            if previous is not None and previous.last_status is not None:
+                # Sayaç en fazla hold_limit kadar eski ise taşınır (sorgu tarafıyla aynı sınır)
+                fresh_count = previous.last_timestamp >= start - DataService.hold_limit()
+                state.carry_in(previous.last_status, previous.last_cycle_count if fresh_count else None, previous.last_timestamp)
+        return state
+
+    def observe(self, rows: Iterable[Dict]):
+        """Veritabanına yazılmış machine_data satırlarını dönem toplamlarına ekle"""
+        latest = {}
+        count = 0
+        for row in sorted(rows, key=lambda row: (row["machine_id"], row["timestamp"])):
+            for kind in OEE_PERIODS:
+                state = self._period(row["machine_id"], kind, row["timestamp"])
+                if state.covers(row["timestamp"]):
+                    state.observe(row["timestamp"], row["status"], row.get("cycle_count"))
+            latest[row["machine_id"]] = row
+            count += 1
+        self.stats["observed"] += count
+
+        for machine_id, row in latest.items():
+            data = {key: value for key, value in row.items() if key != "machine_id"}
+            websocket_manager.update_machine_cache(machine_id, data)
+            # Batch başına makinenin son satırı; istemci tarafında ayrıca birleştirilir
+            websocket_manager.publish_machine_update(machine_id, data)
+
+    def record_downtime(self, machine_id: int, start_time: datetime, end_time: Optional[datetime] = None):
+        """Yeni duruş kaydı; end_time yoksa duruş açıktır"""
+        for kind in OEE_PERIODS:
+            state = self._period(machine_id, kind, start_time)
+            if not state.covers(start_time):
+                continue
+            if end_time is None:
+                state.open_downtime[start_time] = state.open_downtime.get(start_time, 0) + 1
+            else:
+                state.closed_downtime += (end_time - start_time).total_seconds()
+
+    def resolve_downtime(self, machine_id: int, start_time: datetime, end_time: datetime):
+        """Açık duruşu kapat"""
+        for kind in OEE_PERIODS:
+            state = self._machines.get(machine_id, {}).get(kind)
+            if state is None or not state.open_downtime.get(start_time):
+                continue
+            state.open_downtime[start_time] -= 1
+            if not state.open_downtime[start_time]:
+                del state.open_downtime[start_time]
+            state.closed_downtime += (end_time - start_time).total_seconds()
+
+    def record_production(self, machine_id: int, shift_date: str, shift_number: int, good_parts: int, defective_parts: int):
+        """Üretim kaydı değişikliğini (fark olarak) ekle"""
+        for kind in OEE_PERIODS:
+            state = self._machines.get(machine_id, {}).get(kind)
+            if state is not None and state.covers_production(shift_date, shift_number):
+                state.add_production(shift_date, shift_number, good_parts, defective_parts)
+
+    def snapshot(self, machine_id: int, period: str, now: Optional[datetime] = None) -> Optional[Dict]:
+        """İçinde bulunulan vardiya/gün için OEE; durum yoksa None (çağıran hesaplar)"""
+        if not self.loaded or period not in OEE_PERIODS or machine_id not in self._ideal_cycle_times:
+            return None
+        now = now or datetime.utcnow()
+        state = self._period(machine_id, period, now)
+        return state.snapshot(now, self._ideal_cycle_times[machine_id])
+
+    async def start(self):
+        """Durumu yükle ve checkpoint görevini başlat (ingestion'dan önce)"""
+        if self._task is not None:
+            return
+        await self.load()
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Checkpoint görevini durdur ve son durumu kaydet (ingestion durduktan sonra)"""
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+        await self.checkpoint()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.checkpoint_interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.checkpoint()
+            except Exception:
+                logger.exception("Failed to checkpoint OEE state")
+            try:
+                await self.refresh_machines()
+            except Exception:
+                logger.exception("Failed to refresh machine list")
+
+    async def refresh_machines(self):
+        """Yüklemeden sonra eklenen makineleri ve değişen ideal çevrim sürelerini al"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(Machine.id, Machine.ideal_cycle_time))
+            self._ideal_cycle_times = {machine_id: ideal or 1.0 for machine_id, ideal in result}
+
+    def knows(self, machine_id: int) -> bool:
+        return machine_id in self._ideal_cycle_times
+
+    async def load(self):
+        """Checkpoint'ten geri yükle, sonrasındaki örnekleri ve duruş/üretim kayıtlarını yeniden oku"""
+        now = datetime.utcnow()
+        self._machines = {}
+
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(Machine.id, Machine.ideal_cycle_time))
+            self._ideal_cycle_times = {machine_id: ideal or 1.0 for machine_id, ideal in result}
+            for machine_id in self._ideal_cycle_times:
+                for kind in OEE_PERIODS:
+                    self._period(machine_id, kind, now)
+
+            # Dönemi hâlâ geçerli olan checkpoint'ler; sonrası machine_data'dan tamamlanır
+            replay_after, restored = {}, set()
+            result = await db.execute(select(OEEStateCheckpoint))
+            for checkpoint in result.scalars():
+                state = self._machines.get(checkpoint.machine_id, {}).get(checkpoint.period)
+                if state is None or state.start != checkpoint.period_start:
+                    continue
+                restored.add((checkpoint.machine_id, checkpoint.period))
+                state.running_seconds = checkpoint.running_seconds or 0.0
+                state.cycle_min, state.cycle_max = checkpoint.cycle_min, checkpoint.cycle_max
+                state.last_status, state.last_timestamp = checkpoint.last_status, checkpoint.last_timestamp
+                if checkpoint.last_timestamp is not None:
+                    replay_after[(checkpoint.machine_id, checkpoint.period)] = checkpoint.last_timestamp
+
+            # Checkpoint'i olmayan dönemlerde başlangıçta süren durum aralık tablosundan gelir
+            fresh = {
+                (machine_id, kind): state
+                for machine_id, periods in self._machines.items()
+                for kind, state in periods.items()
+                if (machine_id, kind) not in restored
+            }
+            for period_start in {state.start for state in fresh.values()}:
+                intervals = await StateIntervalService.timeline(db, list(self._machines), period_start, period_start)
+                for interval in intervals:
+                    for kind in OEE_PERIODS:
+                        state = fresh.get((interval["machine_id"], kind))
+                        if state is not None and state.start == period_start:
+                            state.carry_in(interval["state"], last_seen=interval["last_seen"])
+                baselines = await OEEService.cycle_baselines(db, list(self._machines), period_start)
+                for (machine_id, kind), state in fresh.items():
+                    if state.start == period_start and machine_id in baselines:
+                        state.carry_in(None, baselines[machine_id])
+
+            since = {
+                machine_id: min(replay_after.get((machine_id, kind), state.start) for kind, state in periods.items())
+                for machine_id, periods in self._machines.items()
+            }
+            if since:
+                rows = await db.stream(select(
+                    MachineData.machine_id, MachineData.timestamp, MachineData.status, MachineData.cycle_count
+                ).where(or_(*(
+                    and_(MachineData.machine_id == machine_id, MachineData.timestamp >= start)
+                    for machine_id, start in since.items()
+                ))).order_by(MachineData.machine_id, MachineData.timestamp))
+                async for machine_id, timestamp, status, cycle_count in rows:
+                    for kind, state in self._machines[machine_id].items():
+                        after = replay_after.get((machine_id, kind))
+                        if state.covers(timestamp) and (after is None or timestamp > after):
+                            state.observe(timestamp, status, cycle_count)
+                    self.stats["replayed"] += 1
+
+            earliest = min((state.start for periods in self._machines.values() for state in periods.values()), default=now)
+            result = await db.execute(select(DowntimeReason.machine_id, DowntimeReason.start_time, DowntimeReason.end_time).where(
+                DowntimeReason.start_time >= earliest
+            ))
+            for machine_id, start_time, end_time in result:
+                self.record_downtime(machine_id, start_time, end_time)
+
+            result = await db.execute(select(
+                ProductionData.machine_id,
+                ProductionData.shift_date,
+                ProductionData.shift_number,
+                func.sum(ProductionData.good_parts),
+                func.sum(ProductionData.defective_parts)
+            ).where(
+                # Önceki güne yazılan gece vardiyası bugünkü dönemle kesişebilir
+                ProductionData.shift_date >= (earliest - timedelta(days=1)).date().isoformat()
+            ).group_by(ProductionData.machine_id, ProductionData.shift_date, ProductionData.shift_number))
+            for row in result:
+                self.record_production(*row)
+
+        self.loaded = True
+        logger.info("OEE state loaded for %d machines (%d samples replayed)", len(self._machines), self.stats["replayed"])
+
+    async def checkpoint(self):
+        """Örneklerden türetilen dönem toplamlarını kaydet"""
+        now = datetime.utcnow()
+        rows = [
+            {
+                "machine_id": machine_id,
+                "period": kind,
+                "period_start": state.start,
+                "running_seconds": state.running_seconds,
+                "cycle_min": state.cycle_min,
+                "cycle_max": state.cycle_max,
+                "last_status": state.last_status,
+                "last_timestamp": state.last_timestamp,
+                "updated_at": now
+            }
+            for machine_id, periods in self._machines.items()
+            if machine_id in self._ideal_cycle_times
+            for kind, state in periods.items()
+        ]
+
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(OEEStateCheckpoint))
+            if rows:
+                await db.execute(insert(OEEStateCheckpoint), rows)
+            await db.commit()
+        self.stats["checkpoints"] += 1
+
+# Global OEE state instance
+oee_state = OEEStateStore()
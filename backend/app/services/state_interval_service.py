@@ -0,0 +1,168 @@
+from sqlalchemy import and_, case, func, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from app.core.config import settings
+from app.models.database import MachineStateInterval
+from app.database.sql_functions import seconds_between
+
+class StateIntervalService:
+    @staticmethod
+    def compact(open_intervals: Dict[int, Dict], rows: Iterable[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """Durum örneklerini makinelerin açık aralıklarına uygula; (güncellenen, yeni) aralıkları döndür"""
+        touched = {}
+        created = []
+        hold = StateIntervalService.hold_limit()
+        for row in sorted(rows, key=lambda row: (row["machine_id"], row["timestamp"])):
+            machine_id, timestamp, state = row["machine_id"], row["timestamp"], row["status"]
+            current = open_intervals.get(machine_id)
+            
+            # Açık aralığın sonundan eski örnekler geç gelmiştir; backfill ile yeniden kurulur
+            if current is not None and timestamp < current["end_time"]:
+                continue
+            
+            if current is not None and timestamp - current["end_time"] > hold:
+                # Veri kesintisi: aralık son örnekte kapanır, durum boşluk boyunca sürmüş sayılmaz
+                current["is_open"] = False
+                if "id" in current:
+                    touched[current["id"]] = current
+            elif current is not None:
+                current["end_time"] = timestamp
+                if "id" in current:
+                    touched[current["id"]] = current
+                if current["state"] == state:
+                    continue
+                current["is_open"] = False
+            
+            current = {"machine_id": machine_id, "state": state, "start_time": timestamp, "end_time": timestamp, "is_open": True}
+            open_intervals[machine_id] = current
+            created.append(current)
+        
+        updated = [
+            {"id": interval["id"], "end_time": interval["end_time"], "is_open": interval["is_open"]}
+            for interval in touched.values()
+        ]
+        return updated, created
+
+    @staticmethod
+    async def apply(db: AsyncSession, rows: List[Dict]) -> int:
+        """Yeni örnekleri aralık tablosuna işle (commit çağıranın transaction'ında)"""
+        machine_ids = {row["machine_id"] for row in rows}
+        if not machine_ids:
+            return 0
+        
+        result = await db.execute(select(
+            MachineStateInterval.id,
+            MachineStateInterval.machine_id,
+            MachineStateInterval.state,
+            MachineStateInterval.start_time,
+            MachineStateInterval.end_time
+        ).where(
+            MachineStateInterval.machine_id.in_(machine_ids),
+            MachineStateInterval.is_open.is_(True)
+        ).order_by(MachineStateInterval.start_time).with_for_update())
+        open_intervals = {
+            row.machine_id: {**row._asdict(), "is_open": True}
+            for row in result
+        }
+        
+        updated, created = StateIntervalService.compact(open_intervals, rows)
+        if updated:
+            await db.execute(update(MachineStateInterval), updated)
+        if created:
+            await db.execute(insert(MachineStateInterval), created)
+        return len(updated) + len(created)
+
+    @staticmethod
+    def hold_limit() -> timedelta:
+        """Bir örneğin geçerli sayıldığı en uzun süre (gateway heartbeat'i + bir örnek aralığı)"""
+        return timedelta(seconds=settings.MACHINE_MAX_SILENCE_SECONDS + settings.MACHINE_SAMPLE_INTERVAL)
+
+    @staticmethod
+    def open_until(end_time: datetime) -> datetime:
+        """Açık aralığın sayıldığı an: pencere sonu, ama en fazla şimdi (gelecek sayılmaz)"""
+        return min(end_time, datetime.utcnow())
+
+    @staticmethod
+    def _still_open(open_until: datetime):
+        # Son örneği hold_limit'ten eski açık aralık kesintidedir; yalnızca son örneğine kadar sayılır
+        return and_(
+            MachineStateInterval.is_open.is_(True),
+            MachineStateInterval.end_time >= open_until - StateIntervalService.hold_limit()
+        )
+
+    @staticmethod
+    def overlapping(start_time: datetime, end_time: datetime):
+        """[start_time, end_time] penceresiyle kesişen aralıklar için filtre"""
+        open_until = StateIntervalService.open_until(end_time)
+        return and_(
+            MachineStateInterval.start_time < end_time,
+            or_(
+                and_(StateIntervalService._still_open(open_until), open_until >= start_time),
+                MachineStateInterval.end_time > start_time
+            )
+        )
+
+    @staticmethod
+    def clipped_seconds(start_time: datetime, end_time: datetime):
+        """Aralığın pencereye düşen saniyesi; süren açık aralık pencere sonuna (en fazla şimdiye) kadar sayılır"""
+        open_until = StateIntervalService.open_until(end_time)
+        clipped_start = case((MachineStateInterval.start_time < start_time, start_time), else_=MachineStateInterval.start_time)
+        clipped_end = case(
+            (StateIntervalService._still_open(open_until), open_until),
+            (MachineStateInterval.end_time > end_time, end_time),
+            else_=MachineStateInterval.end_time
+        )
+        return seconds_between(clipped_start, clipped_end)
+
+    @staticmethod
+    async def state_durations(db: AsyncSession, machine_ids: List[int], start_time: datetime,
+                              end_time: datetime) -> Dict[int, Dict[str, float]]:
+        """Makine ve durum başına pencere içindeki saniye"""
+        result = await db.execute(select(
+            MachineStateInterval.machine_id,
+            MachineStateInterval.state,
+            func.sum(StateIntervalService.clipped_seconds(start_time, end_time))
+        ).where(
+            MachineStateInterval.machine_id.in_(machine_ids),
+            StateIntervalService.overlapping(start_time, end_time)
+        ).group_by(MachineStateInterval.machine_id, MachineStateInterval.state))
+        
+        durations = {}
+        for machine_id, state, seconds in result:
+            durations.setdefault(machine_id, {})[state] = float(seconds or 0)
+        return durations
+
+    @staticmethod
+    async def timeline(db: AsyncSession, machine_ids: List[int], start_time: datetime, end_time: datetime,
+                       state: Optional[str] = None) -> List[Dict]:
+        """Pencereye kırpılmış durum aralıkları, makine ve zamana göre sıralı"""
+        query = select(
+            MachineStateInterval.machine_id,
+            MachineStateInterval.state,
+            MachineStateInterval.start_time,
+            MachineStateInterval.end_time,
+            MachineStateInterval.is_open
+        ).where(
+            MachineStateInterval.machine_id.in_(machine_ids),
+            StateIntervalService.overlapping(start_time, end_time)
+        ).order_by(MachineStateInterval.machine_id, MachineStateInterval.start_time)
+        if state is not None:
+            query = query.where(MachineStateInterval.state == state)
+        
+        result = await db.execute(query)
+        open_until = StateIntervalService.open_until(end_time)
+        hold = StateIntervalService.hold_limit()
+        intervals = []
+        for row in result:
+            # Kesintideki açık aralık son örneğinde biter
+            still_open = row.is_open and row.end_time >= open_until - hold
+            intervals.append({
+                "machine_id": row.machine_id,
+                "state": row.state,
+                "start_time": max(row.start_time, start_time),
+                "end_time": open_until if still_open else min(row.end_time, end_time),
+                "open": still_open,
+                "last_seen": row.end_time
+            })
+        return intervals
@@ -1,66 +1,260 @@
 from fastapi import WebSocket
-from typing import Dict, List
+from typing import Deque, Dict, List, Optional, Tuple, Union
 import json
 import asyncio
+import logging
+from collections import deque
 from datetime import datetime
+from app.core.config import settings
+from app.models.database import SQLALCHEMY_DATABASE_URL
+from app.services.broadcast_service import BROADCAST_BACKENDS, InProcessBroadcast, PostgresBroadcast
+
+logger = logging.getLogger(__name__)
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+# Durum mesajları: yalnızca son değer önemlidir (birleştirilir, hız sınırlanır, delta gönderilebilir).
+# Mesaj tipi -> alanları delta ile karşılaştırılan anahtar. Diğer tipler (anomaly) olaydır, sırayla gider.
+STATE_MESSAGES = {"machine_update": "data", "oee_update": "oee", "fleet_snapshot": "machines"}
+
+# Tüm makinelerin özetini alan abonelerin kanalı (makine kanalları machine_id ile anılır)
+FLEET_CHANNEL = "fleet"
+
+class _Client:
+    """Bağlı istemci: sınırlı olay kuyruğu, tip başına son durum ve bunları gönderen yazıcı görev"""
+    def __init__(self, websocket: WebSocket, machine_id: int, manager: "WebSocketManager",
+                 max_rate: float = 0.0, delta: bool = False):
+        self.websocket = websocket
+        self.machine_id = machine_id
+        self.queue_size = manager.queue_size
+        # Durum tipi başına iki gönderim arası en az süre (0: sınırsız)
+        self.min_interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.delta = delta
+        
+        self.events: Deque[str] = deque()
+        # tip -> (mesaj, ortak kodlanmış metin); yeni durum gelince eskisinin yerine geçer
+        self.latest: Dict[str, Tuple[Dict, str]] = {}
+        self.last_sent_at: Dict[str, float] = {}
+        self.last_payload: Dict[str, Dict] = {}
+        self.wakeup = asyncio.Event()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Süren gönderimin başladığı an; yayıncı takılan istemciyi bununla fark eder
+        self.sending_since: Optional[float] = None
+        self.task = asyncio.create_task(self._write(manager))
+    
+    def offer_event(self, text: str) -> bool:
+        """Olayı beklemeden kuyruğa koy; kuyruk doluysa istemci geride kalmıştır"""
+        if len(self.events) >= self.queue_size:
+            return False
+        self.events.append(text)
+        self.wakeup.set()
+        return True
+    
+    def offer_state(self, kind: str, message: Dict, text: str) -> bool:
+        """Son durumu bırak; gönderilmemiş önceki durum varsa üzerine yazılır. Birleştirildiyse True"""
+        conflated = kind in self.latest
+        self.latest[kind] = (message, text)
+        self.wakeup.set()
+        return conflated
+    
+    async def _write(self, manager: "WebSocketManager"):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                
+                while self.events:
+                    await self._send(self.events.popleft(), manager, loop)
+                
+                next_due = None
+                for kind in list(self.latest):
+                    due = self.last_sent_at.get(kind, float("-inf")) + self.min_interval
+                    if loop.time() < due:
+                        next_due = due if next_due is None else min(next_due, due)
+                        continue
+                    message, text = self.latest.pop(kind)
+                    text = self._encode(kind, message, text)
+                    if text is not None:
+                        await self._send(text, manager, loop)
+                    self.last_sent_at[kind] = loop.time()
+                
+                # Hız sınırında bekleyen durum: süresi gelince yeniden uyan
+                if next_due is not None:
+                    if self._timer is not None:
+                        self._timer.cancel()
+                    self._timer = loop.call_at(next_due, self.wakeup.set)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Bağlantı kopmuş
+            manager.drop(self, "send failed")
+        finally:
+            if self._timer is not None:
+                self._timer.cancel()
+    
+    async def _send(self, text: str, manager: "WebSocketManager", loop: asyncio.AbstractEventLoop):
+        # Gönderim başına wait_for ek bir görev açar; zaman aşımını yayıncı denetler
+        self.sending_since = loop.time()
+        await self.websocket.send_text(text)
+        self.sending_since = None
+        manager.stats["sent"] += 1
+        manager.stats["bytes_sent"] += len(text)
+    
+    def _encode(self, kind: str, message: Dict, text: str) -> Optional[str]:
+        """Delta isteyen istemciye yalnızca son gönderilenden farklı alanlar; değişiklik yoksa None"""
+        if not self.delta:
+            return text
+        key = STATE_MESSAGES[kind]
+        payload = message.get(key) or {}
+        previous = self.last_payload.get(kind)
+        self.last_payload[kind] = payload
+        if previous is None:
+            # İlk mesaj tam gönderilir
+            return text
+        
+        changed = {field: value for field, value in payload.items() if field not in previous or previous[field] != value}
+        changed.update({field: None for field in previous if field not in payload})
+        if not changed:
+            return None
+        return json.dumps({**message, key: changed, "delta": True}, default=_json_default)
 
 class WebSocketManager:
-    def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+    def __init__(self, queue_size: int = settings.WS_CLIENT_QUEUE_SIZE, send_timeout: float = settings.WS_SEND_TIMEOUT):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        # machine_id (ya da FLEET_CHANNEL) -> {websocket: istemci}
+        self.active_connections: Dict[Union[int, str], Dict[WebSocket, _Client]] = {}
         self.machine_data_cache: Dict[int, Dict] = {}
+        self._closing = set()
+        # Mesajları worker'lara dağıtan katman; start() ayarlara göre değiştirir
+        self.backend = InProcessBroadcast(self._deliver)
+        self.stats = {"published": 0, "sent": 0, "bytes_sent": 0, "conflated": 0, "dropped": 0}
+    
+    @property
+    def client_count(self) -> int:
+        return sum(len(clients) for clients in self.active_connections.values())
+    
+    async def start(self, backend: str = settings.WS_BROADCAST_BACKEND):
+        """Yayın katmanını başlat (ingestion'dan önce)"""
+        if backend not in BROADCAST_BACKENDS:
+            raise ValueError(f"Unknown websocket broadcast backend: {backend}")
+        if backend == "postgres":
+            # Aynı veritabanı kullanılır; birden çok uvicorn worker'ı birbirinin güncellemelerini görür
+            self.backend = PostgresBroadcast(self._deliver, SQLALCHEMY_DATABASE_URL)
+        else:
+            self.backend = InProcessBroadcast(self._deliver)
+        await self.backend.start()
     
-    async def connect(self, websocket: WebSocket, machine_id: int):
+    async def stop(self):
+        """Bekleyen yayınları gönder (ingestion durduktan sonra)"""
+        await self.backend.stop()
+    
+    async def connect(self, websocket: WebSocket, machine_id: Union[int, str], max_rate: float = 0.0, delta: bool = False):
+        """max_rate: durum tipi başına saniyede en fazla mesaj (0: sınırsız), delta: yalnızca değişen alanlar"""
         await websocket.accept()
-        if machine_id not in self.active_connections:
-            self.active_connections[machine_id] = []
-        self.active_connections[machine_id].append(websocket)
-    
-    def disconnect(self, websocket: WebSocket, machine_id: int):
-        if machine_id in self.active_connections:
-            self.active_connections[machine_id].remove(websocket)
-            if not self.active_connections[machine_id]:
+        client = _Client(websocket, machine_id, self, max_rate=max_rate, delta=delta)
+        self.active_connections.setdefault(machine_id, {})[websocket] = client
+    
+    def disconnect(self, websocket: WebSocket, machine_id: Union[int, str]):
+        clients = self.active_connections.get(machine_id)
+        client = clients.pop(websocket, None) if clients is not None else None
+        if client is not None:
+            if client.task is not asyncio.current_task():
+                client.task.cancel()
+            if not clients:
                 del self.active_connections[machine_id]
+        return client
+    
+    def drop(self, client: _Client, reason: str):
+        """Geride kalan ya da yazılamayan istemciyi ayır; diğer istemciler beklemez"""
+        if self.disconnect(client.websocket, client.machine_id) is None:
+            return
+        self.stats["dropped"] += 1
+        logger.info("Dropping websocket client of machine %s: %s", client.machine_id, reason)
+        # Kapanış çerçevesi de takılabilir; arka planda, süre sınırıyla
+        task = asyncio.ensure_future(self._close(client.websocket))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+    
+    async def _close(self, websocket: WebSocket):
+        try:
+            await asyncio.wait_for(websocket.close(code=1013), self.send_timeout)
+        except Exception:
+            pass
+    
+    def _publish(self, message: Dict):
+        """Mesajı bir kez kodla ve yayın katmanına ver (diğer worker'ların istemcileri de alır)"""
+        self.backend.publish(message, json.dumps(message, default=_json_default))
+    
+    def _deliver(self, message: Dict, text: Optional[str], remote: bool) -> int:
+        """Makineyi bu worker'da izleyen her istemcinin kuyruğuna bırak"""
+        if remote and message["type"] == "machine_update":
+            # Başka worker'ın ingestion'ı: yerel önbellek de güncel kalsın
+            self.update_machine_cache(message["machine_id"], message["data"])
+        
+        return self._fan_out(message["machine_id"], message, text)
+    
+    def _fan_out(self, channel: Union[int, str], message: Dict, text: Optional[str]) -> int:
+        clients = self.active_connections.get(channel)
+        if not clients:
+            return 0
+        
+        if text is None:
+            text = json.dumps(message, default=_json_default)
+        self.stats["published"] += 1
+        kind = message["type"]
+        stalled_before = asyncio.get_running_loop().time() - self.send_timeout
+        for client in list(clients.values()):
+            if client.sending_since is not None and client.sending_since < stalled_before:
+                self.drop(client, "send timed out")
+            elif kind in STATE_MESSAGES:
+                # Geride kalan istemci ayrılmaz, yalnızca en son durumu alır
+                if client.offer_state(kind, message, text):
+                    self.stats["conflated"] += 1
+            elif not client.offer_event(text):
+                self.drop(client, "outbound queue full")
+        return len(clients)
     
     async def broadcast_machine_update(self, machine_id: int, data: Dict):
         """Makine verilerini tüm bağlı istemcilere gönder"""
-        if machine_id in self.active_connections:
-            message = {
-                "type": "machine_update",
-                "machine_id": machine_id,
-                "data": data,
-                "timestamp": datetime.now().isoformat()
-            }
-            
-            disconnected = []
-            for connection in self.active_connections[machine_id]:
-                try:
-                    await connection.send_json(message)
-                except:
-                    disconnected.append(connection)
-            
-            # Bağlantısı kopanları temizle
-            for connection in disconnected:
-                self.disconnect(connection, machine_id)
+        self.publish_machine_update(machine_id, data)
+    
+    def publish_machine_update(self, machine_id: int, data: Dict):
+        """broadcast_machine_update'in beklemeyen hali (ingestion flush'ından çağrılır)"""
+        self._publish({
+            "type": "machine_update",
+            "machine_id": machine_id,
+            "data": data,
+            "timestamp": datetime.now().isoformat()
+        })
     
     async def broadcast_oee_update(self, machine_id: int, oee_data: Dict):
         """OEE verilerini gönder"""
-        if machine_id in self.active_connections:
-            message = {
-                "type": "oee_update",
-                "machine_id": machine_id,
-                "oee": oee_data,
+        self._publish({
+            "type": "oee_update",
+            "machine_id": machine_id,
+            "oee": oee_data,
+            "timestamp": datetime.now().isoformat()
+        })
+    
+    async def broadcast_anomalies(self, anomalies: List[Dict]):
+        """Ingestion'da tespit edilen anomalileri makineyi izleyen istemcilere gönder"""
+        for anomaly in anomalies:
+            self._publish({
+                "type": "anomaly",
+                "machine_id": anomaly["machine_id"],
+                "anomaly": {key: value for key, value in anomaly.items() if key != "machine_id"},
                 "timestamp": datetime.now().isoformat()
-            }
-            
-            disconnected = []
-            for connection in self.active_connections[machine_id]:
-                try:
-                    await connection.send_json(message)
-                except:
-                    disconnected.append(connection)
-            
-            for connection in disconnected:
-                self.disconnect(connection, machine_id)
+            })
+    
+    def publish_fleet_snapshot(self, snapshot: Dict) -> int:
+        """Filo anlık görüntüsünü bir kez kodla ve bu worker'ın filo abonelerine bırak"""
+        # Her worker kendi (tüm filoyu içeren) önbelleğinden üretir; yayın katmanına verilmez
+        return self._fan_out(FLEET_CHANNEL, {"type": "fleet_snapshot", **snapshot}, None)
     
     def update_machine_cache(self, machine_id: int, data: Dict):
         """Makine verilerini önbellekte güncelle"""
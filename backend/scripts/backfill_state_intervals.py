@@ -0,0 +1,99 @@
+"""machine_state_intervals tablosunu mevcut machine_data satırlarından yeniden kur
+
+Her makinenin aralıkları silinip örnekler zaman sırasıyla okunarak yeniden
+oluşturulur (makine başına tek transaction). Canlı ingestion ile aynı kural
+uygulanır: iki örnek arasındaki boşluk hold_limit'i aşarsa aralık son örnekte
+kapanır ve sonraki örnekten yeni aralık başlar. Canlı ingestion aynı makineye
+yazarken çalıştırılmamalıdır.
+
+Kullanım (backend dizininden):
+    python -m scripts.backfill_state_intervals
+    python -m scripts.backfill_state_intervals --machine-id 3 --chunk-size 50000
+"""
+import argparse
+import os
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="rebuild machine_state_intervals from machine_data")
+    parser.add_argument("--database-url", default=None, help="defaults to DATABASE_URL")
+    parser.add_argument("--machine-id", type=int, action="append", help="repeatable; default: all machines")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    return parser.parse_args()
+
+
+def backfill(db, machine_ids=None, chunk_size: int = 50000) -> dict:
+    """Verilen makinelerin aralıklarını yeniden kur; makine başına (örnek, aralık) sayısı döndür"""
+    from sqlalchemy import insert
+    from app.models.database import MachineData, MachineStateInterval
+    from app.services.state_interval_service import StateIntervalService
+
+    if machine_ids is None:
+        machine_ids = [machine_id for (machine_id,) in db.query(MachineData.machine_id).distinct()]
+
+    counts = {}
+    for machine_id in machine_ids:
+        db.query(MachineStateInterval).filter(MachineStateInterval.machine_id == machine_id).delete()
+
+        open_intervals, pending = {}, []
+        samples = intervals = 0
+        chunk = []
+
+        def flush():
+            nonlocal pending, intervals
+            _, created = StateIntervalService.compact(open_intervals, chunk)
+            pending += created
+            # Kapanan aralıklar yazılır; açık olan sonraki parçada uzayabilir
+            closed = [interval for interval in pending if not interval["is_open"]]
+            if closed:
+                db.execute(insert(MachineStateInterval), closed)
+                intervals += len(closed)
+            pending = [interval for interval in pending if interval["is_open"]]
+            chunk.clear()
+
+        query = db.query(MachineData.timestamp, MachineData.status).filter(
+            MachineData.machine_id == machine_id,
+            MachineData.timestamp.isnot(None)
+        ).order_by(MachineData.timestamp, MachineData.id).yield_per(chunk_size)
+
+        for timestamp, status in query:
+            chunk.append({"machine_id": machine_id, "timestamp": timestamp, "status": status})
+            samples += 1
+            if len(chunk) >= chunk_size:
+                flush()
+        flush()
+
+        if pending:
+            db.execute(insert(MachineStateInterval), pending)
+            intervals += len(pending)
+        db.commit()
+        counts[machine_id] = (samples, intervals)
+
+    return counts
+
+
+def main():
+    args = parse_args()
+    if args.database_url:
+        # app modülleri engine'i import sırasında DATABASE_URL'den kurar
+        os.environ["DATABASE_URL"] = args.database_url
+
+    from app.models.database import Base, engine, SessionLocal
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        counts = backfill(db, args.machine_id, args.chunk_size)
+    finally:
+        db.close()
+
+    for machine_id, (samples, intervals) in sorted(counts.items()):
+        ratio = samples / intervals if intervals else 0
+        print(f"machine {machine_id}: {samples} samples -> {intervals} intervals ({ratio:.0f}x)")
+    print(f"done in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""WebSocket yayın benchmark'ı: istemci başına sıralı send_json vs. tek kodlama + kuyruklu yazıcılar
+
+Gerçek ağ yerine sahte WebSocket nesneleri kullanılır. Sağlıklı istemcilerin
+gönderimi bir event loop turu sürer; "yavaş" istemciler her gönderimde
+--slow-latency kadar bekler (takılmış tablet). Ölçülenler: yayıncının
+bloklandığı süre, sağlıklı istemcilere teslim gecikmesi (teslim edilen
+örneğin yayın anından itibaren) ve istemci başına mesaj/bayt. "limited"
+koşusunda istemciler --max-rate ve --delta ile abone olur.
+
+Kullanım (backend dizininden):
+    python -m scripts.bench_websocket_broadcast
+    python -m scripts.bench_websocket_broadcast --subscribers 1000 --messages 50 --slow 5
+    python -m scripts.bench_websocket_broadcast --messages 200 --interval 0.05 --max-rate 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from datetime import datetime
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="websocket broadcast benchmark")
+    parser.add_argument("--subscribers", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.01, help="seconds between broadcasts")
+    parser.add_argument("--slow", type=int, default=5, help="subscribers that stall on every send")
+    parser.add_argument("--slow-latency", type=float, default=0.05, help="seconds per send for slow subscribers")
+    parser.add_argument("--max-rate", type=float, default=4.0, help="updates/s per subscriber in the limited run")
+    parser.add_argument("--no-delta", dest="delta", action="store_false", help="send full messages in the limited run")
+    return parser.parse_args()
+
+
+class FakeWebSocket:
+    """send_json/send_text çağrılarını sayan, gecikmesi ayarlanabilen sahte bağlantı"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        # (zaman, metin); mesajlar ölçüm sonrası çözülür
+        self.received = []
+
+    async def accept(self):
+        pass
+
+    async def close(self, code: int = 1000):
+        pass
+
+    async def send_text(self, text: str):
+        await asyncio.sleep(self.latency)
+        self.received.append((time.perf_counter(), text))
+
+    async def send_json(self, data):
+        # Starlette send_json her çağrıda yeniden kodlar
+        await self.send_text(json.dumps(data, separators=(",", ":")))
+
+
+FIRST_CYCLE = 10000
+
+def machine_update(index: int):
+    return {
+        "machine_id": 1,
+        "status": "running",
+        "current_consumption": 12.5 + index % 7,
+        "temperature": 61.2,
+        "pressure": 4.1,
+        "cycle_count": FIRST_CYCLE + index,
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+
+
+async def legacy_broadcast(connections, data):
+    """Önceki WebSocketManager.broadcast_machine_update: sırayla, istemci başına kodlama"""
+    message = {"type": "machine_update", "machine_id": 1, "data": data, "timestamp": datetime.now().isoformat()}
+    for connection in connections:
+        await connection.send_json(message)
+
+
+def delivery_stats(sockets, published_at):
+    """(mesaj, bayt, p50 ms, p99 ms); gecikme teslim edilen örneğin yayınından itibaren ölçülür"""
+    delays, delivered, sent_bytes = [], 0, 0
+    for websocket in sockets:
+        for received, text in websocket.received:
+            # Delta mesajlarında da cycle_count her örnekte değiştiği için bulunur
+            index = json.loads(text)["data"]["cycle_count"] - FIRST_CYCLE
+            delays.append(received - published_at[index])
+            delivered += 1
+            sent_bytes += len(text)
+    if not delays:
+        return delivered, sent_bytes, 0.0, 0.0
+    delays.sort()
+    return delivered, sent_bytes, statistics.median(delays) * 1000, delays[int(len(delays) * 0.99) - 1] * 1000
+
+
+async def run_legacy(args):
+    healthy = [FakeWebSocket() for _ in range(args.subscribers - args.slow)]
+    slow = [FakeWebSocket(args.slow_latency) for _ in range(args.slow)]
+    # Yavaş istemciler listenin başında: arkasındakiler her mesajda onları bekler
+    connections = slow + healthy
+
+    published_at, blocked = [], 0.0
+    started = time.perf_counter()
+    for index in range(args.messages):
+        published_at.append(time.perf_counter())
+        await legacy_broadcast(connections, machine_update(index))
+        blocked += time.perf_counter() - published_at[-1]
+        await asyncio.sleep(args.interval)
+    elapsed = time.perf_counter() - started
+    return elapsed, blocked, delivery_stats(healthy, published_at), 0
+
+
+async def run_queued(args, max_rate: float = 0.0, delta: bool = False):
+    from app.services.websocket_service import WebSocketManager
+
+    manager = WebSocketManager(queue_size=max(args.messages // 4, 1), send_timeout=args.slow_latency * 10)
+    healthy = [FakeWebSocket() for _ in range(args.subscribers - args.slow)]
+    slow = [FakeWebSocket(args.slow_latency) for _ in range(args.slow)]
+    for websocket in slow + healthy:
+        await manager.connect(websocket, 1, max_rate=max_rate, delta=delta)
+
+    published_at, blocked = [], 0.0
+    started = time.perf_counter()
+    for index in range(args.messages):
+        published_at.append(time.perf_counter())
+        await manager.broadcast_machine_update(1, machine_update(index))
+        blocked += time.perf_counter() - published_at[-1]
+        await asyncio.sleep(args.interval)
+
+    # Sağlıklı istemcilerin son durumu alıp boşalmasını bekle (birleştirilen örnekler hiç gönderilmez)
+    healthy_sockets = set(healthy)
+    while any(
+        client.latest or client.events or client.sending_since is not None
+        for client in manager.active_connections.get(1, {}).values()
+        if client.websocket in healthy_sockets
+    ):
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - started
+
+    for websocket in list(manager.active_connections.get(1, {})):
+        manager.disconnect(websocket, 1)
+    return elapsed, blocked, delivery_stats(healthy, published_at), manager.stats["dropped"]
+
+
+def report(name, result, args):
+    elapsed, blocked, (delivered, sent_bytes, p50, p99), dropped = result
+    healthy = args.subscribers - args.slow
+    print(f"{name:<8} total {elapsed:7.2f} s  publisher blocked {blocked * 1000:9.1f} ms  "
+          f"per healthy client {delivered / healthy:6.1f} msgs {sent_bytes / healthy / 1024:7.1f} KB  "
+          f"p50 {p50:8.1f} ms  p99 {p99:8.1f} ms  dropped {dropped}")
+
+
+def main():
+    args = parse_args()
+    # WebSocketManager ayarları settings'ten okur; veritabanı kullanılmaz
+    os.environ.setdefault("DATABASE_URL", "sqlite:///./bench_websocket.db")
+
+    print(f"subscribers   : {args.subscribers} ({args.slow} slow, {args.slow_latency * 1000:.0f} ms per send)")
+    print(f"messages      : {args.messages} every {args.interval * 1000:.0f} ms")
+    report("legacy", asyncio.run(run_legacy(args)), args)
+    report("queued", asyncio.run(run_queued(args)), args)
+    report("limited", asyncio.run(run_queued(args, max_rate=args.max_rate, delta=args.delta)), args)
+
+
+if __name__ == "__main__":
+    main()
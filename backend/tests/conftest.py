@@ -0,0 +1,21 @@
+import os
+import tempfile
+
+# Uygulama modülleri ayarları ve engine'i import sırasında kurar: ortam önce hazırlanır
+_database = os.path.join(tempfile.mkdtemp(prefix="factory-tests-"), "test.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_database}")
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("HOT_STORE_ENABLED", "False")
+os.environ.setdefault("ANOMALY_DETECTION_ENABLED", "False")
+
+import pytest  # noqa: E402
+from app.models.database import Base, engine  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def database():
+    """Her test boş tablolarla başlar"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
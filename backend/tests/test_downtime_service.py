@@ -0,0 +1,68 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from app.models.database import AsyncSessionLocal, DowntimeReason, Machine
+from app.services.ingestion_service import IngestionBuffer
+
+RUN_START = datetime(2026, 10, 10, 8, 0, 0)
+AFTER_GAP = datetime(2026, 10, 12, 8, 0, 0)
+
+
+def _samples(status, start, count):
+    return [
+        {"machine_id": 1, "status": status, "timestamp": start + timedelta(seconds=index)}
+        for index in range(count)
+    ]
+
+
+def _batches(rows, size):
+    return [rows[index:index + size] for index in range(0, len(rows), size)]
+
+
+async def _ingest(batches):
+    # Ingestion ile aynı sıra: tespit, ardından yazma ve durum aralıkları
+    async with AsyncSessionLocal() as db:
+        db.add(Machine(id=1, name="Pres", type="press", ideal_cycle_time=2.0))
+        await db.commit()
+    records = []
+    for batch in batches:
+        await IngestionBuffer._write(batch)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(DowntimeReason.start_time).order_by(DowntimeReason.start_time))
+            records.append(list(result.scalars()))
+    return records
+
+
+@pytest.mark.parametrize("batch_size", [70, 10])
+def test_downtime_after_data_gap_starts_at_first_sample(batch_size):
+    stopped = _samples("stopped", AFTER_GAP, 70)
+    batches = [_samples("running", RUN_START, 600)] + _batches(stopped, batch_size)
+
+    records = asyncio.run(_ingest(batches))
+
+    # Bekleme süresi boşluktan sonraki ilk örnekten sayılır
+    if batch_size == 10:
+        assert records[1] == [] and records[2] == []
+    assert records[-1] == [AFTER_GAP]
+
+
+def test_downtime_before_gap_is_not_joined_to_later_stop():
+    before = _samples("stopped", RUN_START + timedelta(seconds=600), 30)
+    after = _samples("stopped", AFTER_GAP, 70)
+    batches = [_samples("running", RUN_START, 600)] + _batches(before, 10) + _batches(after, 10)
+
+    records = asyncio.run(_ingest(batches))
+
+    assert records[-1] == [AFTER_GAP]
+
+
+def test_contiguous_stop_starts_when_machine_left_running():
+    stopped = _samples("stopped", RUN_START + timedelta(seconds=600), 70)
+    batches = [_samples("running", RUN_START, 600)] + _batches(stopped, 10)
+
+    records = asyncio.run(_ingest(batches))
+
+    assert records[-1] == [RUN_START + timedelta(seconds=600)]
@@ -0,0 +1,47 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.database import AsyncSessionLocal, Machine
+from app.services.data_service import DataService
+from app.services.fleet_service import FleetSnapshotService
+from app.services.oee_service import OEEService
+from app.services.oee_state_service import OEEStateStore, oee_state
+from app.services.websocket_service import websocket_manager
+
+
+def test_shift_oee_comes_from_database_not_worker_state(monkeypatch):
+    now = datetime.utcnow()
+    shift_start, _ = OEEStateStore.current_window("shift", now)
+    # Bu worker'ın artımlı durumu yok (başka worker ingest ediyor)
+    monkeypatch.setattr(oee_state, "loaded", False)
+    monkeypatch.setattr(websocket_manager, "machine_data_cache", {1: {"status": "running"}})
+
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            db.add(Machine(id=1, name="Pres", type="press", ideal_cycle_time=2.0))
+            await db.flush()
+            await DataService.bulk_insert_machine_data(db, [
+                {"machine_id": 1, "status": "running", "cycle_count": index * 3,
+                 "timestamp": shift_start + timedelta(seconds=index * 10)}
+                for index in range(int((now - shift_start).total_seconds() // 10) + 1)
+            ])
+        service = FleetSnapshotService()
+        await service.refresh_oee(now)
+        async with AsyncSessionLocal() as db:
+            expected = await OEEService.calculate_oee(db, 1, shift_start, now)
+        return service.build(now), expected
+
+    snapshot, expected = asyncio.run(scenario())
+    assert snapshot["machines"][1]["oee"] == pytest.approx(round(expected["oee"], 3))
+
+
+def test_previous_shift_oee_is_not_shown_after_shift_change(monkeypatch):
+    monkeypatch.setattr(websocket_manager, "machine_data_cache", {1: {"status": "running"}})
+    now = datetime.utcnow()
+    service = FleetSnapshotService()
+    service._shift_oee, service._oee_period = {1: 0.5}, OEEStateStore.current_window("shift", now)[0]
+
+    assert service.build(now)["machines"][1]["oee"] == 0.5
+    assert service.build(now + timedelta(hours=24))["machines"][1]["oee"] is None
@@ -0,0 +1,47 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from app.models.database import AsyncSessionLocal, Machine
+from app.services.data_service import DataService
+from app.services.hot_store_service import HOT_COLUMNS, _MachineBuffer, _ROW_BYTES, allocated_rows, hot_store
+
+
+def test_buffer_keeps_latest_rows_within_allocation():
+    buffer = _MachineBuffer(capacity=8, covered_from=0.0)
+    for index in range(100):
+        buffer.append(float(index), 0, [float(index)] * len(HOT_COLUMNS))
+
+    window = buffer.slice(0.0, 1000.0)
+    assert window["timestamp"].tolist() == [float(index) for index in range(92, 100)]
+    assert buffer.covered_from > 91.0
+    assert buffer.nbytes == allocated_rows(8) * _ROW_BYTES < 2 * 8 * _ROW_BYTES
+
+
+def test_hot_window_matches_database_types():
+    end_time = datetime.utcnow()
+    start_time = end_time - timedelta(minutes=5)
+
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            db.add(Machine(id=1, name="Pres", type="press", ideal_cycle_time=2.0))
+            await db.flush()
+            await DataService.bulk_insert_machine_data(db, [
+                {"machine_id": 1, "status": "running", "current_consumption": 10.5, "cycle_count": 123 + index,
+                 "timestamp": start_time + timedelta(seconds=index)}
+                for index in range(60)
+            ])
+        async with AsyncSessionLocal() as db:
+            database_rows = await DataService.get_machine_data_window(db, 1, start_time, end_time)
+            await hot_store.load()
+            try:
+                hot_rows = await DataService.get_machine_data_window(db, 1, start_time, end_time)
+                hits = hot_store.stats["hits"]
+            finally:
+                hot_store._buffers.clear()
+                hot_store.loaded = False
+        return database_rows, hot_rows, hits
+
+    database_rows, hot_rows, hits = asyncio.run(scenario())
+    assert hits >= 1
+    assert [row["cycle_count"] for row in hot_rows] == [row["cycle_count"] for row in database_rows]
+    assert all(type(row["cycle_count"]) is int for row in hot_rows)
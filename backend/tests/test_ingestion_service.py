@@ -0,0 +1,66 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from app.services import ingestion_service
+from app.services.ingestion_service import IngestionBuffer
+
+
+def _rows(count, start=datetime(2026, 1, 1)):
+    return [
+        {"machine_id": 1, "status": "running", "current_consumption": 10.0, "cycle_count": index,
+         "timestamp": start + timedelta(seconds=index)}
+        for index in range(count)
+    ]
+
+
+def test_failing_post_write_step_does_not_stop_flusher(monkeypatch):
+    def broken(rows):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(ingestion_service.oee_state, "observe", broken)
+
+    async def scenario():
+        buffer = IngestionBuffer(batch_size=10, flush_interval=0.01, ack_mode="flush")
+        await buffer.start()
+        try:
+            # Yazma başarılı: istekler hata sonrası işlemlere rağmen yanıtlanır ve görev yaşamaya devam eder
+            first = await asyncio.wait_for(buffer.enqueue(_rows(5)), 5)
+            second = await asyncio.wait_for(buffer.enqueue(_rows(5, datetime(2026, 1, 2))), 5)
+            assert not buffer._task.done()
+            return first, second, dict(buffer.stats)
+        finally:
+            await buffer.stop()
+
+    first, second, stats = asyncio.run(scenario())
+    assert (first, second) == (5, 5)
+    assert stats["flushed"] == 10
+    assert stats["hook_errors"] >= 2
+
+
+def test_flusher_survives_unexpected_flush_error(monkeypatch):
+    calls = []
+
+    async def scenario():
+        buffer = IngestionBuffer(batch_size=10, flush_interval=0.01, ack_mode="flush")
+        original = buffer._flush
+
+        async def flaky(batch):
+            calls.append(len(batch))
+            if len(calls) == 1:
+                raise RuntimeError("boom")
+            await original(batch)
+
+        monkeypatch.setattr(buffer, "_flush", flaky)
+        await buffer.start()
+        try:
+            try:
+                await asyncio.wait_for(buffer.enqueue(_rows(3)), 5)
+            except ingestion_service.IngestionError:
+                pass
+            else:
+                raise AssertionError("first batch should fail")
+            return await asyncio.wait_for(buffer.enqueue(_rows(3, datetime(2026, 1, 2))), 5)
+        finally:
+            await buffer.stop()
+
+    assert asyncio.run(scenario()) == 3
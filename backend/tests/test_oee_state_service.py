@@ -0,0 +1,72 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from app.models.database import AsyncSessionLocal, Machine, ProductionData
+from app.services.data_service import DataService
+from app.services.oee_service import OEEService
+from app.services.oee_state_service import OEEStateStore
+
+
+async def _seed(now):
+    shift_start, _ = OEEStateStore.current_window("shift", now)
+    shift_date, shift_number = OEEService._shift_of(shift_start)
+    async with AsyncSessionLocal() as db:
+        db.add(Machine(id=1, name="Pres", type="press", ideal_cycle_time=2.0))
+        await db.flush()
+        samples = int((now - shift_start).total_seconds() // 10)
+        await DataService.bulk_insert_machine_data(db, [
+            {"machine_id": 1, "status": "running", "cycle_count": index * 4,
+             "timestamp": shift_start + timedelta(seconds=index * 10)}
+            for index in range(samples + 1)
+        ])
+        # Aynı gün iki vardiya: içinde bulunulan 90/10, diğeri 10/90
+        db.add(ProductionData(machine_id=1, shift_date=shift_date, shift_number=shift_number,
+                              good_parts=90, defective_parts=10, target_count=100))
+        db.add(ProductionData(machine_id=1, shift_date=shift_date, shift_number=shift_number % 3 + 1,
+                              good_parts=10, defective_parts=90, target_count=100))
+        await db.commit()
+
+
+async def _fallback(period, now):
+    start_time, end_time = OEEStateStore.current_window(period, now)
+    async with AsyncSessionLocal() as db:
+        return await OEEService.calculate_oee(db, 1, start_time, end_time)
+
+
+@pytest.mark.parametrize("period", ["shift", "today"])
+def test_snapshot_matches_fallback_on_multi_shift_production(period):
+    async def scenario():
+        await _seed(datetime.utcnow())
+        store = OEEStateStore()
+        await store.load()
+        now = datetime.utcnow()
+        return store.snapshot(1, period, now), await _fallback(period, now)
+
+    snapshot, fallback = asyncio.run(scenario())
+    assert snapshot["quality"] == pytest.approx(fallback["quality"])
+    assert snapshot["performance"] == pytest.approx(fallback["performance"])
+    if period == "shift":
+        assert snapshot["quality"] == pytest.approx(0.9)
+
+
+def test_refresh_machines_picks_up_new_machines_and_cycle_times():
+    async def scenario():
+        await _seed(datetime.utcnow())
+        store = OEEStateStore()
+        await store.load()
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(Machine).where(Machine.id == 1).values(ideal_cycle_time=4.0))
+            db.add(Machine(id=2, name="Kaynak", type="welding", ideal_cycle_time=1.5))
+            await db.commit()
+        assert store.snapshot(2, "shift") is None
+
+        await store.refresh_machines()
+        now = datetime.utcnow()
+        return store.snapshot(1, "shift", now), store.snapshot(2, "shift", now), await _fallback("shift", now)
+
+    first, second, fallback = asyncio.run(scenario())
+    assert second is not None
+    assert first["performance"] == pytest.approx(fallback["performance"])
@@ -1,6 +1,5 @@
 import time
-import requests
-import json
+import threading
 import board
 import busio
 import adafruit_ads1x15.ads1115 as ADS
@@ -10,88 +9,172 @@ from sensors.current_sensor import CurrentSensor
 from sensors.proximity_sensor import ProximitySensor
 from sensors.temperature_sensor import TemperatureSensor
 from utils.config_reader import ConfigReader
+from utils.sample_queue import SampleQueue
+from utils.uploader import Uploader
+from utils.scheduler import FixedRateScheduler
+from utils.deadband import DeadbandFilter, SPAN_FIELDS
 
 class IoTGateway:
     def __init__(self):
         self.config = ConfigReader().load_config()
         self.setup_sensors()
-        self.cycle_count = 0
-        self.last_cycle_time = time.time()
+        self.last_stroke_time = None
         
+        # Örnekleme ağ ve diski beklemez: örnekler sınırlı bir kuyrukla gönderici iş parçacığına geçer,
+        # gönderici önce diske yazar, kesinti bitince toplu olarak aktarır
+        self.queue = SampleQueue(self.config['queue_path'], self.config['queue_max_rows'])
+        self.uploader = Uploader(
+            self.queue,
+            self.config['api_url'],
+            batch_size=self.config['upload_batch_size'],
+            timeout=self.config['timeout'],
+            retry_delay=self.config['retry_delay'],
+            max_retries=self.config['max_retries'],
+            buffer_size=self.config['sample_buffer_size'],
+            compress=self.config['compress_uploads']
+        )
+        self.scheduler = FixedRateScheduler(self.config['update_interval'])
+        self.deadband = self.setup_deadband()
+    
     def setup_sensors(self):
         # I2C bağlantısı
         self.i2c = busio.I2C(board.SCL, board.SDA)
         self.ads = ADS.ADS1115(self.i2c)
         
         # Sensörleri başlat
-        self.current_sensor = CurrentSensor(self.ads, ADS.P0)
-        self.temperature_sensor = TemperatureSensor(self.ads, ADS.P1)
-        self.proximity_sensor = ProximitySensor(pin=17)
-        
+        # Sürekli modda akım yüksek hızda okunur, sıcaklık (yavaş değişir) aralık başına bir kez;
+        # tek ADC paylaşıldığı için I2C erişimi ortak kilitle sıralanır
+        self.adc_lock = threading.Lock()
+        current = self.config['sensors'].get('current', {})
+        self.current_sensor = CurrentSensor(
+            self.ads, ADS.P0,
+            mode=current.get('mode', 'single'),
+            data_rate=current.get('data_rate', 860),
+            lock=self.adc_lock
+        )
+        self.temperature_sensor = TemperatureSensor(self.ads, ADS.P1, lock=self.adc_lock)
+        proximity = self.config['sensors'].get('proximity', {})
+        self.proximity_sensor = ProximitySensor(
+            pin=proximity.get('pin', 17),
+            pull_up=proximity.get('pull_up', False),
+            edge=proximity.get('edge', 'rising'),
+            debounce_ms=proximity.get('debounce_ms', 20),
+            buffer_size=proximity.get('buffer_size', 1024)
+        )
+    
+    def setup_deadband(self):
+        """İstisna ile raporlama filtresi; kapalıysa her örnek gönderilir"""
+        report = self.config.get('report_by_exception', {})
+        if not report.get('enabled', False):
+            return None
+        # Sinyal için sessizlik süresi verilmemişse heartbeat aralığı kullanılır
+        max_silence = self.config['heartbeat_interval'] if self.config['enable_heartbeat'] else float('inf')
+        return DeadbandFilter(report.get('signals', {}), max_silence=max_silence, span_fields=SPAN_FIELDS)
+    
     def read_sensors(self):
         """Tüm sensörlerden veri oku"""
+        strokes = self.proximity_sensor.read_strokes()
+        cycle_times = self._cycle_times(strokes)
+        current = self.current_sensor.read_summary()
         return {
-            'current': self.current_sensor.read(),
+            'current': current['mean'],
+            'current_summary': current,
             'temperature': self.temperature_sensor.read(),
-            'cycle_detected': self.proximity_sensor.detect_cycle(),
-            'cycle_time': self._calculate_cycle_time()
+            'cycle_detected': bool(strokes),
+            'cycle_count': self.proximity_sensor.get_cycle_count(),
+            # Aralıktaki vuruşların ortalama çevrim süresi
+            'cycle_time': sum(cycle_times) / len(cycle_times) if cycle_times else None
         }
     
-    def _calculate_cycle_time(self):
-        """Çevrim süresini hesapla"""
-        if self.proximity_sensor.detect_cycle():
-            current_time = time.time()
-            cycle_time = current_time - self.last_cycle_time
-            self.last_cycle_time = current_time
-            self.cycle_count += 1
-            return cycle_time
-        return None
+    def _cycle_times(self, strokes):
+        """Ardışık vuruşlar arası süreler (ilk vuruş bir önceki aralığın son vuruşuna göre)"""
+        cycle_times = []
+        for stroke_time in strokes:
+            if self.last_stroke_time is not None:
+                cycle_times.append(stroke_time - self.last_stroke_time)
+            self.last_stroke_time = stroke_time
+        return cycle_times
     
     def send_data(self, machine_id, sensor_data):
-        """Veriyi API'ye gönder"""
+        """Veriyi gönderim kuyruğuna ekle (ağ beklenmez)"""
         payload = {
             "machine_id": machine_id,
-            "current_consumption": sensor_data['current'],
-            "temperature": sensor_data['temperature'],
-            "cycle_count": self.cycle_count,
-            "cycle_time": sensor_data['cycle_time'],
+            # Aralık ortalaması; backend enerjiyi current_charge'dan (yoksa ortalama × süre) hesaplar
+            "current_consumption": round(sensor_data['current'], 3),
+            "current_min": round(sensor_data['current_summary']['min'], 3),
+            "current_max": round(sensor_data['current_summary']['max'], 3),
+            "current_rms": round(sensor_data['current_summary']['rms'], 3),
+            "current_charge": round(sensor_data['current_summary']['charge'], 2),
+            "temperature": round(sensor_data['temperature'], 2),
+            "cycle_count": sensor_data['cycle_count'],
+            "cycle_time": None if sensor_data['cycle_time'] is None else round(sensor_data['cycle_time'], 3),
             "status": "running" if sensor_data['current'] > 4.0 else "stopped",
-            "timestamp": time.time()
+            "timestamp": round(time.time(), 3)
         }
         
-        try:
-            response = requests.post(
-                f"{self.config['api_url']}/api/machines/{machine_id}/data",
-                json=payload,
-                timeout=2
+        if self.deadband is not None:
+            # Değer ölü bant içindeyse gönderilmez; backend son değeri sonraki örneğe kadar geçerli sayar
+            payload = self.deadband.offer(payload)
+            if payload is None:
+                return
+        self.submit(payload)
+    
+    def submit(self, payload):
+        if not self.uploader.submit(payload):
+            print("✗ Gönderim kuyruğu dolu, örnek atlandı")
+    
+    def report_stats(self):
+        """Döngü gecikmesi ve kuyruk derinliği"""
+        jitter = self.scheduler.jitter_report()
+        in_memory, on_disk = self.uploader.depth()
+        print(
+            f"Döngü: {jitter['ticks']} tetik, gecikme p50 {jitter['p50_ms']:.1f} ms "
+            f"p99 {jitter['p99_ms']:.1f} ms en fazla {jitter['max_ms']:.1f} ms, atlanan {self.scheduler.skipped} | "
+            f"Kuyruk: bellek {in_memory}, disk {on_disk}, düşen {self.uploader.dropped + self.queue.dropped} | "
+            f"Gönderim: {self.uploader.bytes_sent / max(self.uploader.sent, 1):.0f} bayt/örnek"
+        )
+        if self.deadband is not None:
+            stats = self.deadband.stats
+            print(
+                f"İstisna ile raporlama: {stats['sent']}/{stats['offered']} örnek gönderildi "
+                f"(durum {stats['status']}, ölü bant {stats['deadband']}, sessizlik {stats['silence']})"
             )
-            
-            if response.status_code == 200:
-                print(f"✓ Veri gönderildi: {payload}")
-            else:
-                print(f"✗ Gönderme hatası: {response.status_code}")
-                
-        except requests.exceptions.RequestException as e:
-            print(f"✗ Ağ hatası: {e}")
-        except Exception as e:
-            print(f"✗ Beklenmeyen hata: {e}")
     
     def run(self):
         """Ana çalıştırma döngüsü"""
         machine_id = self.config['machine_id']
         
         print(f"IoT Gateway başlatıldı. Makine ID: {machine_id}")
+        if len(self.queue):
+            print(f"Kuyrukta gönderilmemiş {len(self.queue)} örnek var")
         print("Veri gönderimi başlıyor...")
+        self.uploader.start()
+        self.current_sensor.start()
         
+        next_report = time.monotonic() + self.config['stats_interval']
         try:
             while True:
+                # Sabit hızlı tetik: okuma süresi periyoda eklenmez
+                self.scheduler.wait()
                 sensor_data = self.read_sensors()
                 self.send_data(machine_id, sensor_data)
-                time.sleep(self.config['update_interval'])
                 
+                if time.monotonic() >= next_report:
+                    self.report_stats()
+                    next_report += self.config['stats_interval']
+        
         except KeyboardInterrupt:
             print("\nGateway durduruluyor...")
         finally:
+            self.current_sensor.stop()
+            # Son durum kaybolmasın: ölü bant içinde bekleyen son örnek de gönderilir
+            if self.deadband is not None:
+                pending = self.deadband.flush()
+                if pending is not None:
+                    self.submit(pending)
+            # Gönderilemeyenler diskte kalır, sonraki açılışta gönderilir
+            self.uploader.stop(timeout=self.config['timeout'])
+            self.queue.close()
             GPIO.cleanup()
 
 if __name__ == "__main__":
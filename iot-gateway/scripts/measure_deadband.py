@@ -0,0 +1,189 @@
+"""İstisna ile raporlamanın (ölü bant) gönderim oranını ve gönderilen baytları kayıtlı bir örnek izi üzerinde ölç
+
+İz, gateway'in send_data ile kuyruğa koyduğu yükleri (her aralıkta bir satır) içeren CSV'dir;
+.gz uzantılıysa gzip ile açılır. Her satır DeadbandFilter'dan geçirilir ve sonuçlar:
+  - gönderilen örnek oranı ve gönderim sebepleri,
+  - Uploader.send_batch ile aynı şekilde kodlanan toplu gövdelerin ham JSON ve gzip boyutları,
+  - backend'in son gönderilen değeri bir sonraki örneğe kadar taşımasıyla oluşan en büyük hata
+olarak, filtresiz gönderimle karşılaştırılır. Ölü bantlar alanın birimindedir (current_consumption amper).
+
+Depodaki iz (scripts/traces/press_simulated_4h.csv.gz) bir makineden kaydedilmemiştir: --generate ile
+sabit tohumdan üretilen benzetilmiş bir pres izidir (1 s aralık, çalışma/duruş dönemleri, vuruşlar).
+Gerçek bir ölçüm için gateway'in yüklerini aynı kolonlarla kaydedip --trace ile verin.
+
+Kullanım (iot-gateway dizininden):
+    python -m scripts.measure_deadband
+    python -m scripts.measure_deadband --trace kayit.csv.gz --config gateway_config.json
+    python -m scripts.measure_deadband --generate scripts/traces/press_simulated_4h.csv.gz --hours 4 --seed 1
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import random
+from datetime import datetime
+
+from utils.deadband import DeadbandFilter, SPAN_FIELDS
+
+DEFAULT_TRACE = os.path.join(os.path.dirname(__file__), 'traces', 'press_simulated_4h.csv.gz')
+# send_data'daki yük alanları
+FIELDS = ('machine_id', 'current_consumption', 'current_min', 'current_max', 'current_rms', 'current_charge',
+          'temperature', 'cycle_count', 'cycle_time', 'status', 'timestamp')
+INTEGER_FIELDS = ('machine_id', 'cycle_count')
+TEXT_FIELDS = ('status',)
+UNITS = {'current_consumption': 'A', 'temperature': '°C', 'cycle_count': 'vuruş'}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='measure report-by-exception savings on a recorded sample trace')
+    parser.add_argument('--trace', default=DEFAULT_TRACE)
+    parser.add_argument('--config', default='gateway_config.json')
+    parser.add_argument('--generate', metavar='PATH', help='write a simulated trace to PATH and exit')
+    parser.add_argument('--hours', type=float, default=4)
+    parser.add_argument('--seed', type=int, default=1)
+    return parser.parse_args()
+
+
+def simulate(hours, seed):
+    """Benzetilmiş pres: 30-90 dk çalışma (~5.5 s çevrim), 5-20 dk duruş, yavaş ısınan gövde"""
+    rnd = random.Random(seed)
+    origin = (datetime(2026, 1, 5, 6, 0) - datetime(1970, 1, 1)).total_seconds()
+    temperature, count, running = 35.0, 1000, True
+    until, next_stroke, last_stroke = rnd.uniform(1800, 5400), 5.5, None
+    samples = []
+    for second in range(int(hours * 3600)):
+        if second >= until:
+            running = not running
+            until = second + (rnd.uniform(1800, 5400) if running else rnd.uniform(300, 1200))
+        strokes = []
+        if running:
+            while next_stroke <= second + 1:
+                strokes.append(next_stroke)
+                next_stroke += rnd.gauss(5.5, 0.2)
+            # Vuruş olan aralıkta ortalama akım yükselir
+            current = 11.0 + rnd.gauss(0, 0.05) + 0.6 * len(strokes)
+            temperature += (70 - temperature) / 1800 + rnd.gauss(0, 0.02)
+        else:
+            next_stroke = second + 1 + 5.5
+            current = 2.4 + rnd.gauss(0, 0.02)
+            temperature += (35 - temperature) / 2400 + rnd.gauss(0, 0.02)
+        cycle_times = []
+        for stroke in strokes:
+            if last_stroke is not None:
+                cycle_times.append(stroke - last_stroke)
+            last_stroke = stroke
+        count += len(strokes)
+        samples.append({
+            'machine_id': 1,
+            'current_consumption': round(current, 3),
+            'current_min': round(current - 0.3, 3),
+            'current_max': round(current + 2.0, 3),
+            'current_rms': round(current * 1.02, 3),
+            'current_charge': round(current, 2),
+            'temperature': round(temperature, 2),
+            'cycle_count': count,
+            'cycle_time': round(sum(cycle_times) / len(cycle_times), 3) if cycle_times else None,
+            'status': 'running' if current > 4.0 else 'stopped',
+            'timestamp': round(origin + second, 3)
+        })
+    return samples
+
+
+def write_trace(path, samples):
+    text = io.StringIO()
+    writer = csv.DictWriter(text, fieldnames=FIELDS, lineterminator='\n')
+    writer.writeheader()
+    writer.writerows(samples)
+    data = text.getvalue().encode()
+    if path.endswith('.gz'):
+        # mtime=0: aynı tohum aynı dosyayı üretir
+        data = gzip.compress(data, mtime=0)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def read_trace(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', newline='') as f:
+        return [
+            {
+                name: (value if name in TEXT_FIELDS else None if value == ''
+                       else int(value) if name in INTEGER_FIELDS else float(value))
+                for name, value in row.items()
+            }
+            for row in csv.DictReader(f)
+        ]
+
+
+def replay(samples, signals, max_silence):
+    """Örnekleri zaman damgalarıyla filtreden geçir (kapanıştaki flush dahil)"""
+    deadband = DeadbandFilter(signals, max_silence=max_silence, span_fields=SPAN_FIELDS)
+    sent = [sample for sample in (deadband.offer(sample, now=sample['timestamp']) for sample in samples) if sample is not None]
+    pending = deadband.flush(now=samples[-1]['timestamp'] if samples else None)
+    if pending is not None:
+        sent.append(pending)
+    return sent, deadband.stats
+
+
+def upload_bytes(samples, batch_size):
+    """Uploader.send_batch ile aynı gövdeler: (istek sayısı, ham JSON bayt, gzip bayt)"""
+    requests, raw, compressed = 0, 0, 0
+    for start in range(0, len(samples), batch_size):
+        body = json.dumps({'records': samples[start:start + batch_size]}, separators=(',', ':')).encode()
+        requests += 1
+        raw += len(body)
+        compressed += len(gzip.compress(body))
+    return requests, raw, compressed
+
+
+def carried_error(samples, sent, signals):
+    """Backend gönderilmeyen aralıkta son gönderilen değeri kullanır; sinyal başına en büyük fark"""
+    errors = {name: 0.0 for name in signals}
+    position = 0
+    for sample in samples:
+        while position + 1 < len(sent) and sent[position + 1]['timestamp'] <= sample['timestamp']:
+            position += 1
+        for name in signals:
+            value, carried = sample.get(name), sent[position].get(name)
+            if value is not None and carried is not None:
+                errors[name] = max(errors[name], abs(value - carried))
+    return errors
+
+
+def main():
+    args = parse_args()
+    if args.generate:
+        samples = simulate(args.hours, args.seed)
+        write_trace(args.generate, samples)
+        print(f'{len(samples)} örnek yazıldı: {args.generate}')
+        return
+
+    with open(args.config) as f:
+        config = json.load(f)
+    report = config.get('report_by_exception', {})
+    signals = report.get('signals', {})
+    # main.py ile aynı: sinyale sessizlik süresi verilmemişse heartbeat aralığı
+    max_silence = config.get('heartbeat_interval', 60) if config.get('enable_heartbeat', True) else float('inf')
+    batch_size = config.get('upload_batch_size', 500)
+
+    samples = read_trace(args.trace)
+    sent, stats = replay(samples, signals, max_silence)
+
+    print(f'iz: {args.trace} ({len(samples)} örnek)')
+    print('ölü bantlar: ' + ', '.join(
+        f"{name} {signal.get('deadband', 0)} {UNITS.get(name, '')}".rstrip() for name, signal in signals.items()
+    ))
+    print(f"gönderilen: {len(sent)} / {len(samples)} ({len(sent) / len(samples):.1%}); "
+          f"ilk {stats['first']}, durum {stats['status']}, ölü bant {stats['deadband']}, sessizlik {stats['silence']}")
+    for label, rows in (('filtresiz', samples), ('ölü bant', sent)):
+        requests, raw, compressed = upload_bytes(rows, batch_size)
+        print(f'{label:>10}: {requests} istek, JSON {raw} B, gzip {compressed} B ({compressed / len(samples):.1f} B/örnek)')
+    print('taşınan değerin en büyük hatası: ' + ', '.join(
+        f'{name} {error:.3f} {UNITS.get(name, "")}'.rstrip() for name, error in carried_error(samples, sent, signals).items()
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,127 @@
+import math
+import threading
+import time
+from adafruit_ads1x15.ads1x15 import Mode
+from adafruit_ads1x15.analog_in import AnalogIn
+
+class SignalSummary:
+    """Bir gönderim aralığındaki örneklerin özeti; yük (A·s) yamuk kuralıyla toplanır"""
+    
+    def __init__(self, last_time=None, last_value=None):
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.charge = 0.0
+        # Önceki aralığın son örneği: aralık sınırındaki yük de sayılır
+        self.last_time = last_time
+        self.last_value = last_value
+    
+    def add(self, timestamp, value):
+        self.count += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.total += value
+        self.total_sq += value * value
+        if self.last_time is not None:
+            self.charge += (value + self.last_value) / 2 * (timestamp - self.last_time)
+        self.last_time = timestamp
+        self.last_value = value
+    
+    def result(self):
+        if not self.count:
+            return None
+        return {
+            'min': self.min,
+            'max': self.max,
+            'mean': self.total / self.count,
+            'rms': math.sqrt(self.total_sq / self.count),
+            'charge': self.charge,
+            'samples': self.count
+        }
+
 class CurrentSensor:
-    def __init__(self, ads, channel):
+    """4-20mA akım sensörü; 'continuous' modda ADC sürekli okunur, aralık başına özet döner"""
+    
+    def __init__(self, ads, channel, mode='single', data_rate=860, lock=None):
+        self.ads = ads
         self.channel = AnalogIn(ads, channel)
+        self.mode = mode
+        self.data_rate = data_rate
+        # ADS1115 tek dönüştürücüdür; diğer kanalları okuyanlarla I2C erişimi paylaşılır
+        self.lock = lock or threading.Lock()
+        
+        self._summary = SignalSummary()
+        self._summary_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._last_summary_time = time.monotonic()
     
-    def read(self):
+    @staticmethod
+    def to_current(voltage):
         # 4-20mA → 1-5V dönüşümü
-        voltage = self.channel.voltage
         current = (voltage - 1) * 25  # 1V = 4mA, 5V = 20mA
         return max(0, min(current, 20))  # Sınırları koru
+    
+    def read(self):
+        with self.lock:
+            voltage = self.channel.voltage
+        return self.to_current(voltage)
+    
+    def start(self):
+        """Sürekli modda örnekleme iş parçacığını başlat"""
+        if self.mode != 'continuous' or self._thread is not None:
+            return
+        with self.lock:
+            self.ads.data_rate = self.data_rate
+            self.ads.mode = Mode.CONTINUOUS
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+        with self.lock:
+            self.ads.mode = Mode.SINGLE
+    
+    def _sample(self):
+        # Aynı dönüşümü iki kez okumamak için veri hızında okunur; geride kalınırsa beklenmez
+        period = 1.0 / self.data_rate
+        next_time = time.monotonic()
+        while not self._stopping.is_set():
+            value = self.read()
+            now = time.monotonic()
+            with self._summary_lock:
+                self._summary.add(now, value)
+            
+            next_time += period
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_time = time.monotonic()
+    
+    def read_summary(self):
+        """Son çağrıdan beri min, max, ortalama, RMS, yük (A·s) ve örnek sayısı"""
+        if self.mode != 'continuous':
+            # Tek dönüşüm: değer aralık boyunca sabit kabul edilir
+            now = time.monotonic()
+            value = self.read()
+            summary = {'min': value, 'max': value, 'mean': value, 'rms': value,
+                       'charge': value * (now - self._last_summary_time), 'samples': 1}
+            self._last_summary_time = now
+            return summary
+        
+        with self._summary_lock:
+            summary = self._summary
+            self._summary = SignalSummary(summary.last_time, summary.last_value)
+        result = summary.result()
+        if result is None:
+            # Aralıkta dönüşüm okunamadı (I2C meşgul); anlık değer kullanılır
+            value = self.read()
+            result = {'min': value, 'max': value, 'mean': value, 'rms': value, 'charge': 0.0, 'samples': 0}
+        return result
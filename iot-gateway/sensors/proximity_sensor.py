@@ -2,34 +2,57 @@ import RPi.GPIO as GPIO
 import time
 
 class ProximitySensor:
-    def __init__(self, pin=17):
+    """Kenar kesmesiyle çevrim sayımı; vuruş zamanları kilitsiz halka tamponda tutulur"""
+    
+    def __init__(self, pin=17, pull_up=False, edge='rising', debounce_ms=20, buffer_size=1024):
         self.pin = pin
+        self.pull_up = pull_up
+        self.edge = GPIO.FALLING if edge == 'falling' else GPIO.RISING
+        self.debounce_ms = debounce_ms
+        
+        # Tek yazan (GPIO olay iş parçacığı) / tek okuyan (gateway döngüsü): yazan önce yuvayı doldurur,
+        # sonra sayacı artırır; okuyan sayacı bir kez okur. GIL altında kilit gerekmez.
+        self._ring = [0.0] * buffer_size
+        self._written = 0
+        self._read = 0
+        self._count_offset = 0
+        self.lost = 0  # okunmadan üzerine yazılan zaman damgaları (sayım yine doğru)
         self.setup()
     
     def setup(self):
         GPIO.setmode(GPIO.BCM)
-        GPIO.setup(self.pin, GPIO.IN)
-        self.last_state = GPIO.input(self.pin)
-        self.cycle_count = 0
+        GPIO.setup(self.pin, GPIO.IN, pull_up_down=GPIO.PUD_UP if self.pull_up else GPIO.PUD_OFF)
+        # Sıçrama (bounce) filtresi RPi.GPIO'nun C iş parçacığında uygulanır; Python'a yalnızca geçerli vuruş gelir
+        GPIO.add_event_detect(self.pin, self.edge, callback=self._on_edge, bouncetime=self.debounce_ms)
     
-    def detect_cycle(self):
-        """Çevrim tespiti yap"""
-        current_state = GPIO.input(self.pin)
-        
-        # Yükselen kenar tespiti (0 -> 1)
-        if self.last_state == 0 and current_state == 1:
-            self.cycle_count += 1
-            self.last_state = current_state
-            return True
-        
-        self.last_state = current_state
-        return False
+    def _on_edge(self, channel):
+        """GPIO olay iş parçacığında, her vuruşta bir kez"""
+        self._ring[self._written % len(self._ring)] = time.monotonic()
+        self._written += 1
+    
+    def read_strokes(self):
+        """Son okumadan beri gelen vuruşların zamanları (time.monotonic), eskiden yeniye"""
+        written = self._written
+        size = len(self._ring)
+        start = max(self._read, written - size)
+        self.lost += start - self._read
+        strokes = [self._ring[index % size] for index in range(start, written)]
+        # Kopyalarken yazan tamponu turladıysa üzerine yazılmış en eski yuvalar atılır
+        overwritten = self._written - size - start
+        if overwritten > 0:
+            strokes = strokes[overwritten:]
+            self.lost += overwritten
+        self._read = written
+        return strokes
     
     def get_cycle_count(self):
-        return self.cycle_count
+        """Başlangıçtan (ya da sıfırlamadan) beri kesin vuruş sayısı"""
+        return self._written - self._count_offset
     
     def reset_cycle_count(self):
-        self.cycle_count = 0
+        # Sayaç yalnızca kesme tarafında yazılır; sıfırlama bir ofsetle yapılır
+        self._count_offset = self._written
     
     def cleanup(self):
+        GPIO.remove_event_detect(self.pin)
         GPIO.cleanup()
@@ -1,9 +1,12 @@
+import threading
 import adafruit_ads1x15.ads1115 as ADS
 from adafruit_ads1x15.analog_in import AnalogIn
 
 class TemperatureSensor:
-    def __init__(self, ads, channel):
+    def __init__(self, ads, channel, lock=None):
         self.channel = AnalogIn(ads, channel)
+        # Akım sensörü ADC'yi sürekli modda okurken I2C erişimi sıralanır
+        self.lock = lock or threading.Lock()
         # PT100 sensörü için kalibrasyon değerleri
         self.calibration = {
             'min_voltage': 0.5,  # 0°C
@@ -14,7 +17,8 @@ class TemperatureSensor:
     
     def read(self):
         """Sıcaklık değerini oku ve dönüştür"""
-        voltage = self.channel.voltage
+        with self.lock:
+            voltage = self.channel.voltage
         
         # Voltajı sıcaklığa dönüştür (lineer interpolasyon)
         voltage_range = self.calibration['max_voltage'] - self.calibration['min_voltage']
@@ -29,4 +33,5 @@ class TemperatureSensor:
     
     def read_raw(self):
         """Ham voltaj değerini oku"""
-        return self.channel.voltage
+        with self.lock:
+            return self.channel.voltage
@@ -16,7 +16,20 @@ class ConfigReader:
             },
             'log_level': 'INFO',
             'max_retries': 3,
-            'retry_delay': 5  # seconds
+            'retry_delay': 5,  # seconds
+            'timeout': 10,  # seconds
+            'queue_path': 'gateway_queue.db',
+            'queue_max_rows': 500000,  # ~5.8 days at 1 sample/s
+            'upload_batch_size': 500,
+            'compress_uploads': False,  # gzip batch bodies; the backend must accept Content-Encoding: gzip
+            'sample_buffer_size': 1000,  # samples between sampling loop and uploader
+            'stats_interval': 60,  # seconds between jitter/queue depth reports
+            'enable_heartbeat': True,
+            'heartbeat_interval': 60,  # seconds; default max_silence for report-by-exception signals
+            # Report-by-exception: send only when a signal leaves its deadband, status changes or max_silence elapses.
+            # Deadbands are absolute and in the field's unit: current_consumption in amps (A), temperature in °C,
+            # cycle_count in strokes; e.g. {'current_consumption': {'deadband': 0.2, 'max_silence': 60}} is 0.2 A
+            'report_by_exception': {'enabled': False, 'signals': {}}
         }
     
     def load_config(self) -> Dict[str, Any]:
@@ -0,0 +1,105 @@
+import math
+import time
+
+# Gönderilmeyen aralıkların özetleri bir sonraki gönderimde birleştirilir
+SPAN_FIELDS = {
+    'current_min': 'min',
+    'current_max': 'max',
+    'current_rms': 'rms',
+    'current_charge': 'sum',
+    'cycle_time': 'mean'
+}
+
+class DeadbandFilter:
+    """İstisna ile raporlama: örnek yalnızca bir sinyal ölü bandını aşınca, durum değişince ya da sessizlik süresi dolunca gönderilir"""
+    
+    def __init__(self, signals, max_silence=60, span_fields=None):
+        # signals: {alan: {'deadband': son gönderilene göre mutlak fark, 'max_silence': saniye}}
+        # Ölü bant alanın kendi birimindedir: current_consumption amper (A), temperature °C, cycle_count vuruş
+        self.signals = {
+            name: (float(signal.get('deadband', 0.0)), float(signal.get('max_silence', max_silence)))
+            for name, signal in signals.items()
+        }
+        # Backend satırın tamamını sakladığı için her gönderim tüm sinyalleri tazeler;
+        # en kısa sessizlik süresi geçerlidir
+        self.max_silence = min((silence for _, silence in self.signals.values()), default=float(max_silence))
+        # Aralık özetleri (min/max/yük...) gönderilmeyen aralıklar boyunca birleştirilir: {alan: 'min'|'max'|'sum'|'mean'|'rms'}
+        self.span_fields = span_fields or {}
+        
+        self._sent = None  # son gönderilen örnek (backend bu değerleri bir sonrakine kadar geçerli sayar)
+        self._sent_at = None
+        self._pending = None  # gönderilmemiş son örnek
+        self._span = {}
+        self.stats = {'offered': 0, 'sent': 0, 'first': 0, 'status': 0, 'deadband': 0, 'silence': 0}
+    
+    def offer(self, sample, now=None):
+        """Gönderilecekse (özetleri birleştirilmiş) örneği, değilse None döndür"""
+        now = time.monotonic() if now is None else now
+        self.stats['offered'] += 1
+        self._accumulate(sample)
+        
+        reason = self._reason(sample, now)
+        if reason is None:
+            self._pending = sample
+            return None
+        self.stats[reason] += 1
+        return self._emit(sample, now)
+    
+    def flush(self, now=None):
+        """Kapanışta: gönderilmemiş son örnek (yoksa None)"""
+        if self._pending is None:
+            return None
+        return self._emit(self._pending, time.monotonic() if now is None else now)
+    
+    def _reason(self, sample, now):
+        if self._sent is None:
+            return 'first'
+        if sample.get('status') != self._sent.get('status'):
+            return 'status'
+        for name, (deadband, _) in self.signals.items():
+            value, last = sample.get(name), self._sent.get(name)
+            if value is None or last is None:
+                if value is not last:
+                    return 'deadband'
+            elif abs(value - last) > deadband:
+                return 'deadband'
+        if now - self._sent_at >= self.max_silence:
+            return 'silence'
+        return None
+    
+    def _emit(self, sample, now):
+        sample = {**sample, **self._span_values()}
+        self._sent, self._sent_at = sample, now
+        self._pending = None
+        self._span = {}
+        self.stats['sent'] += 1
+        return sample
+    
+    def _accumulate(self, sample):
+        for name, method in self.span_fields.items():
+            value = sample.get(name)
+            if value is None:
+                continue
+            if method == 'rms':
+                value = value * value
+            total, count = self._span.get(name, (None, 0))
+            if total is None:
+                total = value
+            elif method == 'min':
+                total = min(total, value)
+            elif method == 'max':
+                total = max(total, value)
+            else:
+                total += value
+            self._span[name] = (total, count + 1)
+    
+    def _span_values(self):
+        values = {}
+        for name, (total, count) in self._span.items():
+            method = self.span_fields[name]
+            if method == 'mean':
+                total = total / count
+            elif method == 'rms':
+                total = math.sqrt(total / count)
+            values[name] = round(total, 3)
+        return values
@@ -0,0 +1,65 @@
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, List, Tuple
+
+class SampleQueue:
+    """Gönderilmemiş örnekler için kalıcı kuyruk (SQLite, WAL); ağ kesintisinde veri kaybolmaz"""
+    
+    def __init__(self, path='gateway_queue.db', max_rows=500000):
+        self.path = path
+        self.max_rows = max_rows
+        self.dropped = 0  # kapasite dolduğu için silinen en eski örnekler
+        self.lock = threading.Lock()
+        
+        # Sensör döngüsü yazar, gönderici okur/siler; erişim kilitle sıralanır
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        # WAL + NORMAL: her yazmada fsync yok, elektrik kesintisinde en fazla son işlemler kaybolur
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS samples (id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL)'
+            )
+        self._count = self.conn.execute('SELECT COUNT(*) FROM samples').fetchone()[0]
+    
+    def __len__(self):
+        return self._count
+    
+    def put(self, samples: List[Dict[str, Any]]):
+        """Örnekleri kuyruğun sonuna ekle; kapasite aşılırsa en eskiler silinir"""
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'INSERT INTO samples (payload) VALUES (?)',
+                [(json.dumps(sample),) for sample in samples]
+            )
+            self._count += len(samples)
+            
+            overflow = self._count - self.max_rows
+            if overflow > 0:
+                self.conn.execute(
+                    'DELETE FROM samples WHERE id IN (SELECT id FROM samples ORDER BY id LIMIT ?)',
+                    (overflow,)
+                )
+                self._count -= overflow
+                self.dropped += overflow
+    
+    def peek(self, limit: int) -> Tuple[int, List[Dict[str, Any]]]:
+        """En eski en fazla limit örnek ve sonuncusunun id'si (kuyruktan silmez)"""
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT id, payload FROM samples ORDER BY id LIMIT ?', (limit,)
+            ).fetchall()
+        if not rows:
+            return 0, []
+        return rows[-1][0], [json.loads(payload) for _, payload in rows]
+    
+    def remove_through(self, last_id: int):
+        """Gönderimi onaylanan örnekleri sil"""
+        with self.lock, self.conn:
+            cursor = self.conn.execute('DELETE FROM samples WHERE id <= ?', (last_id,))
+            self._count -= cursor.rowcount
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
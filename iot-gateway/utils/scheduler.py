@@ -0,0 +1,42 @@
+import time
+from typing import Dict
+
+class FixedRateScheduler:
+    """Sabit aralıklı tetikleme; hedef zamanlar başlangıca göre hesaplanır, gecikmeler birikmez"""
+    
+    def __init__(self, interval):
+        self.interval = interval
+        self.skipped = 0  # döngü bir periyottan fazla geride kaldığı için atlanan tetikler
+        self._next = None
+        self._lateness = []  # son rapordan beri tetik başına gecikme (saniye)
+    
+    def wait(self):
+        """Sonraki tetik zamanına kadar uyu"""
+        now = time.monotonic()
+        if self._next is None:
+            self._next = now
+        else:
+            self._next += self.interval
+            # Okuma/yazma bir periyottan uzun sürdüyse kaçırılan tetikler telafi edilmez
+            missed = int((now - self._next) // self.interval)
+            if missed > 0:
+                self.skipped += missed
+                self._next += missed * self.interval
+        
+        delay = self._next - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._lateness.append(time.monotonic() - self._next)
+    
+    def jitter_report(self) -> Dict[str, float]:
+        """Son rapordan beri tetik gecikmesi (ms): p50, p99, en büyük; sayaçlar sıfırlanır"""
+        lateness = sorted(self._lateness)
+        self._lateness = []
+        if not lateness:
+            return {'ticks': 0, 'p50_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+        return {
+            'ticks': len(lateness),
+            'p50_ms': lateness[len(lateness) // 2] * 1000,
+            'p99_ms': lateness[min(int(len(lateness) * 0.99), len(lateness) - 1)] * 1000,
+            'max_ms': lateness[-1] * 1000
+        }
@@ -0,0 +1,131 @@
+import gzip
+import json
+import queue
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+class Uploader(threading.Thread):
+    """Örnekleri örnekleme döngüsünden alıp diske yazan ve toplu olarak backend'e gönderen iş parçacığı"""
+    
+    def __init__(self, store, api_url, batch_size=500, timeout=10, retry_delay=5, max_retries=3,
+                 buffer_size=1000, compress=False):
+        super().__init__(daemon=True)
+        self.store = store
+        self.url = f"{api_url}/api/machines/data/batch"
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.max_retries = max_retries
+        # gzip: tekrarlayan alan adları ve yakın değerler nedeniyle toplu gövde birkaç kat küçülür
+        self.compress = compress
+        
+        # Örnekleme ile gönderim arasındaki sınırlı kuyruk; doluysa örnekleme beklemez, örnek düşer
+        self.inbox = queue.Queue(maxsize=buffer_size)
+        # Tek keep-alive bağlantı; her toplu gönderimde yeniden TCP bağlantısı kurulmaz
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        
+        self.stopping = threading.Event()
+        self.failures = 0  # art arda başarısız gönderim
+        self.sent = 0
+        self.rejected = 0
+        self.dropped = 0  # bellek kuyruğu dolu olduğu için alınamayan örnekler
+        self.bytes_sent = 0  # kabul edilen gövdelerin (sıkıştırılmış) toplam boyutu
+    
+    def submit(self, sample):
+        """Örnekleme döngüsünden çağrılır; hiçbir zaman bloklamaz"""
+        try:
+            self.inbox.put_nowait(sample)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+    
+    def depth(self):
+        """(bellek kuyruğu, diskte bekleyen) örnek sayısı"""
+        return self.inbox.qsize(), len(self.store)
+    
+    def stop(self, timeout=None):
+        self.stopping.set()
+        self.join(timeout)
+    
+    def backoff_delay(self):
+        """retry_delay, 2x, 4x ... en fazla max_retries kez ikiye katlanır; örnekler yine de silinmez"""
+        return self.retry_delay * 2 ** min(self.failures - 1, self.max_retries)
+    
+    def persist(self, timeout=0.0):
+        """Bellek kuyruğundakileri tek işlemde diske yaz; boşsa timeout kadar yenisini bekle"""
+        try:
+            samples = [self.inbox.get(timeout=timeout) if timeout > 0 else self.inbox.get_nowait()]
+        except queue.Empty:
+            return 0
+        while True:
+            try:
+                samples.append(self.inbox.get_nowait())
+            except queue.Empty:
+                break
+        self.store.put(samples)
+        return len(samples)
+    
+    def run(self):
+        try:
+            while not self.stopping.is_set():
+                self.persist()
+                last_id, samples = self.store.peek(self.batch_size)
+                if not samples:
+                    # Yeni örnek gelene kadar bekle (durdurma isteği en geç 1 sn'de fark edilir)
+                    self.persist(timeout=1.0)
+                    continue
+                
+                # Birikmiş kuyruk beklemeden art arda gönderilir (kesinti sonrası hızlı telafi)
+                if self.send_batch(samples):
+                    self.store.remove_through(last_id)
+                    self.failures = 0
+                else:
+                    self.failures += 1
+                    delay = self.backoff_delay()
+                    print(f"✗ {len(self.store)} örnek kuyrukta, {delay} sn sonra yeniden denenecek")
+                    self.wait_and_persist(delay)
+        finally:
+            # Gönderilemeyenler diskte kalır, sonraki açılışta gönderilir
+            self.persist()
+            self.session.close()
+    
+    def wait_and_persist(self, seconds):
+        """Geri çekilme süresince de gelen örnekleri diske yaz (bellek kuyruğu taşmasın)"""
+        deadline = time.monotonic() + seconds
+        while not self.stopping.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self.persist(timeout=min(remaining, 1.0))
+    
+    def send_batch(self, samples):
+        """True: örnekler kuyruktan silinebilir (kabul edildi ya da kalıcı olarak reddedildi)"""
+        body = json.dumps({"records": samples}, separators=(",", ":")).encode()
+        headers = {"Content-Type": "application/json"}
+        if self.compress:
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+        try:
+            response = self.session.post(self.url, data=body, headers=headers, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            print(f"✗ Ağ hatası: {e}")
+            return False
+        
+        if response.status_code == 200:
+            self.sent += len(samples)
+            self.bytes_sent += len(body)
+            print(f"✓ {len(samples)} örnek gönderildi ({len(self.store) - len(samples)} kuyrukta)")
+            return True
+        if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+            # Backend bu örnekleri hiçbir zaman kabul etmeyecek; kuyruğu tıkamasın
+            self.rejected += len(samples)
+            print(f"✗ {len(samples)} örnek reddedildi: {response.status_code} {response.text[:200]}")
+            return True
+        
+        print(f"✗ Gönderme hatası: {response.status_code}")
+        return False